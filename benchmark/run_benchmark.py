@@ -0,0 +1,161 @@
+"""
+Benchmark the ingest, link and search paths against a local stub provider.
+
+    python -m benchmark.run_benchmark --sizes 1000,10000 --latency 0.05 --rate-limit 0.02 --output bench.json
+    python -m benchmark.run_benchmark --sizes 1000 --baseline bench.json
+
+For every size a synthetic citation graph is generated, a stub Semantic
+Scholar/OpenAlex server replays it and a folder with one PDF per library paper
+is registered into an empty library. Each scenario then runs in its own
+process and reports throughput, p50/p99 latency and peak RSS; the JSON report
+can be compared with a previous one through --baseline.
+"""
+import os, sys, json, time, argparse, platform, tempfile, shutil, subprocess
+import multiprocessing
+BASEFOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASEFOLDER not in sys.path:
+    sys.path.insert(0, BASEFOLDER)
+from benchmark.stub_provider import SyntheticPaperGraph, StubProviderServer
+from benchmark.synthetic_library import CreatePdfFolder
+from benchmark.scenarios import SCENARIOS, API_ENDPOINTS, RunScenario
+
+def ApiRequests(graph:SyntheticPaperGraph, count:int, batch:int=20) -> dict:
+    """Request bodies for the search endpoints, mixing library papers (cache hits) with outside ones."""
+    papers = [(graph.library[i * 7919 % len(graph.library)] if i % 2 == 0 else i * 104729 % graph.size) for i in range(count)]
+    return {
+        'api_paper_ids': [{'paperIds': [graph.ArxivId(graph.library[(i * batch + j) % len(graph.library)]) for j in range(batch)]} for i in range(count)],
+        'api_doi': [{'doi': graph.Doi(paper), 'file_path': f"{graph.ArxivId(paper)}.pdf"} for paper in papers],
+        'api_title': [{'title': graph.Title(paper), 'file_path': f"{graph.ArxivId(paper)}.pdf"} for paper in papers],
+        'api_arxiv_id': [{'paper_id': graph.ArxivId(paper), 'file_path': f"{graph.ArxivId(paper)}.pdf"} for paper in papers],
+    }
+
+def GitRevision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASEFOLDER, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def RunSize(size:int, args, scenarios:list) -> dict:
+    start = time.perf_counter()
+    graph = SyntheticPaperGraph(size, external_ratio=args.external_ratio, references=args.references, seed=args.seed)
+    graph_elapsed = time.perf_counter() - start
+    stub = StubProviderServer(graph, latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, seed=args.seed).Start()
+    os.environ['SEMANTIC_SCHOLAR_BASE_URL'] = stub.url
+    os.environ['OPENALEX_BASE_URL'] = stub.url
+    workdir = os.path.join(args.workdir, f"library-{size}")
+    os.makedirs(workdir, exist_ok=True)
+    start = time.perf_counter()
+    CreatePdfFolder(graph, os.path.join(workdir, 'inbox'), args.pdf_size)
+    folder_elapsed = time.perf_counter() - start
+    context = {
+        'workdir': workdir,
+        'inbox': os.path.join(workdir, 'inbox'),
+        'library': os.path.join(workdir, 'library'),
+        'provider': args.provider,
+        'client_rate': args.client_rate,
+        'sample': args.sample,
+        'repeat': args.repeat,
+        'concurrency': args.concurrency,
+        'api_requests': ApiRequests(graph, args.requests) if any(name in API_ENDPOINTS for name in scenarios) else {},
+    }
+    os.makedirs(context['library'], exist_ok=True)
+    results = dict()
+    try:
+        with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            for name in scenarios:
+                before = stub.Stats()
+                try:
+                    results[name] = pool.apply(RunScenario, (name, context))
+                except Exception as e:
+                    results[name] = {'error': f"{type(e).__name__}: {e}"}
+                after = stub.Stats()
+                results[name]['stub'] = {key: after[key] - before[key] for key in after}
+                print(f"[{size}] {name}: {json.dumps(results[name])}", file=sys.stderr)
+    finally:
+        stub.Stop()
+    return {
+        'size': size,
+        'papers': graph.size,
+        'links': sum(len(references) for references in graph.references),
+        'setup': {'graphSeconds': round(graph_elapsed, 3), 'folderSeconds': round(folder_elapsed, 3)},
+        'scenarios': results
+    }
+
+def Compare(report:dict, baseline:dict) -> list:
+    """Per size and scenario, the throughput and p99 ratios of `report` over `baseline`."""
+    previous = {(run['size'], name): result for run in baseline.get('runs', []) for name, result in run['scenarios'].items()}
+    comparison = []
+    for run in report['runs']:
+        for name, result in run['scenarios'].items():
+            base = previous.get((run['size'], name))
+            if not base or 'error' in result or 'error' in base:
+                continue
+            entry = {'size': run['size'], 'scenario': name}
+            for key in ('throughput', 'p99Ms', 'peakRssMb'):
+                if result.get(key) and base.get(key):
+                    entry[key] = round(result[key] / base[key], 3)
+            comparison.append(entry)
+    return comparison
+
+def ParseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PaperCollector against a local stub provider.")
+    parser.add_argument('--sizes', default='1000', help="comma separated library sizes, e.g. 1000,10000,100000")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma separated subset of: " + ', '.join(SCENARIOS))
+    parser.add_argument('--provider', default='semantic_scholar', help="metadata provider name (semantic_scholar, openalex, hedged)")
+    parser.add_argument('--latency', type=float, default=0.0, help="stub latency per request in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random stub latency in seconds")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="fraction of stub requests answered with 429")
+    parser.add_argument('--client-rate', type=float, default=0.0, help="client requests per second, 0 for unthrottled")
+    parser.add_argument('--external-ratio', type=float, default=0.5, help="outside papers per library paper in the graph")
+    parser.add_argument('--references', type=int, default=8, help="references per synthetic paper")
+    parser.add_argument('--pdf-size', type=int, default=4096, help="bytes per synthetic PDF")
+    parser.add_argument('--sample', type=int, default=500, help="papers timed by the per-paper scenarios")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of the warm integrity check")
+    parser.add_argument('--requests', type=int, default=200, help="requests per search endpoint")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent requests per search endpoint")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--workdir', default=None, help="where libraries are built (a temporary directory by default)")
+    parser.add_argument('--keep', action='store_true', help="keep the generated libraries")
+    parser.add_argument('--output', default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', default=None, help="previous JSON report to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = ParseArgs(argv)
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+    temporary = args.workdir is None
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='papercollector-bench-'))
+    os.environ['PAPER_METADATA_PROVIDER'] = args.provider
+    report = {
+        'meta': {
+            'revision': GitRevision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'options': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'keep')}
+        },
+        'runs': []
+    }
+    try:
+        for size in [int(size) for size in args.sizes.split(',') if size]:
+            report['runs'].append(RunSize(size, args, scenarios))
+    finally:
+        if temporary and not args.keep:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+    if args.baseline:
+        with open(args.baseline, 'r') as fp:
+            report['comparison'] = Compare(report, json.load(fp))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(text)
+    else:
+        print(text)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os, sys, time, json, asyncio, resource
+BASEFOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASEFOLDER not in sys.path:
+    sys.path.insert(0, BASEFOLDER)
+
+API_ENDPOINTS = {
+    'api_paper_ids': "/api/paper/search/paperIds",
+    'api_doi': "/api/paper/search/doi",
+    'api_title': "/api/paper/search/title",
+    'api_arxiv_id': "/api/paper/search/arxiv_id",
+}
+
+def PeakRssMb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def Percentile(samples:list, fraction:float) -> float:
+    return samples[min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))]
+
+def Summary(samples:list, elapsed:float, ops:int=None) -> dict:
+    """Throughput over `elapsed` and latency percentiles (ms) of the per-operation `samples` (s)."""
+    samples = sorted(samples)
+    ops = len(samples) if ops is None else ops
+    summary = {'ops': ops, 'elapsed': round(elapsed, 4), 'throughput': round(ops / elapsed, 2) if elapsed else None}
+    if samples:
+        summary.update({
+            'p50Ms': round(Percentile(samples, 0.50) * 1000, 3),
+            'p99Ms': round(Percentile(samples, 0.99) * 1000, 3),
+            'meanMs': round(sum(samples) / len(samples) * 1000, 3),
+            'maxMs': round(samples[-1] * 1000, 3)
+        })
+    return summary
+
+def LimitClients(rate:float):
+    """Replace the providers' token buckets so the stub, not the published rate limit, sets the pace."""
+    from src.utils.http_client import MetadataHttpClient, TokenBucket
+    for provider in ('semantic_scholar', 'openalex'):
+        MetadataHttpClient.ForProvider(provider).bucket = TokenBucket(rate or None, rate or None)
+
+def SampleProcessors(context:dict) -> list:
+    from src.utils.dao import MetadataProvider, PaperProcessor
+    from src.utils.sqliteconnector import SqliteHelper
+    sql = "SELECT identifyId FROM paper_information ORDER BY paperId LIMIT :limit"
+    identify_ids = [row[0] for row in SqliteHelper('paper_db').ExecuteSelect(sql, {'limit': context['sample']})]
+    paper_infos = MetadataProvider.ForName(context['provider']).GetPapersWithListPaperId(identify_ids)
+    return [PaperProcessor(paper_info) for paper_info in paper_infos.values()]
+
+def Register(context:dict) -> dict:
+    from src.component.paper_register import PaperRegister
+    first_seen, last_seen = dict(), dict()
+    def progress(result):
+        now = time.perf_counter()
+        first_seen.setdefault(result.source_path, now)
+        last_seen[result.source_path] = now
+    start = time.perf_counter()
+    res = PaperRegister(context['provider']).RegisterWithPapersFolder(context['inbox'], context['library'], progress=progress)
+    elapsed = time.perf_counter() - start
+    summary = Summary([last_seen[path] - first_seen[path] for path in first_seen], elapsed, len(res['results']))
+    summary.update({'success': len(res['success']), 'failed': len(res['failed']), 'skipped': len(res['skipped'])})
+    return summary
+
+def UpdatePaperLink(context:dict) -> dict:
+    processors = SampleProcessors(context)
+    samples = []
+    start = time.perf_counter()
+    for processor in processors:
+        operation_start = time.perf_counter()
+        processor.UpdatePaperLink()
+        samples.append(time.perf_counter() - operation_start)
+    return Summary(samples, time.perf_counter() - start)
+
+def CreateLinkString(context:dict) -> dict:
+    processors = SampleProcessors(context)
+    samples = []
+    start = time.perf_counter()
+    for processor in processors:
+        operation_start = time.perf_counter()
+        processor.CreateLinkString()
+        samples.append(time.perf_counter() - operation_start)
+    return Summary(samples, time.perf_counter() - start)
+
+def CheckPaperInDb(context:dict, runs:int) -> dict:
+    from src.utils.dao import PaperDataChecker
+    checker = PaperDataChecker([context['library']])
+    samples, report = [], None
+    start = time.perf_counter()
+    for _ in range(runs):
+        operation_start = time.perf_counter()
+        report = checker.checkPaperInDb()
+        samples.append(time.perf_counter() - operation_start)
+    summary = Summary(samples, time.perf_counter() - start)
+    summary.update({'folders': report['folders'], 'changed': report['changed']})
+    return summary
+
+def SearchEndpoint(context:dict, endpoint:str) -> dict:
+    sys.path.insert(0, os.path.join(BASEFOLDER, 'web_service'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_service.settings')
+    import django
+    django.setup()
+    from django.test.utils import setup_test_environment
+    from django.test import AsyncClient
+    setup_test_environment()
+    bodies = context['api_requests'][endpoint]
+    samples, statuses = [], dict()
+
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(context['concurrency'])
+        async def post(body):
+            async with semaphore:
+                operation_start = time.perf_counter()
+                response = await client.post(API_ENDPOINTS[endpoint], json.dumps(body), content_type='application/json')
+                samples.append(time.perf_counter() - operation_start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        await asyncio.gather(*(post(body) for body in bodies))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    summary = Summary(samples, time.perf_counter() - start)
+    summary['status'] = {str(status): count for status, count in sorted(statuses.items())}
+    return summary
+
+SCENARIOS = {
+    'register': Register,
+    'update_paper_link': UpdatePaperLink,
+    'create_link_string': CreateLinkString,
+    'check_cold': lambda context: CheckPaperInDb(context, 1),
+    'check_warm': lambda context: CheckPaperInDb(context, context['repeat']),
+}
+SCENARIOS.update({name: (lambda context, endpoint=name: SearchEndpoint(context, endpoint)) for name in API_ENDPOINTS})
+
+def RunScenario(name:str, context:dict) -> dict:
+    """Entry point of the scenario worker process; every scenario gets a fresh process so peak RSS is its own."""
+    os.chdir(context['workdir'])
+    os.environ['PAPER_DATA_FOLDER'] = context['workdir']
+    # the library reports through print(); keep stdout for the JSON report
+    sys.stdout = sys.stderr
+    LimitClients(context['client_rate'])
+    result = SCENARIOS[name](context)
+    result['peakRssMb'] = PeakRssMb()
+    return result
@@ -0,0 +1,219 @@
+import json, time, random, hashlib, datetime, threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class SyntheticPaperGraph:
+    """
+    Deterministic citation graph shared by the stub server and the PDF generator.
+
+    Paper `i` has ArXiv id `ArxivId(i)`, DOI 10.48550/arxiv.<ArXiv id>, OpenAlex
+    id W<10000000 + i> and a 40 hex character Semantic Scholar id. Every paper
+    cites `references` earlier papers chosen by preferential attachment, so the
+    in-degree distribution has the long tail of a real citation graph. Only
+    `library_size` of the `library_size * (1 + external_ratio)` papers get a PDF;
+    the others are the outside papers a library links to.
+    """
+    def __init__(self, library_size:int, external_ratio:float=0.5, references:int=8, seed:int=7):
+        self.library_size = library_size
+        self.size = int(library_size * (1 + external_ratio))
+        rng = random.Random(seed)
+        self.references = [()] * self.size
+        self.citations = [[] for _ in range(self.size)]
+        targets = []
+        for paper in range(self.size):
+            cited = set()
+            for _ in range(min(references, paper)):
+                cited.add(rng.choice(targets))
+            self.references[paper] = tuple(sorted(cited))
+            for reference in cited:
+                self.citations[reference].append(paper)
+            targets.extend(cited)
+            targets.append(paper)
+        self.library = sorted(rng.sample(range(self.size), library_size))
+        self.by_id = dict()
+        for paper in range(self.size):
+            for alias in (self.ArxivId(paper), self.Doi(paper), self.S2Id(paper), self.OpenAlexId(paper), self.Title(paper).lower()):
+                self.by_id[alias.lower()] = paper
+
+    @staticmethod
+    def ArxivId(paper:int) -> str:
+        return f"{2101 + paper // 90000:04d}.{paper % 90000 + 1:05d}"
+
+    @staticmethod
+    def Doi(paper:int) -> str:
+        return f"10.48550/arxiv.{SyntheticPaperGraph.ArxivId(paper)}"
+
+    @staticmethod
+    def S2Id(paper:int) -> str:
+        return hashlib.sha1(f"paper-{paper}".encode()).hexdigest()
+
+    @staticmethod
+    def OpenAlexId(paper:int) -> str:
+        return f"W{10000000 + paper}"
+
+    @staticmethod
+    def Title(paper:int) -> str:
+        return f"Synthetic paper {paper} on topic {paper % 97}"
+
+    @staticmethod
+    def PublicationDate(paper:int) -> str:
+        return (datetime.date(2010, 1, 1) + datetime.timedelta(days=paper % 5000)).isoformat()
+
+    def Find(self, identifier:str):
+        identifier = unquote(identifier).strip().lower()
+        for prefix in ('arxiv:', 'doi:', 'https://doi.org/', 'https://openalex.org/'):
+            if identifier.startswith(prefix):
+                identifier = identifier[len(prefix):]
+        return self.by_id.get(identifier)
+
+    def SemanticScholarPaper(self, paper:int) -> dict:
+        return {
+            'paperId': self.S2Id(paper),
+            'externalIds': {'ArXiv': self.ArxivId(paper), 'DOI': self.Doi(paper)},
+            'url': f"https://www.semanticscholar.org/paper/{self.S2Id(paper)}",
+            'title': self.Title(paper),
+            'citationCount': len(self.citations[paper]),
+            'fieldsOfStudy': ['Computer Science'],
+            'publicationDate': self.PublicationDate(paper),
+            'authors': [{'name': f"Author {paper % 1013}"}, {'name': f"Author {paper % 211}"}],
+            'citations': [{'paperId': self.S2Id(citing)} for citing in self.citations[paper]],
+            'references': [{'paperId': self.S2Id(reference)} for reference in self.references[paper]],
+        }
+
+    def OpenAlexWork(self, paper:int) -> dict:
+        return {
+            'id': f"https://openalex.org/{self.OpenAlexId(paper)}",
+            'doi': f"https://doi.org/{self.Doi(paper)}",
+            'title': self.Title(paper),
+            'display_name': self.Title(paper),
+            'publication_date': self.PublicationDate(paper),
+            'cited_by_count': len(self.citations[paper]),
+            'authorships': [{'author': {'display_name': f"Author {paper % 1013}"}}, {'author': {'display_name': f"Author {paper % 211}"}}],
+            'ids': {'openalex': f"https://openalex.org/{self.OpenAlexId(paper)}", 'doi': f"https://doi.org/{self.Doi(paper)}"},
+            'primary_topic': {'field': {'display_name': 'Computer Science'}},
+            'referenced_works': [f"https://openalex.org/{self.OpenAlexId(reference)}" for reference in self.references[paper]],
+        }
+
+
+class StubProviderServer:
+    """
+    Local HTTP server answering the Semantic Scholar and OpenAlex endpoints used by the tools.
+
+    Every request sleeps `latency` seconds (plus up to `jitter`) and is answered
+    with 429 and `Retry-After: 0` with probability `rate_limit`. Request counts
+    are kept in `stats` so scenarios can report how many calls they caused.
+    """
+    def __init__(self, graph:SyntheticPaperGraph, latency:float=0.0, jitter:float=0.0, rate_limit:float=0.0, seed:int=7, host:str='127.0.0.1', port:int=0):
+        self.graph = graph
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.Handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+
+    def Start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-provider', daemon=True)
+        self.thread.start()
+        return self
+
+    def Stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def Stats(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def Throttle(self) -> bool:
+        with self._lock:
+            self.stats['requests'] += 1
+            throttled = self.random.random() < self.rate_limit
+            if throttled:
+                self.stats['throttled'] += 1
+            delay = self.latency + self.random.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+        return throttled
+
+    def SemanticScholar(self, method:str, path:str, query:dict, body):
+        graph = self.graph
+        route = path.split('/paper', 1)[1] if '/paper' in path else path
+        if method == 'POST' and route == '/batch':
+            papers = [graph.Find(identifier) for identifier in body.get('ids', [])]
+            return 200, [graph.SemanticScholarPaper(paper) if paper is not None else None for paper in papers]
+        if route == '/search':
+            paper = graph.Find(query.get('query', ''))
+            return 200, {'total': 1 if paper is not None else 0, 'data': [graph.SemanticScholarPaper(paper)] if paper is not None else []}
+        paper = graph.Find(route.lstrip('/'))
+        if paper is None:
+            return 404, {'error': 'Paper not found'}
+        return 200, graph.SemanticScholarPaper(paper)
+
+    def OpenAlex(self, query:dict):
+        graph = self.graph
+        if 'search' in query:
+            paper = graph.Find(query['search'])
+            works = [graph.OpenAlexWork(paper)] if paper is not None else []
+            return 200, {'meta': {'count': len(works), 'next_cursor': None}, 'results': works}
+        key, _, values = query.get('filter', '').partition(':')
+        papers = {graph.Find(value) for value in values.split('|')}
+        papers.discard(None)
+        if key == 'cites':
+            papers = {citing for paper in papers for citing in graph.citations[paper]}
+        elif key not in ('doi', 'ids.openalex'):
+            return 400, {'error': f"Unsupported filter {key}"}
+        papers = sorted(papers)
+        per_page = min(int(query.get('per-page', 25)), 200)
+        offset = 0 if query.get('cursor', '*') == '*' else int(query['cursor'])
+        page = papers[offset:offset + per_page]
+        next_cursor = str(offset + per_page) if offset + per_page < len(papers) else None
+        return 200, {'meta': {'count': len(papers), 'next_cursor': next_cursor}, 'results': [graph.OpenAlexWork(paper) for paper in page]}
+
+    def Handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def Send(self, status:int, payload, headers:dict=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def Dispatch(self, method:str):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                if stub.Throttle():
+                    self.Send(429, {'error': 'Too Many Requests'}, {'Retry-After': '0'})
+                    return
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                if url.path.startswith('/works'):
+                    status, payload = stub.OpenAlex(query)
+                else:
+                    status, payload = stub.SemanticScholar(method, url.path, query, body)
+                self.Send(status, payload)
+
+            def do_GET(self):
+                self.Dispatch('GET')
+
+            def do_POST(self):
+                self.Dispatch('POST')
+
+        return Handler
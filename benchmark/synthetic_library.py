@@ -0,0 +1,22 @@
+import os
+from benchmark.stub_provider import SyntheticPaperGraph
+
+def CreatePdfFolder(graph:SyntheticPaperGraph, target_dir:str, pdf_size:int=4096) -> list:
+    """
+    Write one small PDF named `<ArXiv id>.pdf` per library paper of `graph`.
+
+    The body is unique per paper so content deduplication never collapses two
+    files. Existing files are kept, which lets repeated runs reuse a 100k folder.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    file_paths = []
+    for paper in graph.library:
+        file_path = os.path.join(target_dir, f"{graph.ArxivId(paper)}.pdf")
+        file_paths.append(file_path)
+        if os.path.exists(file_path):
+            continue
+        header = f"%PDF-1.4\n% synthetic paper {paper}\n".encode()
+        padding = (f"{paper:010d}".encode() * (pdf_size // 10 + 1))[:max(pdf_size - len(header) - 6, 0)]
+        with open(file_path, 'wb') as fp:
+            fp.write(header + padding + b"\n%%EOF")
+    return file_paths
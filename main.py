@@ -1,8 +1,10 @@
 import os
-import django
-from django.core.management import call_command
+import sys
 
 def run_django_server():
+    # Django 只在啟動 web 服務時載入，--watch 等 CLI 路徑不需要它
+    import django
+    from django.core.management import call_command
     # 設定 Django 的 settings 模組路徑
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web_service.web_service.settings')
     # 初始化 Django
@@ -14,5 +16,29 @@ def run_django_server():
     # 直接呼叫 runserver
     call_command("runserver", "127.0.0.1:8000")
 
+def run_asgi_server(host="127.0.0.1", port=8000):
+    # 以 ASGI (uvicorn) 執行，所有 async views 共用一個 event loop；uvicorn 為選用套件，預設的 runserver 不需要它
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("--asgi 需要 uvicorn：pip install uvicorn")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web_service'))
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'web_service.settings'
+    uvicorn.run("web_service.asgi:application", host=host, port=port)
+
+def run_folder_watcher(drop_dirs, target_dir=None):
+    # 持續監看投放資料夾，PDF 寫入完成後以小批次註冊
+    from src.component.folder_watcher import PaperFolderWatcher
+    watcher = PaperFolderWatcher(drop_dirs, target_dir)
+    try:
+        watcher.Run()
+    except KeyboardInterrupt:
+        pass
+
 if __name__ == "__main__":
-    run_django_server()
\ No newline at end of file
+    if "--watch" in sys.argv:
+        run_folder_watcher(sys.argv[sys.argv.index("--watch") + 1:] or [os.getcwd()])
+    elif "--asgi" in sys.argv:
+        run_asgi_server()
+    else:
+        run_django_server()
\ No newline at end of file
@@ -0,0 +1,228 @@
+"""
+Command line front end of the library maintenance classes, meant for cron and
+other unattended runs. It needs no Django.
+
+    papercollector ingest ~/Downloads/papers --target ~/Papers --jobs 8 --batch-size 200
+    papercollector update ~/Papers --jobs 4 --rate 0.5 --dry-run
+    papercollector clean ~/Papers --delete-folders --dry-run
+    papercollector check ~/Papers
+    papercollector search "graph neural network" --page-size 5
+    papercollector search --ids 2101.00001 2101.00002
+    papercollector worker --jobs 2
+
+(`python -m src.cli ...` from the repository root is equivalent.)
+
+Every command writes JSON lines to stdout: a "start" event, one "progress"
+event per file or folder (unless --quiet) and a final "summary" event with the
+stats; messages of the library itself go to stderr. With --dry-run the moves
+and DB writes are planned in memory and reported, the library is left alone.
+The exit status is 1 when any file or folder failed.
+"""
+import os, sys, json, time, argparse, threading
+BASEFOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASEFOLDER not in sys.path:
+    sys.path.insert(0, BASEFOLDER)
+
+class ProgressReporter:
+    """Thread safe writer of the JSON line events of one command."""
+    FINAL_STATUS = ('success', 'failed', 'skipped', 'planned')
+
+    def __init__(self, command:str, stream, quiet:bool=False):
+        self.command = command
+        self.stream = stream
+        self.quiet = quiet
+        self.total = None
+        self.done = 0
+        self.counts = dict()
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def Emit(self, event:str, **fields):
+        line = json.dumps({'event': event, 'command': self.command, **fields}, default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def Start(self, total:int=None, **fields):
+        self.total = total
+        self.Emit('start', total=total, **fields)
+
+    def Progress(self, item:str, status:str, **fields):
+        with self._lock:
+            self.done += 1
+            self.counts[status] = self.counts.get(status, 0) + 1
+            done = self.done
+        if not self.quiet:
+            self.Emit('progress', item=item, status=status, done=done, total=self.total, **fields)
+
+    def Summary(self, **fields) -> int:
+        elapsed = time.perf_counter() - self.start
+        self.Emit('summary', elapsed=round(elapsed, 3), done=self.done, counts=dict(self.counts),
+                  throughput=round(self.done / elapsed, 2) if elapsed else None, providerRequests=ProviderRequests(), **fields)
+        return 1 if self.counts.get('failed') else 0
+
+    def IngestProgress(self):
+        """progress callback for IngestPipeline: one event per file once it reaches a final status."""
+        reported = set()
+        def progress(result):
+            if result.status in ProgressReporter.FINAL_STATUS and result.source_path not in reported:
+                reported.add(result.source_path)
+                fields = result.to_dict()
+                self.Progress(fields.pop('sourcePath'), fields.pop('status'), **fields)
+        return progress
+
+
+def ProviderRequests() -> int:
+    from src.utils.metrics import Metrics
+    return sum(value for (name, _), value in list(Metrics.counters.items()) if name == 'provider_responses_total')
+
+def CollectPdfs(sources:list) -> dict:
+    """{folder: [pdf paths]} for the given folders and PDF files, in argument order."""
+    by_folder = dict()
+    for source in sources:
+        source = os.path.abspath(source)
+        if os.path.isdir(source):
+            file_paths = sorted(os.path.join(source, file_name) for file_name in os.listdir(source) if file_name.endswith('.pdf'))
+            by_folder.setdefault(source, []).extend(file_paths)
+        elif source.endswith('.pdf') and os.path.isfile(source):
+            by_folder.setdefault(os.path.dirname(source), []).append(source)
+        else:
+            raise SystemExit(f"Not a folder or PDF file: {source}")
+    return by_folder
+
+def CreateRegister(args):
+    from src.component.paper_register import PaperRegister
+    register = PaperRegister(args.provider)
+    if args.rate:
+        register.semantic_tool.SetRate(args.rate)
+    return register
+
+def Ingest(args, reporter:ProgressReporter) -> int:
+    from src.utils.ingest_journal import IngestJournal
+    register = CreateRegister(args)
+    by_folder = CollectPdfs(args.sources)
+    reporter.Start(sum(len(file_paths) for file_paths in by_folder.values()), dryRun=args.dry_run, target=os.path.abspath(args.target) if args.target else None)
+    plan = {'moves': 0, 'folders': 0, 'rows': {'insert': 0, 'update': 0}, 'links': 0, 'notes': 0}
+    for folder, file_paths in by_folder.items():
+        target_dir = os.path.abspath(args.target) if args.target else folder
+        journal = IngestJournal(IngestJournal.JobKey('register', folder, target_dir))
+        res = register.RegisterFiles(file_paths, target_dir, reporter.IngestProgress(), batch_size=args.batch_size,
+                                     fs_workers=args.jobs or 8, journal=journal, dry_run=args.dry_run)
+        if args.dry_run:
+            plan['moves'] += len(res['plan']['moves'])
+            plan['folders'] += len(res['plan']['folders'])
+            plan['links'] += res['plan']['links']
+            plan['notes'] += res['plan']['notes']
+            for key, count in res['plan']['rows'].items():
+                plan['rows'][key] += count
+    return reporter.Summary(plan=plan) if args.dry_run else reporter.Summary()
+
+def Update(args, reporter:ProgressReporter) -> int:
+    register = CreateRegister(args)
+    library = os.path.abspath(args.library)
+    reporter.Start(sum(1 for entry in os.scandir(library) if entry.is_dir()), dryRun=args.dry_run)
+    def progress(paper_folder, error):
+        status = 'failed' if error else ('planned' if args.dry_run else 'success')
+        reporter.Progress(paper_folder, status, error=error)
+    res = register.UpdatePaperinformationInFolder(library, workers=args.jobs or 1, progress=progress, dry_run=args.dry_run, batch_size=args.batch_size)
+    if args.dry_run:
+        plan = dict(res['plan'])
+        plan['moves'], plan['folders'] = len(plan['moves']), len(plan['folders'])
+        return reporter.Summary(plan=plan)
+    return reporter.Summary()
+
+def Clean(args, reporter:ProgressReporter) -> int:
+    from src.component.paper_register import PaperRegister
+    reporter.Start(dryRun=args.dry_run)
+    res = PaperRegister().CleanPapersFolder(os.path.abspath(args.library), args.delete_folders, dry_run=args.dry_run)
+    for move in res['moves']:
+        reporter.Progress(move['from'], 'planned' if args.dry_run else 'moved', to=move['to'])
+    return reporter.Summary(moves=len(res['moves']), deleted=res['deleted'])
+
+def Check(args, reporter:ProgressReporter) -> int:
+    from src.utils.dao import PaperDataChecker
+    reporter.Start(dryRun=args.dry_run)
+    library_dirs = [os.path.abspath(library) for library in args.libraries] or None
+    report = PaperDataChecker(library_dirs, workers=args.jobs or 16).checkPaperInDb(dry_run=args.dry_run)
+    return reporter.Summary(report=report)
+
+def Search(args, reporter:ProgressReporter) -> int:
+    from src.component.search_engine import SearchEngine
+    search_engine = SearchEngine(args.provider)
+    reporter.Start()
+    if args.ids:
+        if args.rate:
+            search_engine.semantic_tool.SetRate(args.rate)
+        res = search_engine.SearchWithPaperIds(args.ids)
+        for paper_id in res['failed']:
+            reporter.Progress(paper_id, 'failed', error=res['failed'][paper_id]['reason'])
+        return reporter.Summary(result=res)
+    if not args.query:
+        raise SystemExit("search needs a query or --ids")
+    return reporter.Summary(result=search_engine.SearchInLibrary(args.query, args.page, args.page_size))
+
+def Worker(args, reporter:ProgressReporter) -> int:
+    from src.component.job_worker import JobWorkerPool
+    pool = JobWorkerPool('job_db', workers=args.jobs or 2, poll_interval=args.poll_interval).Start()
+    reporter.Start(workers=pool.workers)
+    try:
+        pool.Wait()
+    except KeyboardInterrupt:
+        pool.Stop()
+    return reporter.Summary()
+
+COMMANDS = {
+    'ingest': Ingest,
+    'update': Update,
+    'clean': Clean,
+    'check': Check,
+    'search': Search,
+    'worker': Worker,
+}
+
+def ParseArgs(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--quiet', action='store_true', help="only print the start and summary events")
+    provider = argparse.ArgumentParser(add_help=False)
+    provider.add_argument('--provider', default=None, help="metadata provider (semantic_scholar, openalex, hedged); PAPER_METADATA_PROVIDER by default")
+    provider.add_argument('--rate', type=float, default=None, help="provider requests per second, overrides provider_list.json")
+    planned = argparse.ArgumentParser(add_help=False)
+    planned.add_argument('--jobs', type=int, default=None, help="worker threads")
+    planned.add_argument('--dry-run', action='store_true', help="plan the moves and DB writes without touching the library")
+
+    parser = argparse.ArgumentParser(prog='papercollector', description="Maintain a PaperCollector library from the command line.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', parents=[common, provider, planned], help="register the PDFs of folders or files")
+    ingest.add_argument('sources', nargs='+', help="folders or PDF files named after their ArXiv id / paper id")
+    ingest.add_argument('--target', default=None, help="library folder (the source folder by default)")
+    ingest.add_argument('--batch-size', type=int, default=100, help="files per metadata lookup")
+    update = commands.add_parser('update', parents=[common, provider, planned], help="refresh the metadata of every paper folder")
+    update.add_argument('library')
+    update.add_argument('--batch-size', type=int, default=100, help="files per metadata lookup")
+    clean = commands.add_parser('clean', parents=[common, planned], help="move the PDFs of a library back into <library>/.temp")
+    clean.add_argument('library')
+    clean.add_argument('--delete-folders', action='store_true', help="delete the paper folders once emptied")
+    check = commands.add_parser('check', parents=[common, planned], help="reconcile paper_db with the folders on disk")
+    check.add_argument('libraries', nargs='*', help="library folders (the ones known to paper_db by default)")
+    search = commands.add_parser('search', parents=[common, provider], help="search the library, or the provider with --ids")
+    search.add_argument('query', nargs='?')
+    search.add_argument('--ids', nargs='+', default=None, help="look paper ids up through the provider instead")
+    search.add_argument('--page', type=int, default=1)
+    search.add_argument('--page-size', type=int, default=20)
+    worker = commands.add_parser('worker', parents=[common], help="run the background jobs queued through the API")
+    worker.add_argument('--jobs', type=int, default=None, help="worker processes")
+    worker.add_argument('--poll-interval', type=float, default=1.0, help="seconds between queue polls and job heartbeats")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = ParseArgs(argv)
+    stream = sys.stdout
+    # the library reports through print(); stdout is kept for the JSON events
+    sys.stdout = sys.stderr
+    try:
+        return COMMANDS[args.command](args, ProgressReporter(args.command, stream, args.quiet))
+    finally:
+        sys.stdout = stream
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import os, sys, time, select, struct, threading, ctypes, ctypes.util
+from src.utils.ingest_journal import IngestJournal
+from src.component.paper_register import PaperRegister
+
+
+class InotifyWatcher:
+    """Reports the PDFs written or moved into the watched folders, using inotify through libc."""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, folders:list):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(InotifyWatcher.IN_NONBLOCK | InotifyWatcher.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = dict()
+        mask = InotifyWatcher.IN_MODIFY | InotifyWatcher.IN_CLOSE_WRITE | InotifyWatcher.IN_MOVED_TO | InotifyWatcher.IN_CREATE
+        for folder in folders:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+            if wd < 0:
+                self.Close()
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+            self.folders[wd] = folder
+
+    def Scan(self) -> set:
+        return {entry.path for folder in self.folders.values() for entry in os.scandir(folder) if entry.name.endswith('.pdf')}
+
+    def Wait(self, timeout:float) -> set:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+        changed, offset = set(), 0
+        while offset < len(data):
+            wd, mask, _, name_length = InotifyWatcher.EVENT_HEADER.unpack_from(data, offset)
+            offset += InotifyWatcher.EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0').decode(sys.getfilesystemencoding(), 'surrogateescape')
+            offset += name_length
+            if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                # events were dropped by the kernel, fall back to a full listing once
+                changed.update(self.Scan())
+            elif wd in self.folders and name.endswith('.pdf'):
+                changed.add(os.path.join(self.folders[wd], name))
+        return changed
+
+    def Close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Fallback watcher diffing (size, mtime) snapshots taken with os.scandir."""
+    def __init__(self, folders:list, interval:float=1.0):
+        self.folders = folders
+        self.interval = interval
+        self.snapshot = dict()
+
+    def Scan(self) -> set:
+        snapshot = dict()
+        for folder in self.folders:
+            for entry in os.scandir(folder):
+                if entry.name.endswith('.pdf') and entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        changed = {path for path, signature in snapshot.items() if self.snapshot.get(path) != signature}
+        self.snapshot = snapshot
+        return changed
+
+    def Wait(self, timeout:float) -> set:
+        time.sleep(min(timeout, self.interval))
+        return self.Scan()
+
+    def Close(self):
+        pass
+
+
+class PaperFolderWatcher:
+    """
+    Long-running ingest of the PDFs dropped into `drop_dirs`.
+
+    Changed files are only registered once their size and mtime have not moved
+    for `settle_seconds`, so partially written downloads are left alone. Ready
+    files are collected for up to `batch_window` seconds (or `batch_size`
+    files) and registered through one `PaperRegister.RegisterFiles` call per
+    drop folder, i.e. one batched metadata lookup per window.
+    """
+    def __init__(self, drop_dirs:list, target_dir:str=None, register:PaperRegister=None, settle_seconds:float=2.0, batch_window:float=5.0, batch_size:int=100, poll_interval:float=1.0, use_inotify:bool=True, progress=None):
+        self.drop_dirs = [os.path.abspath(drop_dir) for drop_dir in drop_dirs]
+        self.target_dir = target_dir
+        self.register = register if register is not None else PaperRegister()
+        self.settle_seconds = settle_seconds
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.progress = progress
+        self.pending = dict()
+        self.ready = dict()
+        self.rejected = dict()
+        self.window_start = None
+        self._stop = threading.Event()
+
+    def CreateWatcher(self):
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                return InotifyWatcher(self.drop_dirs)
+            except (OSError, AttributeError) as e:
+                print(f"inotify is not available, polling the folders instead: {e}")
+        return PollingWatcher(self.drop_dirs, self.poll_interval)
+
+    @staticmethod
+    def Signature(file_path:str):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def Track(self, file_paths:set, now:float):
+        for file_path in file_paths:
+            signature = self.Signature(file_path)
+            if signature is None:
+                self.pending.pop(file_path, None)
+                self.ready.pop(file_path, None)
+            elif self.rejected.get(file_path) != signature:
+                self.ready.pop(file_path, None)
+                self.pending[file_path] = (signature, now)
+
+    def Settle(self, now:float):
+        for file_path, (signature, since) in list(self.pending.items()):
+            current = self.Signature(file_path)
+            if current is None:
+                self.pending.pop(file_path)
+            elif current != signature:
+                self.pending[file_path] = (current, now)
+            elif now - since >= self.settle_seconds and signature[0] > 0:
+                self.pending.pop(file_path)
+                self.ready[file_path] = signature
+                if self.window_start is None:
+                    self.window_start = now
+
+    def Flush(self) -> list:
+        ready, self.ready, self.window_start = self.ready, dict(), None
+        by_folder = dict()
+        for file_path in ready:
+            by_folder.setdefault(os.path.dirname(file_path), []).append(file_path)
+        reports = []
+        for drop_dir, file_paths in by_folder.items():
+            target_dir = self.target_dir if self.target_dir is not None else drop_dir
+            journal = IngestJournal(IngestJournal.JobKey('register', drop_dir, os.path.abspath(target_dir)))
+            try:
+                res = self.register.RegisterFiles(file_paths, target_dir, self.progress, batch_size=self.batch_size, journal=journal)
+            except Exception as e:
+                print(f"Failed to register papers in [{drop_dir}]: {e}")
+                continue
+            for file_path in res['failed'] + res['skipped']:
+                # not retried until the file changes again
+                if file_path in ready:
+                    self.rejected[file_path] = ready[file_path]
+            reports.append(res)
+        return reports
+
+    def Step(self, now:float=None) -> list:
+        now = time.monotonic() if now is None else now
+        self.Settle(now)
+        if self.ready and (len(self.ready) >= self.batch_size or now - self.window_start >= self.batch_window):
+            return self.Flush()
+        return []
+
+    def Run(self):
+        watcher = self.CreateWatcher()
+        try:
+            self.Track(watcher.Scan(), time.monotonic())
+            while not self._stop.is_set():
+                timeout = min(self.settle_seconds, self.batch_window, self.poll_interval)
+                self.Track(watcher.Wait(timeout), time.monotonic())
+                self.Step()
+            if self.ready:
+                self.Flush()
+        finally:
+            watcher.Close()
+
+    def Stop(self):
+        self._stop.set()
@@ -0,0 +1,401 @@
+import os, datetime, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.dao import MetadataProvider, PaperProcessor
+from src.utils.note_renderer import PaperNoteRenderer
+from src.utils.metrics import Metrics
+from src.utils.content_index import PdfContentIndex
+from src.utils.ingest_journal import IngestJournal
+from src.utils.citation_graph import CitationGraphIndex
+from src.utils.metadata_cache import MetadataCache
+from src.utils.sqliteconnector import SqliteHelper
+from src.component.paper_info import SemanticScholarInfo
+
+
+class IngestResult:
+    """Outcome of one PDF going through the IngestPipeline."""
+    def __init__(self, source_path:str, identify_id:str):
+        self.source_path = source_path
+        self.pdf_path = source_path
+        self.identify_id = identify_id
+        self.status = 'pending'
+        self.stage = 'extracted'
+        self.paper_id = None
+        self.folder = None
+        self.target_path = None
+        self.error = None
+        self.content = None
+
+    def Fail(self, error):
+        self.status = 'failed'
+        self.error = str(error)
+
+    def Skip(self, paper_id:str, paper_path:str):
+        self.status = 'skipped'
+        self.paper_id = paper_id
+        self.folder = os.path.dirname(paper_path)
+        self.error = f"Duplicate of {paper_path}"
+
+    def JournalEntry(self) -> tuple:
+        return (self.source_path, self.paper_id, self.folder, self.target_path)
+
+    def to_dict(self) -> dict:
+        return {
+            'sourcePath': self.source_path,
+            'identifyId': self.identify_id,
+            'status': self.status,
+            'stage': self.stage,
+            'paperId': self.paper_id,
+            'folder': self.folder,
+            'targetPath': self.target_path,
+            'error': self.error
+        }
+
+
+class IngestPipeline:
+    """
+    Staged ingest of PDF files into the library.
+
+    extract -> fetch (batched metadata lookups) -> move (filesystem work on a
+    thread pool) -> write (a single thread doing the DB upserts and note renders)
+
+    Stages are connected with bounded queues, so a slow stage holds back the
+    ones in front of it instead of buffering the whole folder in memory.
+    `progress(result)` is called from the stage threads every time a file
+    changes stage; an exception it raises is printed and ignored. A stage that
+    fails unexpectedly keeps draining its input queue so the stages in front
+    of it never block on a full queue, and `Run` raises the error once every
+    stage has stopped.
+
+    The extract stage drops files whose content is already registered, so a
+    re-downloaded or renamed PDF never reaches the metadata provider.
+
+    With a `journal`, every stage transition is recorded and a re-run of the
+    same job resumes each file from its last recorded stage: moved files are
+    picked up from their new folder (the metadata comes back from the cache)
+    and linked papers only get their notes rendered.
+
+    Setting the `cancel` event stops the lookup of new batches; batches
+    already fetched are finished and the rest keeps the status 'pending'.
+    """
+    def __init__(self, semantic_tool:MetadataProvider, target_dir:str=None, batch_size:int=100, fs_workers:int=8, queue_size:int=4, progress=None, journal:IngestJournal=None, cancel=None):
+        self.semantic_tool = semantic_tool
+        self.target_dir = target_dir
+        self.batch_size = batch_size
+        self.fs_workers = fs_workers
+        self.queue_size = queue_size
+        self.progress = progress
+        self.journal = journal
+        self.cancel = cancel
+        self.content_index = PdfContentIndex('paper_db', create_schema=False)
+        self.stage_error = None
+
+    @staticmethod
+    def PaperFolderName(paper_data:dict, target_dir:str) -> str:
+        publication_date = datetime.datetime.strptime(paper_data['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_data['publicationDate'] else "Null"
+        paper_title = paper_data['title'].replace("?", "").replace(":", "")
+        return os.path.join(target_dir, f"{publication_date} {paper_title}")
+
+    def Cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+    def Notify(self, result:IngestResult, stage:str=None):
+        if stage:
+            result.stage = stage
+        if self.progress:
+            try:
+                self.progress(result)
+            except Exception as e:
+                print(f"Failed to report ingest progress of {result.source_path}: {e}")
+
+    def StageFailed(self, stage_queue:queue.Queue, error:Exception):
+        """Keep the error of a crashed stage and consume its input until the end marker."""
+        print(f"Ingest stage {threading.current_thread().name} failed: {error}")
+        self.stage_error = self.stage_error or error
+        while stage_queue.get() is not None:
+            pass
+
+    def Record(self, stage:str, results:list):
+        if self.journal is None:
+            return
+        try:
+            self.journal.Record(stage, [result.JournalEntry() for result in results])
+        except Exception as e:
+            print(f"Failed to record ingest journal: {e}")
+
+    def Resume(self, file_paths:list):
+        """Return (results, pending, linked): journaled files merged with the new ones."""
+        entries = self.journal.Load() if self.journal is not None else dict()
+        file_paths = list(dict.fromkeys(file_paths))
+        listed = set(file_paths)
+        results, pending, linked = [], [], []
+        for file_path in file_paths + [path for path in entries if path not in listed]:
+            file_name = os.path.basename(file_path)
+            result = IngestResult(file_path, file_name.rsplit('.pdf', 1)[0])
+            results.append(result)
+            entry = entries.get(file_path)
+            if entry is None:
+                pending.append(result)
+                continue
+            result.paper_id, result.folder, result.target_path = entry['paperId'], entry['folder'], entry['targetPath']
+            result.stage = entry['stage']
+            if IngestJournal.Reached(entry['stage'], 'linked'):
+                result.status = 'success'
+                if entry['stage'] != 'rendered':
+                    linked.append(result)
+            elif os.path.exists(file_path):
+                pending.append(result)
+            elif result.target_path and os.path.exists(result.target_path):
+                # moved before the crash: fetch again by paper id and finish from the new folder
+                result.pdf_path = result.target_path
+                result.identify_id = result.paper_id
+                pending.append(result)
+            else:
+                result.Fail("Source file missing")
+        return results, pending, linked
+
+    def Run(self, file_paths:list) -> list:
+        results, pending, linked = self.Resume(file_paths)
+        self.content_index.CreateOrIgnoreHashTable()
+        self.stage_error = None
+        fetch_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        fs_executor = ThreadPoolExecutor(max_workers=self.fs_workers, thread_name_prefix='ingest-fs')
+        fetcher = threading.Thread(target=self.FetchStage, args=(fetch_queue, write_queue, fs_executor), name='ingest-fetch')
+        writer = threading.Thread(target=self.WriteStage, args=(write_queue, linked), name='ingest-write')
+        fetcher.start()
+        writer.start()
+        try:
+            batch = []
+            for result in pending:
+                if self.Cancelled():
+                    batch = []
+                    break
+                self.Notify(result)
+                batch.append(result)
+                if len(batch) >= self.batch_size:
+                    self.Dispatch(fetch_queue, batch)
+                    batch = []
+            if batch:
+                self.Dispatch(fetch_queue, batch)
+        finally:
+            fetch_queue.put(None)
+            fetcher.join()
+            writer.join()
+            fs_executor.shutdown()
+        if self.stage_error is not None:
+            raise self.stage_error
+        if self.journal is not None:
+            # files moved or linked without reaching 'rendered' stay journaled for the next run
+            self.journal.Forget([result.source_path for result in results if result.stage not in ('moved', 'linked')])
+        for result in results:
+            Metrics.Count('ingest_files_total', status=result.status)
+        return results
+
+    def Plan(self, file_paths:list) -> dict:
+        """
+        Dry run of `Run`: files are deduplicated, resolved and placed exactly as
+        Run would place them, but nothing is moved, written or journaled, no
+        table is created and the metadata cache is only read. Files Run would
+        register end up with the status 'planned'; the returned dict also lists
+        the moves, the new folders and the DB writes they imply.
+        """
+        with MetadataCache.ReadOnly():
+            return self.PlanFiles(file_paths)
+
+    def PlanFiles(self, file_paths:list) -> dict:
+        results, pending, linked = self.Resume(file_paths)
+        # without the library tables there is nothing to deduplicate against or link to yet
+        tables = SqliteHelper('paper_db').Tables()
+        citation_graph = CitationGraphIndex.ForService('paper_db') if 'paper_graph_version' in tables else None
+        library_ids = citation_graph if citation_graph is not None else frozenset()
+        planned_ids, folders, targets = set(), set(), set()
+        moves, links, notes = [], set(), {result.paper_id for result in linked}
+        rows = {'insert': 0, 'update': 0}
+        for start in range(0, len(pending), self.batch_size):
+            if self.Cancelled():
+                break
+            batch = pending[start:start + self.batch_size]
+            duplicates = self.content_index.FindDuplicates([result.pdf_path for result in batch]) if 'paper_file_hash' in tables else dict()
+            lookup = []
+            for result in batch:
+                duplicate = duplicates.get(result.pdf_path)
+                if duplicate:
+                    result.Skip(duplicate['paperId'], duplicate['paperPath'])
+                    self.Notify(result)
+                else:
+                    lookup.append(result)
+            if not lookup:
+                continue
+            failures = dict()
+            try:
+                paper_infos = self.semantic_tool.GetPapersWithListPaperId([result.identify_id for result in lookup], failures)
+            except Exception as e:
+                for result in lookup:
+                    result.Fail(e)
+                    self.Notify(result)
+                continue
+            planned = []
+            for result in lookup:
+                if result.identify_id not in paper_infos:
+                    result.Fail(failures.get(result.identify_id, "Not found"))
+                    self.Notify(result)
+                    continue
+                try:
+                    # the same placement as FetchBatches, without a PaperProcessor (which creates the tables)
+                    paper_data = paper_infos[result.identify_id].to_dict()
+                    target_dir = self.target_dir if self.target_dir is not None else os.path.dirname(result.source_path)
+                    result.paper_id = paper_data['paperId']
+                    result.folder = self.PaperFolderName(paper_data, target_dir)
+                    result.target_path = os.path.join(result.folder, f"{PaperProcessor.FileId(paper_data)}.pdf")
+                except Exception as e:
+                    result.Fail(e)
+                    self.Notify(result)
+                    continue
+                if not os.path.isdir(result.folder):
+                    folders.add(result.folder)
+                if result.pdf_path != result.target_path and result.target_path not in targets and not os.path.exists(result.target_path):
+                    moves.append({'from': result.pdf_path, 'to': result.target_path})
+                targets.add(result.target_path)
+                if result.paper_id not in planned_ids:
+                    rows['update' if result.paper_id in library_ids else 'insert'] += 1
+                planned_ids.add(result.paper_id)
+                planned.append(paper_infos[result.identify_id])
+                result.status = 'planned'
+                self.Notify(result, 'fetched')
+            for paper_info in planned:
+                paper_links, rewrite_ids = PaperProcessor.PaperLinks(paper_info, library_ids, planned_ids)
+                links.update((link['source_id'], link['citation_id']) for link in paper_links
+                             if citation_graph is None or link['citation_id'] not in citation_graph.GetCitations(link['source_id']))
+                notes.update(rewrite_ids)
+        notes.update(planned_ids)
+        return {
+            'results': results,
+            'moves': moves,
+            'folders': sorted(folders),
+            'rows': rows,
+            'links': len(links),
+            'notes': len(notes)
+        }
+
+    @Metrics.Timed('stage', stage='dedup')
+    def Dispatch(self, fetch_queue:queue.Queue, batch:list):
+        try:
+            duplicates = self.content_index.FindDuplicates([result.pdf_path for result in batch])
+        except Exception as e:
+            print(f"Failed to check duplicated papers: {e}")
+            duplicates = dict()
+        pending = []
+        for result in batch:
+            duplicate = duplicates.get(result.pdf_path)
+            if duplicate:
+                result.Skip(duplicate['paperId'], duplicate['paperPath'])
+                self.Notify(result)
+            else:
+                pending.append(result)
+        if pending:
+            fetch_queue.put(pending)
+
+    def FetchStage(self, fetch_queue:queue.Queue, write_queue:queue.Queue, fs_executor:ThreadPoolExecutor):
+        try:
+            self.FetchBatches(fetch_queue, write_queue, fs_executor)
+        except Exception as e:
+            self.StageFailed(fetch_queue, e)
+        finally:
+            write_queue.put(None)
+
+    def FetchBatches(self, fetch_queue:queue.Queue, write_queue:queue.Queue, fs_executor:ThreadPoolExecutor):
+        while True:
+            batch = fetch_queue.get()
+            if batch is None:
+                break
+            if self.Cancelled():
+                continue
+            try:
+                failures = dict()
+                with Metrics.Span('stage', stage='fetch'):
+                    paper_infos = self.semantic_tool.GetPapersWithListPaperId([result.identify_id for result in batch], failures)
+            except Exception as e:
+                for result in batch:
+                    result.Fail(e)
+                    self.Notify(result)
+                continue
+            moves, fetched = [], []
+            for result in batch:
+                if result.identify_id not in paper_infos:
+                    result.Fail(failures.get(result.identify_id, "Not found"))
+                    self.Notify(result)
+                    continue
+                try:
+                    processor = PaperProcessor(paper_infos[result.identify_id])
+                    target_dir = self.target_dir if self.target_dir is not None else os.path.dirname(result.source_path)
+                    result.paper_id = processor.paperData['paperId']
+                    result.folder = self.PaperFolderName(processor.paperData, target_dir)
+                    result.target_path = os.path.join(result.folder, f"{processor.getPaperId()}.pdf")
+                except Exception as e:
+                    result.Fail(e)
+                    self.Notify(result)
+                    continue
+                if result.pdf_path == result.source_path:
+                    fetched.append(result)
+                self.Notify(result, 'fetched')
+                moves.append((result, processor))
+            self.Record('fetched', fetched)
+            write_queue.put([(result, fs_executor.submit(self.MoveStage, result, processor)) for result, processor in moves])
+
+    @Metrics.Timed('stage', stage='move')
+    def MoveStage(self, result:IngestResult, processor:PaperProcessor):
+        with Metrics.Span('fs_operation', operation='makedirs'):
+            os.makedirs(result.folder, exist_ok=True)
+        processor.StagePaperFolder(result.pdf_path, result.folder)
+        result.content = self.content_index.Describe(result.paper_id, result.target_path)
+        self.Notify(result, 'moved')
+        return processor
+
+    def WriteStage(self, write_queue:queue.Queue, linked:list):
+        try:
+            self.WriteBatches(write_queue, linked)
+        except Exception as e:
+            self.StageFailed(write_queue, e)
+
+    def WriteBatches(self, write_queue:queue.Queue, linked:list):
+        renderer = PaperNoteRenderer('paper_db')
+        renderer.MarkDirty([result.paper_id for result in linked])
+        written = list(linked)
+        while True:
+            moves = write_queue.get()
+            if moves is None:
+                break
+            processors, folder_names, staged = [], [], []
+            for result, future in moves:
+                try:
+                    processors.append(future.result())
+                    folder_names.append(result.folder)
+                    staged.append(result)
+                except Exception as e:
+                    result.Fail(e)
+                    self.Notify(result)
+            self.Record('moved', staged)
+            try:
+                PaperProcessor.BulkIngest(processors, folder_names, renderer)
+            except Exception as e:
+                for result in staged:
+                    result.Fail(e)
+                    self.Notify(result)
+                continue
+            try:
+                self.content_index.Store([result.content for result in staged])
+            except Exception as e:
+                print(f"Failed to record paper file hashes: {e}")
+            for result in staged:
+                result.status = 'success'
+                self.Notify(result, 'linked')
+            self.Record('linked', staged)
+            written.extend(staged)
+        try:
+            renderer.Flush()
+        except Exception as e:
+            print(f"Failed to render paper notes: {e}")
+            return
+        for result in written:
+            self.Notify(result, 'rendered')
+        self.Record('rendered', written)
@@ -0,0 +1,202 @@
+import os, time, threading, multiprocessing, traceback
+from src.utils.job_queue import JobQueue
+
+class JobContext:
+    """Progress and cancellation state of the job a worker process is running."""
+    def __init__(self, job:dict):
+        self.job = job
+        self.total = None
+        self.done = 0
+        self.counts = dict()
+        self.cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def Start(self, total:int):
+        self.total = total
+
+    def Progress(self, status:str):
+        with self._lock:
+            self.done += 1
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def IngestProgress(self):
+        """progress callback for IngestPipeline: counts every file once it reaches a final status."""
+        reported = set()
+        def progress(result):
+            if result.status in ('success', 'failed', 'skipped', 'planned') and result.source_path not in reported:
+                reported.add(result.source_path)
+                self.Progress(result.status)
+        return progress
+
+    def Snapshot(self) -> dict:
+        with self._lock:
+            return {'done': self.done, 'total': self.total, 'counts': dict(self.counts)}
+
+
+class JobWorker:
+    """
+    Runs the jobs of a JobQueue inside one worker process.
+
+    Every job kind maps to a PaperRegister operation. While a job runs, a
+    heartbeat thread stores its progress every `poll_interval` seconds and sets
+    the job's cancel event once the API asked for cancellation; the operations
+    stop at their next safe point (between ingest batches, between folders).
+    Between jobs, workers run `JobQueue.Recover` at most once per heartbeat
+    timeout, so the jobs of a worker that died are queued again without
+    restarting the pool.
+    """
+    REQUIRED = {
+        'register': 'source_dir',
+        'update': 'papers_folder',
+        'clean': 'target_dir',
+    }
+    # the params a job may be submitted with; the PATH_PARAMS ones are checked against the allowed folders
+    PARAMS = {
+        'register': ('source_dir', 'target_dir', 'provider', 'batch_size', 'dry_run'),
+        'update': ('papers_folder', 'provider', 'workers', 'batch_size', 'dry_run'),
+        'clean': ('target_dir', 'delete_related_folder', 'dry_run'),
+    }
+    PATH_PARAMS = ('source_dir', 'target_dir', 'papers_folder')
+
+    def __init__(self, service:str='job_db', poll_interval:float=1.0):
+        self.queue = JobQueue(service)
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+
+    def Run(self, stop_event):
+        last_recover = time.monotonic()
+        while not stop_event.is_set():
+            if time.monotonic() - last_recover >= self.queue.heartbeat_timeout:
+                last_recover = time.monotonic()
+                try:
+                    self.queue.Recover()
+                except Exception as e:
+                    print(f"Failed to recover lost jobs: {e}")
+            job = self.queue.Claim(self.pid)
+            if job is None:
+                stop_event.wait(self.poll_interval)
+                continue
+            self.Execute(job)
+
+    def Execute(self, job:dict):
+        context = JobContext(job)
+        finished = threading.Event()
+        def heartbeat():
+            while not finished.wait(self.poll_interval):
+                if self.queue.Heartbeat(job['jobId'], context.Snapshot()):
+                    context.cancel.set()
+        monitor = threading.Thread(target=heartbeat, name=f"job-heartbeat-{job['jobId'][:8]}", daemon=True)
+        monitor.start()
+        try:
+            if job['kind'] not in JobWorker.REQUIRED:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+            result = getattr(self, f"Run{job['kind'].capitalize()}")(context, job['params'])
+            status, error = self.FinalStatus(context, result), None
+        except Exception as e:
+            print(f"Job {job['jobId']} ({job['kind']}) failed: {e}")
+            result, status, error = None, 'failed', traceback.format_exc()
+        finally:
+            finished.set()
+            monitor.join()
+        self.queue.Finish(job['jobId'], status, context.Snapshot(), result, error)
+        return status
+
+    @staticmethod
+    def FinalStatus(context:JobContext, result:dict) -> str:
+        """'cancelled' only when the cancel request stopped the job early, i.e. it left work pending."""
+        return 'cancelled' if context.cancel.is_set() and result['pending'] else 'succeeded'
+
+    @staticmethod
+    def ListPdfs(folder:str) -> list:
+        return sorted(os.path.join(folder, file_name) for file_name in os.listdir(folder) if file_name.endswith('.pdf'))
+
+    def RunRegister(self, context:JobContext, params:dict) -> dict:
+        from src.component.paper_register import PaperRegister
+        from src.utils.ingest_journal import IngestJournal
+        source_dir = os.path.abspath(params['source_dir'])
+        target_dir = os.path.abspath(params.get('target_dir') or source_dir)
+        file_paths = self.ListPdfs(source_dir)
+        context.Start(len(file_paths))
+        journal = IngestJournal(IngestJournal.JobKey('register', source_dir, target_dir))
+        res = PaperRegister(params.get('provider')).RegisterFiles(file_paths, target_dir, context.IngestProgress(), batch_size=params.get('batch_size', 100),
+                                                                  journal=journal, dry_run=params.get('dry_run', False), cancel=context.cancel)
+        return self.Summary(res)
+
+    def RunUpdate(self, context:JobContext, params:dict) -> dict:
+        from src.component.paper_register import PaperRegister
+        papers_folder = os.path.abspath(params['papers_folder'])
+        context.Start(sum(1 for entry in os.scandir(papers_folder) if entry.is_dir()))
+        def progress(paper_folder, error):
+            context.Progress('failed' if error else 'success')
+        res = PaperRegister(params.get('provider')).UpdatePaperinformationInFolder(papers_folder, workers=params.get('workers', 1), progress=progress,
+                                                                                  dry_run=params.get('dry_run', False), batch_size=params.get('batch_size', 100), cancel=context.cancel)
+        return self.Summary(res)
+
+    def RunClean(self, context:JobContext, params:dict) -> dict:
+        from src.component.paper_register import PaperRegister
+        target_dir = os.path.abspath(params['target_dir'])
+        res = PaperRegister().CleanPapersFolder(target_dir, params.get('delete_related_folder', False), dry_run=params.get('dry_run', False), cancel=context.cancel)
+        for move in res['moves']:
+            context.Progress('moved')
+        return {'moves': len(res['moves']), 'deleted': res['deleted'], 'pending': len(res['pending'])}
+
+    @staticmethod
+    def Summary(res:dict) -> dict:
+        summary = {key: len(res.get(key, [])) for key in ('success', 'skipped', 'pending')}
+        failed = {result.source_path: result.error for result in res.get('results', []) if result.status == 'failed'}
+        summary['failed'] = failed or {path: None for path in res['failed']}
+        if 'plan' in res:
+            summary['plan'] = dict(res['plan'], moves=len(res['plan']['moves']), folders=len(res['plan']['folders']))
+        return summary
+
+
+def RunJobWorker(service:str, poll_interval:float, stop_event):
+    """Entry point of a worker process."""
+    try:
+        JobWorker(service, poll_interval).Run(stop_event)
+    except KeyboardInterrupt:
+        pass
+
+
+class JobWorkerPool:
+    """
+    The worker processes of a JobQueue, shared per service like the other
+    registries. Workers are spawned (not forked) so they never inherit the
+    server's threads or SQLite connections. PAPER_JOB_WORKERS sets the number
+    of processes; 0 leaves the jobs to a separate `papercollector worker`.
+    """
+    pools = {}
+    _lock = threading.Lock()
+
+    def __init__(self, service:str='job_db', workers:int=None, poll_interval:float=1.0):
+        self.service = service
+        self.workers = workers if workers is not None else int(os.environ.get('PAPER_JOB_WORKERS', 2))
+        self.poll_interval = poll_interval
+        self.context = multiprocessing.get_context('spawn')
+        self.stop_event = self.context.Event()
+        self.processes = []
+
+    @classmethod
+    def ForService(cls, service:str='job_db'):
+        with cls._lock:
+            if service not in cls.pools:
+                cls.pools[service] = cls(service).Start()
+            return cls.pools[service]
+
+    def Start(self):
+        JobQueue(self.service).Recover()
+        for index in range(self.workers):
+            process = self.context.Process(target=RunJobWorker, args=(self.service, self.poll_interval, self.stop_event),
+                                           name=f"{self.service}-worker-{index}", daemon=True)
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def Stop(self, timeout:float=None):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+
+    def Wait(self):
+        for process in self.processes:
+            process.join()
@@ -1,40 +1,117 @@
-import os
+import sys
 
-class OpenAlexToolInfo:
-    def __init__(self, apiData:dict):
-        self.requestJsonData = apiData
 
-    def __dict__(self):
-        return self.requestJsonData
+class PaperRecord:
+    """
+    Paper metadata parsed once from a provider payload.
+
+    Fields are stored in slots, repeated strings (dates, fields of study, id
+    types and the citation/reference ids shared between papers) are interned,
+    and citations/references are kept as tuples of paper ids with their titles
+    alongside. `get_data` builds the dict form on demand instead of keeping the
+    payload around.
+    """
+    __slots__ = ('paperId', 'identifyId', 'title', 'authors', 'publicationDate', 'citationCount', 'url', 'fieldsOfStudy', 'externalIds', 'citation_ids', 'reference_ids', 'citation_titles', 'reference_titles')
+
+    def __init__(self, paperId:str, title:str=None, authors:str="", publicationDate:str=None, citationCount:int=None, url:str=None,
+                 fieldsOfStudy:str="", externalIds:dict=None, citation_ids:tuple=(), reference_ids:tuple=(), identifyId:str=None,
+                 citation_titles:tuple=(), reference_titles:tuple=()):
+        self.paperId = sys.intern(paperId) if paperId else paperId
+        self.identifyId = identifyId
+        self.title = title
+        self.authors = authors
+        self.publicationDate = sys.intern(publicationDate) if publicationDate else publicationDate
+        self.citationCount = citationCount
+        self.url = url
+        self.fieldsOfStudy = sys.intern(fieldsOfStudy) if fieldsOfStudy else ""
+        self.externalIds = tuple((sys.intern(key), value) for key, value in (externalIds or {}).items())
+        self.citation_ids = citation_ids
+        self.reference_ids = reference_ids
+        self.citation_titles = citation_titles
+        self.reference_titles = reference_titles
+
+    @staticmethod
+    def InternIds(items) -> tuple:
+        return tuple(sys.intern(item['paperId']) for item in items or () if item and item.get('paperId'))
+
+    @staticmethod
+    def Titles(items) -> tuple:
+        """The titles aligned with InternIds(items)."""
+        return tuple(item.get('title') for item in items or () if item and item.get('paperId'))
+
+    @staticmethod
+    def Links(paper_ids:tuple, titles:tuple) -> list:
+        titles = titles or (None,) * len(paper_ids)
+        return [{'paperId': paper_id, 'title': title} for paper_id, title in zip(paper_ids, titles)]
+
+    @staticmethod
+    def JoinNames(items, key:str=None) -> str:
+        if not items:
+            return ""
+        return ','.join(item[key] if key else item for item in items)
+
+    def to_dict(self, include_links:bool=False) -> dict:
+        data = {
+            'paperId': self.paperId,
+            'externalIds': dict(self.externalIds),
+            'url': self.url,
+            'title': self.title,
+            'citationCount': self.citationCount,
+            'fieldsOfStudy': self.fieldsOfStudy,
+            'publicationDate': self.publicationDate,
+            'authors': self.authors
+        }
+        if self.identifyId is not None:
+            data['identifyId'] = self.identifyId
+        if include_links:
+            data['citations'] = self.Links(self.citation_ids, self.citation_titles)
+            data['references'] = self.Links(self.reference_ids, self.reference_titles)
+        return data
 
     def get_data(self) -> dict:
-        return self.preprocessing()
-    
-    def preprocessing(self) -> dict:
-        requestData = dict()
-        requestData.update(self.requestJsonData)
-        if 'authorships' in requestData:
-            requestData['authorships'] = ','.join([author['author']['display_name'] for author in requestData['authorships']])
-        if 'fieldsOfStudy' in requestData:
-            requestData['fieldsOfStudy'] = ','.join([field for field in requestData['fieldsOfStudy'] ]) if requestData['fieldsOfStudy'] else ""
-        return requestData
-    
-
-class SemanticScholarInfo:
+        return self.to_dict(include_links=True)
+
+
+class OpenAlexToolInfo(PaperRecord):
+    __slots__ = ()
+
     def __init__(self, apiData:dict):
-        self.requestJsonData = apiData
+        authors = apiData.get('authors')
+        if authors is None and 'authorships' in apiData:
+            authors = [{'name': author['author']['display_name']} for author in apiData['authorships']]
+        super().__init__(
+            apiData.get('paperId') or apiData.get('id'),
+            title=apiData.get('title') or apiData.get('display_name'),
+            authors=self.JoinNames(authors, 'name'),
+            publicationDate=apiData.get('publicationDate') or apiData.get('publication_date'),
+            citationCount=apiData.get('citationCount', apiData.get('cited_by_count')),
+            url=apiData.get('url'),
+            fieldsOfStudy=self.JoinNames(apiData.get('fieldsOfStudy')),
+            externalIds=apiData.get('externalIds') or apiData.get('ids'),
+            citation_ids=self.InternIds(apiData.get('citations')),
+            reference_ids=self.InternIds(apiData.get('references')),
+            identifyId=apiData.get('identifyId'),
+            citation_titles=self.Titles(apiData.get('citations')),
+            reference_titles=self.Titles(apiData.get('references'))
+        )
 
-    def __dict__(self):
-        return self.requestJsonData
 
-    def get_data(self) -> dict:
-        return self.preprocessing()
-    
-    def preprocessing(self) -> dict:
-        requestData = dict()
-        requestData.update(self.requestJsonData)
-        if 'authors' in requestData:
-            requestData['authors'] = ','.join([author['name'] for author in requestData['authors']])
-        if 'fieldsOfStudy' in requestData:
-            requestData['fieldsOfStudy'] = ','.join([field for field in requestData['fieldsOfStudy'] ]) if requestData['fieldsOfStudy'] else ""
-        return requestData
\ No newline at end of file
+class SemanticScholarInfo(PaperRecord):
+    __slots__ = ()
+
+    def __init__(self, apiData:dict):
+        super().__init__(
+            apiData.get('paperId'),
+            title=apiData.get('title'),
+            authors=self.JoinNames(apiData.get('authors'), 'name'),
+            publicationDate=apiData.get('publicationDate'),
+            citationCount=apiData.get('citationCount'),
+            url=apiData.get('url'),
+            fieldsOfStudy=self.JoinNames(apiData.get('fieldsOfStudy')),
+            externalIds=apiData.get('externalIds'),
+            citation_ids=self.InternIds(apiData.get('citations')),
+            reference_ids=self.InternIds(apiData.get('references')),
+            identifyId=apiData.get('identifyId'),
+            citation_titles=self.Titles(apiData.get('citations')),
+            reference_titles=self.Titles(apiData.get('references'))
+        )
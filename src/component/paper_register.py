@@ -1,45 +1,54 @@
-import os , sys, datetime, shutil, json, re
-from utils.dao import SemanticScholarTool, PaperProcessor
-from component.paper_info import SemanticScholarInfo
+import os , sys, datetime, shutil, json, re, threading
+from src.utils.dao import MetadataProvider, PaperProcessor
+from src.utils.note_renderer import PaperNoteRenderer
+from src.utils.ingest_journal import IngestJournal
+from src.component.paper_info import SemanticScholarInfo
+from src.component.ingest_pipeline import IngestPipeline
 
 
 
 class PaperRegister:
-    def __init__(self):
-        self.semantic_tool = SemanticScholarTool()
-        pass
+    def __init__(self, provider:str=None):
+        self.provider = provider
+        self._semantic_tool = None
 
-    def RegisterWithPapersFolder(self, source_dir, target_dir:str=None):
-        file_names:list[str] = [file for file in os.listdir(source_dir) if file.endswith('.pdf')]
-        identify_ids:list[str] = [file_name.rsplit('.pdf', 1)[0] for file_name in file_names]
-        paper_infos = self.semantic_tool.GetPapersWithListPaperId(identify_ids)
+    @property
+    def semantic_tool(self) -> MetadataProvider:
+        # built on first lookup so commands that never reach the provider skip its client and cache
+        if self._semantic_tool is None:
+            self._semantic_tool = MetadataProvider.ForName(self.provider)
+        return self._semantic_tool
+
+    def RegisterWithPapersFolder(self, source_dir, target_dir:str=None, progress=None):
+        file_paths:list[str] = [os.path.join(source_dir, file) for file in os.listdir(source_dir) if file.endswith('.pdf')]
         if target_dir is None:
             target_dir = source_dir
-        res = {'success':[], 'failed':[]}
-        for file_name in file_names:
-            identify_id = file_name.rsplit('.pdf', 1)[0]
-            if identify_id in paper_infos:
-                try:
-                    paper_info:SemanticScholarInfo = paper_infos[identify_id]
-                    processor = PaperProcessor(paper_info)
-                    paper_data = paper_info.get_data()
-                    publication_date = datetime.datetime.strptime(paper_data['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_data['publicationDate'] else "Null"
-                    paper_title = paper_data['title'].replace("?", "").replace(":", "")
-                    folder_name = os.path.join(target_dir, f"{publication_date} {paper_title}")
-                    os.makedirs(folder_name, exist_ok=True)
-                    processor.CreateNewPaperFolder(os.path.join(source_dir, file_name), folder_name)
-                    res['success'].append(folder_name)
-                except:
-                    res['failed'].append(os.path.join(source_dir, file_name))
+        journal = IngestJournal(IngestJournal.JobKey('register', os.path.abspath(source_dir), os.path.abspath(target_dir)))
+        return self.RegisterFiles(file_paths, target_dir, progress, journal=journal)
+
+    def RegisterFiles(self, file_paths:list, target_dir:str, progress=None, batch_size:int=100, fs_workers:int=8, journal:IngestJournal=None, dry_run:bool=False, cancel=None):
+        pipeline = IngestPipeline(self.semantic_tool, target_dir, batch_size=batch_size, fs_workers=fs_workers, progress=progress, journal=journal, cancel=cancel)
+        plan = pipeline.Plan(file_paths) if dry_run else None
+        results = plan['results'] if dry_run else pipeline.Run(file_paths)
+        res = {'success':[], 'failed':[], 'skipped':[], 'pending':[], 'results':results}
+        for result in results:
+            if result.status in ('success', 'planned'):
+                res['success'].append(result.folder)
+            elif result.status == 'skipped':
+                res['skipped'].append(result.source_path)
+            elif result.status == 'pending':
+                res['pending'].append(result.source_path)
             else:
-                res['failed'].append(os.path.join(source_dir, file_name))
+                res['failed'].append(result.source_path)
+        if dry_run:
+            res['plan'] = {key: value for key, value in plan.items() if key != 'results'}
         return res
 
 
     def RegisterWithPaperInfo(self, paper_info:SemanticScholarInfo, paper_path, target_dir:str=None):
         try:
             processor = PaperProcessor(paper_info)
-            paper_data = paper_info.get_data()
+            paper_data = paper_info.to_dict()
             publication_date = datetime.datetime.strptime(paper_data['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_data['publicationDate'] else "Null"
             paper_title = paper_data['title'].replace("?", "").replace(":", "")
             target_folder_name = os.path.join(target_dir, f"{publication_date} {paper_title}")
@@ -54,8 +63,10 @@ class PaperRegister:
         file_name = paper_path.rsplit('\\', 1)[-1].rsplit('/', 1)[-1]
         if file_name.endswith('.pdf'):
             paper_info = self.semantic_tool.SearchPaperWithKeyword(title)
+            if paper_info is None:
+                return None
             processor = PaperProcessor(paper_info)
-            paper_data = paper_info.get_data()
+            paper_data = paper_info.to_dict()
             publication_date = datetime.datetime.strptime(paper_data['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_data['publicationDate'] else "Null"
             paper_title = paper_data['title'].replace("?", "").replace(":", "")
             target_folder_name = os.path.join(target_dir, f"{publication_date} {paper_title}")
@@ -73,7 +84,7 @@ class PaperRegister:
             paper_id = AssignPaperId(doi)
             paper_info = self.semantic_tool.GetPaperFromPaperId(paper_id)
             processor = PaperProcessor(paper_info)
-            paper_data = paper_info.get_data()
+            paper_data = paper_info.to_dict()
             publication_date = datetime.datetime.strptime(paper_data['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_data['publicationDate'] else "Null"
             paper_title = paper_data['title'].replace("?", "").replace(":", "")
             target_folder_name = os.path.join(target_dir, f"{publication_date} {paper_title}")
@@ -84,7 +95,7 @@ class PaperRegister:
             return None
         
 
-    def RegisterWithPaperId(self, paper_path:str, target_dir:str, identity_id = None):
+    def RegisterWithPaperId(self, paper_path:str, target_dir:str, identity_id = None, renderer:PaperNoteRenderer=None):
         def AssignPaperId(identity_id):
             if len(identity_id)<11:
                 paper_id = f"ArXiv:{identity_id}"
@@ -98,62 +109,86 @@ class PaperRegister:
             paper_id = AssignPaperId(identity_id)
             paper_info = self.semantic_tool.GetPaperFromPaperId(paper_id)
             processor = PaperProcessor(paper_info)
-            paper_data = paper_info.get_data()
+            paper_data = paper_info.to_dict()
             publication_date = datetime.datetime.strptime(paper_data['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_data['publicationDate'] else "Null"
             paper_title = paper_data['title'].replace("?", "").replace(":", "")
             target_folder_name = os.path.join(target_dir, f"{publication_date} {paper_title}")
             os.makedirs(target_folder_name, exist_ok=True)
-            processor.CreateNewPaperFolder(os.path.join(paper_path), target_folder_name)
+            processor.CreateNewPaperFolder(os.path.join(paper_path), target_folder_name, renderer)
             return target_folder_name
         else:
             return None
 
-    def CleanPapersFolder(self, target_dir, delete_related_folder=False):
-        folders:list = os.listdir(target_dir)
-        if os.path.exists(os.path.join(target_dir, ".temp")):
-            folders.pop(".temp")
-        else:
-            os.makedirs(os.path.join(target_dir, ".temp"))
+    def CleanPapersFolder(self, target_dir, delete_related_folder=False, dry_run:bool=False, cancel=None):
+        """Setting the `cancel` event stops between folders; the moves left undone are returned in 'pending'."""
         temp_dir = os.path.join(target_dir, ".temp")
-        for folder in folders:
+        folders = []
+        for folder in os.listdir(target_dir):
             folder_path = os.path.join(target_dir, folder)
-            if os.path.isdir(folder_path):
-                for file in os.listdir(folder_path):
-                    if file.endswith(".pdf"):
-                        paper_path = os.path.join(folder_path, file)
-                        os.rename(paper_path, os.path.join(temp_dir, file))
+            if folder == ".temp" or not os.path.isdir(folder_path):
+                continue
+            folders.append((folder_path, [{'from': os.path.join(folder_path, file), 'to': os.path.join(temp_dir, file)}
+                                          for file in os.listdir(folder_path) if file.endswith(".pdf")]))
+        if not dry_run:
+            os.makedirs(temp_dir, exist_ok=True)
+        moves, deleted, pending = [], [], []
+        for folder_path, folder_moves in folders:
+            if not dry_run and cancel is not None and cancel.is_set():
+                pending.extend(folder_moves)
+                continue
+            if not dry_run:
+                for move in folder_moves:
+                    os.rename(move['from'], move['to'])
                 if delete_related_folder:
                     shutil.rmtree(folder_path)
+            moves.extend(folder_moves)
+            if delete_related_folder:
+                deleted.append(folder_path)
+        return {'moves': moves, 'deleted': deleted, 'pending': pending}
             
     def UpdatePaperInformation(self, target_dir:str):
-        if os.path.isdir(target_dir):
-            paper_dir = target_dir
-        else:
-            paper_dir = os.path.dirname(target_dir)
-        if 'config.json' in os.listdir(paper_dir):
-            with open(os.path.join(paper_dir, 'config.json'), 'r') as fp:
-                paper_config =  json.load(fp)
-            try:
-                if os.path.dirname(paper_config['location']) != target_dir:
-                    identify_id = paper_config['identifyId']
-                    paper_path = os.path.join(target_dir, f"{identify_id}.pdf")
-                    if not os.path.exists(paper_path):
-                        raise FileNotFoundError('Wrong folder format.')
-                    self.RegisterWithPaperId(paper_path, os.path.dirname(target_dir))
-            except KeyError as key_e:
-                print(f"The format in [{paper_dir}]'s config is wrong")
-                for file_name in os.listdir(target_dir):
-                    if os.path.join(target_dir, file_name).endswith('.pdf'):
-                        self.RegisterWithPaperId(os.path.join(target_dir, file_name), os.path.dirname(target_dir))
-        else:
-            for file_name in os.listdir(target_dir):
-                if os.path.join(target_dir, file_name).endswith('.pdf'):
-                    self.RegisterWithPaperId(os.path.join(target_dir, file_name), os.path.dirname(target_dir))
-    
-    def UpdatePaperinformationInFolder(self, papers_folder:str):
+        paper_dir = target_dir if os.path.isdir(target_dir) else os.path.dirname(target_dir)
+        return self.RegisterFiles(self.PaperFolderFiles(paper_dir), os.path.dirname(paper_dir))
+
+    def UpdatePaperinformationInFolder(self, papers_folder:str, workers:int=1, progress=None, dry_run:bool=False, batch_size:int=100, cancel=None):
+        """
+        Refresh the metadata of every paper folder in `papers_folder`. The PDFs
+        picked by `PaperFolderFiles` go through the ingest pipeline, whose plan is
+        the dry run, so both resolve the same ids and place the papers the same
+        way; `workers` sizes the pipeline's filesystem pool.
+        `progress(paper_folder, error)` is called once per PDF when it is done.
+        Setting the `cancel` event leaves the PDFs not looked up yet in 'pending'.
+        """
+        journal = IngestJournal(IngestJournal.JobKey('update', os.path.abspath(papers_folder)))
+        reported, lock = set(), threading.Lock()
+        def folder_progress(result):
+            if not progress or result.status == 'pending' or (result.status == 'success' and result.stage not in ('linked', 'rendered')):
+                return
+            with lock:
+                if result.source_path in reported:
+                    return
+                reported.add(result.source_path)
+            progress(os.path.dirname(result.source_path), result.error)
+        return self.RegisterFiles(self.UpdateFiles(papers_folder), papers_folder, folder_progress, batch_size=batch_size, fs_workers=max(workers, 1),
+                                  journal=journal, dry_run=dry_run, cancel=cancel)
+
+    @staticmethod
+    def UpdateFiles(papers_folder:str) -> list:
+        file_paths = []
         for folder in os.listdir(papers_folder):
-            if os.path.isdir(os.path.join(papers_folder, folder)):
-                paper_folder = os.path.join(papers_folder, folder)
-                self.UpdatePaperInformation(paper_folder)
-            
+            paper_folder = os.path.join(papers_folder, folder)
+            if os.path.isdir(paper_folder):
+                file_paths.extend(PaperRegister.PaperFolderFiles(paper_folder))
+        return file_paths
 
+    @staticmethod
+    def PaperFolderFiles(paper_folder:str) -> list:
+        """The PDFs an update re-registers: the configured paper, or every PDF of a folder without a readable config."""
+        try:
+            with open(os.path.join(paper_folder, 'config.json'), 'r') as fp:
+                paper_path = os.path.join(paper_folder, f"{json.load(fp)['identifyId']}.pdf")
+            if os.path.exists(paper_path):
+                return [paper_path]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return [os.path.join(paper_folder, file_name) for file_name in os.listdir(paper_folder) if file_name.endswith('.pdf')]
@@ -1,73 +1,311 @@
 import os , sys, datetime, shutil, json, re
-from src.utils.dao import SemanticScholarTool, PaperProcessor
-from src.component.paper_info import SemanticScholarInfo
+import asyncio, threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from src.utils.dao import MetadataProvider, PaperProcessor
+from src.utils.local_search import LocalSearchIndex
+from src.utils.content_index import PdfContentIndex
+from src.utils.graph_analytics import CitationGraphAnalytics
+from src.utils.citation_graph import CitationGraphIndex
+from src.utils.paper_rows import PaperRowStore
+from src.utils.metrics import Metrics
+from src.component.paper_info import SemanticScholarInfo, PaperRecord
 
 import env as paper_env
 
 class SearchEngine:
-    semantic_tool = SemanticScholarTool()
+    def __init__(self, provider:str=None):
+        self.provider = provider
+        self._semantic_tool = None
+
+    @property
+    def semantic_tool(self) -> MetadataProvider:
+        if self._semantic_tool is None:
+            self._semantic_tool = MetadataProvider.ForName(self.provider)
+        return self._semantic_tool
+
     def SearchWithPaperIds(self, paper_ids):
-        paper_infos = self.semantic_tool.GetPapersWithListPaperId(paper_ids)
+        failures = dict()
+        paper_infos = self.semantic_tool.GetPapersWithListPaperId(paper_ids, failures)
         res = {'success':{}, 'failed':{}}
         for paper_id in paper_ids:
             if paper_id in paper_infos:
                 paper_info:SemanticScholarInfo = paper_infos[paper_id]
                 res['success'].update(self.__dealWithPaperInfo(paper_id, paper_info))
             else:
-                res['failed'][paper_id] = {}
+                res['failed'][paper_id] = {'reason': failures.get(paper_id, "Not found")}
         return res
 
+    def IterSearchWithPaperIds(self, paper_ids):
+        """Yield ('success', paper_id, data) as chunks resolve, then one ('failed', failures, None) entry."""
+        failures = dict()
+        found_ids = set()
+        for found, failed in self.semantic_tool.IterPapersWithListPaperId(paper_ids):
+            for paper_id, paper_info in found.items():
+                found_ids.add(paper_id)
+                yield 'success', paper_id, paper_info.get_data()
+            failures.update(failed)
+        failed_ids = {paper_id: {'reason': failures.get(paper_id, "Not found")} for paper_id in dict.fromkeys(paper_ids) if paper_id not in found_ids}
+        yield 'failed', failed_ids, None
+
     def SearchWithPapersFolder(self, source_dir):
         file_names:list[str] = [file for file in os.listdir(source_dir) if file.endswith('.pdf')]
-        identity_ids:list[str] = [file_name.rsplit('.pdf', 1)[0] for file_name in file_names]
-        paper_infos = self.semantic_tool.GetPapersWithListPaperId(identity_ids)
-        res = {'success':{}, 'failed':{}}
+        duplicates = PdfContentIndex('paper_db').FindDuplicates([os.path.join(source_dir, file_name) for file_name in file_names])
+        res = {'success':{}, 'failed':{}, 'duplicate':{}}
+        identity_ids:list[str] = []
         for file_name in file_names:
             identity_id = file_name.rsplit('.pdf', 1)[0]
+            duplicate = duplicates.get(os.path.join(source_dir, file_name))
+            if duplicate:
+                res['duplicate'][identity_id] = duplicate
+            else:
+                identity_ids.append(identity_id)
+        failures = dict()
+        paper_infos = self.semantic_tool.GetPapersWithListPaperId(identity_ids, failures) if identity_ids else dict()
+        for identity_id in identity_ids:
             if identity_id in paper_infos:
                 paper_info:SemanticScholarInfo = paper_infos[identity_id]
                 res['success'].update(self.__dealWithPaperInfo(identity_id, paper_info))
             else:
-                res['failed'][identity_id] = {}
+                res['failed'][identity_id] = {'reason': failures.get(identity_id, "Not found")}
         return res
     
-    def SearchWithTitle(self, paper_path:str, title:str):
+    @staticmethod
+    def IdentityFromPath(paper_path:str):
         file_name = paper_path.rsplit('\\', 1)[-1].rsplit('/', 1)[-1]
         if not file_name.endswith('.pdf'):
             return None
-        identity_id = file_name.rsplit('.pdf', 1)[0]
+        return file_name.rsplit('.pdf', 1)[0]
+
+    @staticmethod
+    def AssignPaperId(identity_id:str):
+        if len(identity_id)<11:
+            paper_id = f"ArXiv:{identity_id}"
+        else:
+            paper_id = identity_id
+        return paper_id
+
+    def GetPaperData(self, paper_id:str):
+        paper_info = self.semantic_tool.GetPaperFromPaperId(paper_id)
+        return paper_info.get_data() if paper_info else None
+
+    def GetPaperDataByTitle(self, title:str):
+        PaperProcessor.CreateOrIgnorePaperTable()
+        local_paper = LocalSearchIndex('paper_db').FindByTitle(title)
+        if local_paper:
+            return self.LibraryPaperData(local_paper)
         paper_info = self.semantic_tool.SearchPaperWithKeyword(title)
-        return self.__dealWithPaperInfo(identity_id, paper_info)
+        return paper_info.get_data() if paper_info else None
+
+    @staticmethod
+    def LibraryPaperData(row:dict) -> dict:
+        """The provider payload shape (get_data) of a library row, links taken from the citation graph."""
+        citation_graph = CitationGraphIndex.ForService('paper_db')
+        paper_id = row['paperId']
+        citation_ids = tuple(citation_graph.GetCitations(paper_id))
+        reference_ids = tuple(citation_graph.GetReferences(paper_id))
+        titles = {linked_id: linked_row['title'] for linked_id, linked_row in PaperRowStore('paper_db', ['paperId', 'title']).Load(citation_ids + reference_ids).items()}
+        paper_info = PaperRecord(
+            paper_id,
+            title=row['title'],
+            authors=row['authors'],
+            publicationDate=row['publicationDate'],
+            citationCount=row['citationCount'],
+            url=row['url'],
+            fieldsOfStudy=row['fieldsOfStudy'],
+            # identifyId is the ArXiv id whenever the paper has one
+            externalIds={'ArXiv': row['identifyId']} if row['identifyId'] != paper_id else {},
+            citation_ids=citation_ids,
+            reference_ids=reference_ids,
+            citation_titles=tuple(titles.get(citation_id) for citation_id in citation_ids),
+            reference_titles=tuple(titles.get(reference_id) for reference_id in reference_ids)
+        )
+        return paper_info.get_data()
+
+    def SearchWithTitle(self, paper_path:str, title:str):
+        identity_id = self.IdentityFromPath(paper_path)
+        if identity_id is None:
+            return None
+        paper_data = self.GetPaperDataByTitle(title)
+        return {identity_id: paper_data} if paper_data else None
+
+    def SearchInLibrary(self, query:str, page:int=1, page_size:int=20):
+        PaperProcessor.CreateOrIgnorePaperTable()
+        page, page_size = max(page, 1), max(page_size, 1)
+        res = LocalSearchIndex('paper_db').Search(query, limit=page_size, offset=(page-1)*page_size)
+        res.update({'page': page, 'pageSize': page_size})
+        return res
     
     
+    def CentralPapers(self, limit:int=20, offset:int=0):
+        PaperProcessor.CreateOrIgnorePaperTable()
+        return CitationGraphAnalytics.ForService('paper_db').Central(limit, offset)
+
+    def SimilarPapers(self, paper_id:str, limit:int=20):
+        PaperProcessor.CreateOrIgnorePaperTable()
+        return CitationGraphAnalytics.ForService('paper_db').Similar(paper_id, limit)
+
+    def PaperNeighbourhood(self, paper_id:str, depth:int=1, direction:str='both', max_fanout:int=50, max_nodes:int=500, library_only:bool=False):
+        PaperProcessor.CreateOrIgnorePaperTable()
+        citation_graph = CitationGraphIndex.ForService('paper_db')
+        hops, edges, truncated = citation_graph.Neighbourhood(paper_id, depth, direction, max_fanout, max_nodes, library_only)
+        if not hops:
+            return None
+        rows = PaperRowStore('paper_db', ['paperId', 'identifyId', 'title', 'publicationDate', 'citationCount']).Load(hops)
+        nodes = []
+        for node_id, hop in hops.items():
+            node = {'paperId': node_id, 'depth': hop, 'inLibrary': node_id in rows}
+            if node_id in rows:
+                node.update({key: rows[node_id][key] for key in ('identifyId', 'title', 'publicationDate', 'citationCount')})
+            nodes.append(node)
+        return {
+            'nodes': nodes,
+            'edges': [{'sourceId': source_id, 'citationId': citation_id} for source_id, citation_id in edges],
+            'truncated': truncated
+        }
+
     def SearchWithDoi(self, paper_path:str, doi:str):
-        def AssignPaperId(doi):
-            return f"DOI:{doi}"
-        file_name = paper_path.rsplit('\\', 1)[-1].rsplit('/', 1)[-1]
-        if not file_name.endswith('.pdf'):
+        identity_id = self.IdentityFromPath(paper_path)
+        if identity_id is None:
             return None
-        paper_id = AssignPaperId(doi)
-        identity_id = file_name.rsplit('.pdf', 1)[0]
-        paper_info = self.semantic_tool.GetPaperFromPaperId(paper_id)
-        return self.__dealWithPaperInfo(identity_id, paper_info)
+        paper_data = self.GetPaperData(f"DOI:{doi}")
+        return {identity_id: paper_data} if paper_data else None
         
     def SearchWithPaperId(self, paper_path:str, identity_id = None):
-        def AssignPaperId(identity_id):
-            if len(identity_id)<11:
-                paper_id = f"ArXiv:{identity_id}"
-            else:
-                paper_id = identity_id
-            return paper_id 
-        file_name = paper_path.rsplit('\\', 1)[-1].rsplit('/', 1)[-1]
-        if not file_name.endswith('.pdf'):
+        file_identity_id = self.IdentityFromPath(paper_path)
+        if file_identity_id is None:
             return None
-        paper_id = AssignPaperId(identity_id)
-        paper_info = self.semantic_tool.GetPaperFromPaperId(paper_id)
-        return self.__dealWithPaperInfo(identity_id, paper_info)
+        identity_id = identity_id or file_identity_id
+        paper_data = self.GetPaperData(self.AssignPaperId(identity_id))
+        return {identity_id: paper_data} if paper_data else None
 
-    def __dealWithPaperInfo(file_name, paper_info:SemanticScholarInfo):
+    def __dealWithPaperInfo(self, file_name, paper_info:SemanticScholarInfo):
         if not paper_info:
             return None
         paper_data = paper_info.get_data()
         return {file_name:paper_data}
-    
+
+
+class AsyncSearchEngine:
+    """
+    Awaitable facade over SearchEngine for the async API views.
+
+    Blocking lookups run on one process wide thread pool of `max_concurrency`
+    threads, which bounds how many of them reach the upstream provider at once
+    whatever event loop the request runs on (one per request under WSGI, one
+    per process under ASGI). Concurrent requests for the same paper id, DOI or
+    title share one in-flight lookup through a lock guarded table of
+    concurrent.futures futures, which any loop or thread can wait on.
+    """
+    def __init__(self, search_engine:SearchEngine=None, max_concurrency:int=32):
+        self.search_engine = search_engine if search_engine is not None else SearchEngine()
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='search-engine')
+        self.inflight = dict()
+        self._lock = threading.Lock()
+
+    async def Call(self, func, *args):
+        return await asyncio.wrap_future(self.executor.submit(Metrics.Bind(func), *args))
+
+    def Release(self, key, future):
+        with self._lock:
+            if self.inflight.get(key) is future:
+                self.inflight.pop(key)
+
+    def InflightFuture(self, key, func, *args) -> Future:
+        with self._lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                return future
+            future = self.inflight[key] = self.executor.submit(Metrics.Bind(func), *args)
+        future.add_done_callback(lambda done: self.Release(key, done))
+        return future
+
+    async def Coalesce(self, key, func, *args):
+        # shield: a disconnecting client must not cancel the lookup other requests wait on
+        return await asyncio.shield(asyncio.wrap_future(self.InflightFuture(key, func, *args)))
+
+    async def SearchWithPaperIds(self, paper_ids):
+        futures, new_futures = dict(), dict()
+        with self._lock:
+            for paper_id in dict.fromkeys(paper_ids):
+                key = ('paperIds', paper_id)
+                if key not in self.inflight:
+                    self.inflight[key] = new_futures[paper_id] = Future()
+                futures[paper_id] = self.inflight[key]
+        if new_futures:
+            self.executor.submit(Metrics.Bind(self.ResolvePaperIds), new_futures)
+        results = await asyncio.gather(*[asyncio.shield(asyncio.wrap_future(future)) for future in futures.values()])
+        res = {'success':{}, 'failed':{}}
+        for paper_id, (status, paper_data) in zip(futures, results):
+            res[status][paper_id] = paper_data
+        return res
+
+    def ResolvePaperIds(self, new_futures:dict):
+        try:
+            res = self.search_engine.SearchWithPaperIds(list(new_futures))
+            for paper_id, future in new_futures.items():
+                if paper_id in res['success']:
+                    future.set_result(('success', res['success'][paper_id]))
+                else:
+                    future.set_result(('failed', res['failed'].get(paper_id, {})))
+        except Exception as e:
+            for future in new_futures.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for paper_id, future in new_futures.items():
+                self.Release(('paperIds', paper_id), future)
+
+    async def IterSearchWithPaperIds(self, paper_ids):
+        iterator = self.search_engine.IterSearchWithPaperIds(paper_ids)
+        while True:
+            item = await self.Call(next, iterator, None)
+            if item is None:
+                break
+            yield item
+
+    def IterSearchWithPaperIdsBlocking(self, paper_ids):
+        """Synchronous IterSearchWithPaperIds for WSGI streaming responses; every step still runs on the shared pool."""
+        iterator = self.search_engine.IterSearchWithPaperIds(paper_ids)
+        while True:
+            item = self.executor.submit(Metrics.Bind(next), iterator, None).result()
+            if item is None:
+                break
+            yield item
+
+    async def SearchWithTitle(self, paper_path:str, title:str):
+        identity_id = SearchEngine.IdentityFromPath(paper_path)
+        if identity_id is None:
+            return None
+        paper_data = await self.Coalesce(('title', ' '.join(title.lower().split())), self.search_engine.GetPaperDataByTitle, title)
+        return {identity_id: paper_data} if paper_data else None
+
+    async def SearchWithDoi(self, paper_path:str, doi:str):
+        identity_id = SearchEngine.IdentityFromPath(paper_path)
+        if identity_id is None:
+            return None
+        paper_id = f"DOI:{doi}"
+        paper_data = await self.Coalesce(('paperId', paper_id), self.search_engine.GetPaperData, paper_id)
+        return {identity_id: paper_data} if paper_data else None
+
+    async def SearchWithPaperId(self, paper_path:str, identity_id = None):
+        file_identity_id = SearchEngine.IdentityFromPath(paper_path)
+        if file_identity_id is None:
+            return None
+        identity_id = identity_id or file_identity_id
+        paper_id = SearchEngine.AssignPaperId(identity_id)
+        paper_data = await self.Coalesce(('paperId', paper_id), self.search_engine.GetPaperData, paper_id)
+        return {identity_id: paper_data} if paper_data else None
+
+    async def SearchInLibrary(self, query:str, page:int=1, page_size:int=20):
+        return await self.Call(self.search_engine.SearchInLibrary, query, page, page_size)
+
+    async def CentralPapers(self, limit:int=20, offset:int=0):
+        return await self.Coalesce(('central', limit, offset), self.search_engine.CentralPapers, limit, offset)
+
+    async def SimilarPapers(self, paper_id:str, limit:int=20):
+        return await self.Coalesce(('similar', paper_id, limit), self.search_engine.SimilarPapers, paper_id, limit)
+
+    async def PaperNeighbourhood(self, paper_id:str, depth:int=1, direction:str='both', max_fanout:int=50, max_nodes:int=500, library_only:bool=False):
+        key = ('neighbourhood', paper_id, depth, direction, max_fanout, max_nodes, library_only)
+        return await self.Coalesce(key, self.search_engine.PaperNeighbourhood, paper_id, depth, direction, max_fanout, max_nodes, library_only)
@@ -0,0 +1,178 @@
+import threading
+from array import array
+from src.utils.sqliteconnector import SqliteHelper
+
+class CitationGraphIndex:
+    """
+    In-memory view of paper_information and paper_link.
+
+    Paper ids are interned to dense integers and every node keeps array backed
+    adjacency lists, so membership tests are hash lookups and neighbour queries
+    cost O(degree). The index is loaded once per process and kept in sync
+    incrementally: both tables use AUTOINCREMENT ids, so `Sync` only reads the
+    rows above the last seen id. Deletes bump the counters of paper_graph_version
+    through triggers; a changed counter makes `Sync` reload the index. Checking
+    for changes therefore costs two MAX(id) lookups and one tiny table read.
+
+    paper_link stores (source_id, citation_id) as "citation_id cites source_id".
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS paper_graph_version
+(
+name VARCHAR(32) PRIMARY KEY,
+deletes INT NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO paper_graph_version (name, deletes) VALUES ('paper_information', 0), ('paper_link', 0);
+
+CREATE TRIGGER IF NOT EXISTS paper_information_delete_version AFTER DELETE ON paper_information BEGIN
+    UPDATE paper_graph_version SET deletes = deletes + 1 WHERE name = 'paper_information';
+END;
+
+CREATE TRIGGER IF NOT EXISTS paper_link_delete_version AFTER DELETE ON paper_link BEGIN
+    UPDATE paper_graph_version SET deletes = deletes + 1 WHERE name = 'paper_link';
+END;
+"""
+    indexes = {}
+    _lock = threading.Lock()
+
+    def __init__(self, service:str='paper_db'):
+        self.service = service
+        self._lock = threading.RLock()
+        self.delete_version = 0
+        self.Clear()
+        self.CreateOrIgnoreVersionTable(service)
+
+    @staticmethod
+    def CreateOrIgnoreVersionTable(service:str='paper_db'):
+        return SqliteHelper(service).EnsureSchema('paper_graph_version', CitationGraphIndex.SCHEMA)
+
+    @classmethod
+    def ForService(cls, service:str='paper_db'):
+        with cls._lock:
+            if service not in cls.indexes:
+                cls.indexes[service] = cls(service)
+        index = cls.indexes[service]
+        index.Sync()
+        return index
+
+    def Clear(self):
+        self.node_ids = dict()
+        self.paper_ids = []
+        self.in_library = bytearray()
+        self.citations = []
+        self.references = []
+        self.last_paper_rowid = 0
+        self.last_link_rowid = 0
+        self.paper_count = 0
+        self.link_count = 0
+
+    def Intern(self, paper_id:str) -> int:
+        node = self.node_ids.get(paper_id)
+        if node is None:
+            node = len(self.paper_ids)
+            self.node_ids[paper_id] = node
+            self.paper_ids.append(paper_id)
+            self.in_library.append(0)
+            self.citations.append(array('l'))
+            self.references.append(array('l'))
+        return node
+
+    def Sync(self):
+        sql = """
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM paper_information), (SELECT COALESCE(MAX(id), 0) FROM paper_link),
+        (SELECT COALESCE(SUM(deletes), 0) FROM paper_graph_version)
+        """
+        max_paper_rowid, max_link_rowid, delete_version = SqliteHelper(self.service).ExecuteSelect(sql)[0]
+        with self._lock:
+            if delete_version != self.delete_version:
+                self.Clear()
+                self.delete_version = delete_version
+            elif max_paper_rowid == self.last_paper_rowid and max_link_rowid == self.last_link_rowid:
+                return
+            self.LoadDelta()
+
+    def Reload(self):
+        with self._lock:
+            self.Clear()
+            self.LoadDelta()
+
+    def LoadDelta(self):
+        sql = "SELECT id, paperId FROM paper_information WHERE id > :last_rowid ORDER BY id"
+        for rowid, paper_id in SqliteHelper(self.service).ExecuteSelect(sql, {'last_rowid': self.last_paper_rowid}):
+            node = self.Intern(paper_id)
+            if not self.in_library[node]:
+                self.in_library[node] = 1
+                self.paper_count += 1
+            self.last_paper_rowid = rowid
+        sql = "SELECT id, source_id, citation_id FROM paper_link WHERE id > :last_rowid ORDER BY id"
+        for rowid, source_id, citation_id in SqliteHelper(self.service).ExecuteSelect(sql, {'last_rowid': self.last_link_rowid}):
+            source_node = self.Intern(source_id)
+            citation_node = self.Intern(citation_id)
+            self.citations[source_node].append(citation_node)
+            self.references[citation_node].append(source_node)
+            self.link_count += 1
+            self.last_link_rowid = rowid
+
+    def __contains__(self, paper_id:str) -> bool:
+        node = self.node_ids.get(paper_id)
+        return node is not None and self.in_library[node] == 1
+
+    def InLibrary(self, paper_ids) -> list:
+        return [paper_id for paper_id in paper_ids if paper_id in self]
+
+    def GetCitations(self, paper_id:str) -> list:
+        node = self.node_ids.get(paper_id)
+        if node is None:
+            return []
+        return [self.paper_ids[citation_node] for citation_node in self.citations[node]]
+
+    def GetReferences(self, paper_id:str) -> list:
+        node = self.node_ids.get(paper_id)
+        if node is None:
+            return []
+        return [self.paper_ids[source_node] for source_node in self.references[node]]
+
+    def Neighbourhood(self, paper_id:str, depth:int=1, direction:str='both', max_fanout:int=50, max_nodes:int=500, library_only:bool=False):
+        """
+        Breadth-first k-hop neighbourhood of `paper_id`.
+
+        Returns ({paper_id: hop}, [(source_id, citation_id)], truncated). Every node
+        is expanded once, so cycles only add edges. At most `max_fanout` neighbours
+        (library papers first) are followed per node and direction, and the walk
+        stops growing at `max_nodes`; `truncated` tells whether a cap was hit.
+        """
+        with self._lock:
+            start = self.node_ids.get(paper_id)
+            if start is None:
+                return dict(), [], False
+            hops, edges, truncated = {start: 0}, set(), False
+            frontier = [start]
+            for hop in range(1, depth + 1):
+                next_frontier = []
+                for node in frontier:
+                    steps = []
+                    if direction in ('references', 'both'):
+                        steps.append([(neighbour, (neighbour, node)) for neighbour in self.references[node]])
+                    if direction in ('citations', 'both'):
+                        steps.append([(neighbour, (node, neighbour)) for neighbour in self.citations[node]])
+                    for neighbours in steps:
+                        if library_only:
+                            neighbours = [item for item in neighbours if self.in_library[item[0]]]
+                        if len(neighbours) > max_fanout:
+                            truncated = True
+                            neighbours = sorted(neighbours, key=lambda item: not self.in_library[item[0]])[:max_fanout]
+                        for neighbour, edge in neighbours:
+                            if neighbour not in hops:
+                                if len(hops) >= max_nodes:
+                                    truncated = True
+                                    continue
+                                hops[neighbour] = hop
+                                next_frontier.append(neighbour)
+                            edges.add(edge)
+                frontier = next_frontier
+                if not frontier:
+                    break
+            return ({self.paper_ids[node]: hop for node, hop in hops.items()},
+                    [(self.paper_ids[source], self.paper_ids[citation]) for source, citation in sorted(edges)],
+                    truncated)
@@ -0,0 +1,126 @@
+import os, mmap, hashlib
+from src.utils.sqliteconnector import SqliteHelper
+from src.utils.metrics import Metrics
+
+class PdfContentIndex:
+    """
+    Content addressed index of the PDFs registered in the library.
+
+    Every registered file is stored with its size and a streaming blake2b digest
+    computed over mmap'd chunks, so files are never read into memory at once.
+    Incoming files are first matched by size, which only needs a stat; a file is
+    hashed only when a registered PDF has exactly the same size.
+
+    Papers registered before the index existed are hashed by `Backfill`, which
+    LibraryIntegrityScanner runs after every scan; the scan also drops the rows
+    of the papers it removes in the same transaction as their paper rows.
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS paper_file_hash
+(
+id INTEGER PRIMARY KEY AUTOINCREMENT,
+paperId VARCHAR(128) NOT NULL,
+paperPath TEXT NOT NULL,
+size INT NOT NULL,
+contentHash VARCHAR(64) NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS paper_file_hash_path ON paper_file_hash(paperPath);
+CREATE INDEX IF NOT EXISTS paper_file_hash_content ON paper_file_hash(size, contentHash);
+"""
+    CHUNK_SIZE = 1 << 20
+    QUERY_CHUNK_SIZE = 500
+
+    def __init__(self, service:str='paper_db', create_schema:bool=True):
+        self.service = service
+        if create_schema:
+            self.CreateOrIgnoreHashTable()
+
+    def CreateOrIgnoreHashTable(self):
+        return SqliteHelper(self.service).EnsureSchema('paper_file_hash', PdfContentIndex.SCHEMA)
+
+    @staticmethod
+    @Metrics.Timed('fs_operation', operation='hash')
+    def HashFile(file_path:str) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(file_path, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return digest.hexdigest()
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                for start in range(0, len(mapped_file), PdfContentIndex.CHUNK_SIZE):
+                    digest.update(mapped_file[start:start + PdfContentIndex.CHUNK_SIZE])
+        return digest.hexdigest()
+
+    def Select(self, sql_template:str, values:list) -> list:
+        rows = []
+        for start in range(0, len(values), PdfContentIndex.QUERY_CHUNK_SIZE):
+            chunk = values[start:start + PdfContentIndex.QUERY_CHUNK_SIZE]
+            params = {f"v{i}": value for i, value in enumerate(chunk)}
+            sql = sql_template.format(','.join(':' + name for name in params))
+            rows.extend(SqliteHelper(self.service).ExecuteDictSelect(sql, params))
+        return rows
+
+    def FindDuplicates(self, file_paths:list) -> dict:
+        """Return {file_path: {'paperId', 'paperPath'}} for the files already registered."""
+        sizes = dict()
+        for file_path in file_paths:
+            try:
+                sizes[file_path] = os.path.getsize(file_path)
+            except OSError:
+                continue
+        known_sizes = {row['size'] for row in self.Select(
+            "SELECT DISTINCT size FROM paper_file_hash WHERE size IN ({})", list(set(sizes.values())))}
+        candidates = dict()
+        for file_path, size in sizes.items():
+            if size in known_sizes:
+                candidates[file_path] = self.HashFile(file_path)
+        if not candidates:
+            return dict()
+        registered = dict()
+        for row in self.Select(
+                "SELECT paperId, paperPath, size, contentHash FROM paper_file_hash WHERE contentHash IN ({})", list(set(candidates.values()))):
+            registered[(row['size'], row['contentHash'])] = {'paperId': row['paperId'], 'paperPath': row['paperPath']}
+        duplicates = dict()
+        for file_path, content_hash in candidates.items():
+            match = registered.get((sizes[file_path], content_hash))
+            if match and os.path.abspath(match['paperPath']) != os.path.abspath(file_path):
+                duplicates[file_path] = match
+        return duplicates
+
+    def Describe(self, paper_id:str, paper_path:str):
+        try:
+            return {
+                'paperId': paper_id,
+                'paperPath': paper_path,
+                'size': os.path.getsize(paper_path),
+                'contentHash': self.HashFile(paper_path)
+            }
+        except OSError:
+            return None
+
+    def Store(self, rows:list):
+        rows = [row for row in rows if row]
+        if not rows:
+            return 0
+        sql = """
+        INSERT INTO paper_file_hash (paperId, paperPath, size, contentHash)
+        VALUES (:paperId, :paperPath, :size, :contentHash)
+        ON CONFLICT(paperPath) DO UPDATE SET paperId=excluded.paperId, size=excluded.size, contentHash=excluded.contentHash;
+        """
+        return SqliteHelper(self.service).ExecuteUpdate(sql, rows)
+
+    def Register(self, entries:list):
+        """Store (paperId, paperPath) pairs; the size and hash are read from the file at paperPath."""
+        return self.Store([self.Describe(paper_id, paper_path) for paper_id, paper_path in entries])
+
+    def Unhashed(self) -> list:
+        """(paperId, paperPath) of the registered papers that have no entry yet."""
+        sql = """
+        SELECT paperId, paperPath FROM paper_information
+        WHERE paperPath NOT IN (SELECT paperPath FROM paper_file_hash)
+        """
+        return [(paper_id, paper_path) for paper_id, paper_path in SqliteHelper(self.service).ExecuteSelect(sql)]
+
+    def Backfill(self) -> int:
+        """Hash the registered papers that have no entry yet; papers whose PDF is missing are left for a later run."""
+        return self.Store([self.Describe(paper_id, paper_path) for paper_id, paper_path in self.Unhashed() if os.path.isfile(paper_path)])
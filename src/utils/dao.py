@@ -1,58 +1,190 @@
-import requests
-import datetime
 import os, json, re
 from src.utils.sqliteconnector import SqliteHelper
+from src.utils.metrics import Metrics
+from src.utils.metadata_provider import MetadataProvider
+from src.utils.citation_graph import CitationGraphIndex
+from src.utils.note_renderer import PaperNoteRenderer
+from src.utils.local_search import LocalSearchIndex
+from src.utils.content_index import PdfContentIndex
+from src.utils.library_scanner import LibraryIntegrityScanner
+from src.utils.paper_rows import PaperRowStore
 from src.component.paper_info import SemanticScholarInfo, OpenAlexToolInfo
 
-class OpenAlexTool:
-    def __init__(self, fields:list=['title','authors','publicationDate','externalIds','citationCount','url','fieldsOfStudy','citations','references']):
-        self.fields = fields
+class OpenAlexTool(MetadataProvider):
+    """
+    Batched OpenAlex backend.
 
-    def GetPaperFromArXiv(self, arXiv_id:str)->SemanticScholarInfo:
-        req = requests.get(f"https://api.openalex.org/works?filter=primary_location.landing_page_url:https://arxiv.org/abs/{arXiv_id}&select={','.join(self.fields)}")
-        if req.status_code == 200:
-            return OpenAlexToolInfo(req.json())
-        else:
-            raise None
+    Identifiers are translated into `doi:` / `ids.openalex:` OR-filters of up to
+    `batch_size` values and read with cursor pagination (`per-page=200`); the
+    citing works of a chunk come from one `cites:` OR-filter. Works are
+    normalized into the Semantic Scholar schema with the short OpenAlex id
+    (W...) as paperId. ArXiv ids are looked up through their DataCite DOI.
+    """
+    name = 'openalex'
+    info_class = OpenAlexToolInfo
+    PER_PAGE = 200
+    MAX_CITATION_PAGES = 25
+    ARXIV_DOI_PREFIX = '10.48550/arxiv.'
+    SELECT = {
+        'title': ['title'],
+        'authors': ['authorships'],
+        'publicationDate': ['publication_date'],
+        'citationCount': ['cited_by_count'],
+        'fieldsOfStudy': ['primary_topic'],
+        'references': ['referenced_works'],
+    }
 
-    def GetPaperFromDoi(self, doi:str)->SemanticScholarInfo:
-        req = requests.get(f"https://api.openalex.org/works?filter=doi:{doi}&select={','.join(self.fields)}")
-        if req.status_code == 200:
-            return OpenAlexToolInfo(req.json())
-        else:
-            return None
+    def Select(self) -> str:
+        select = ['id', 'doi', 'ids']
+        for field in self.fields:
+            select.extend(name for name in OpenAlexTool.SELECT.get(field, []) if name not in select)
+        return ','.join(select)
 
-    def SearchPaperWithKeyword(self, keyword:str)->SemanticScholarInfo:
-        req = requests.get(f"https://api.openalex.org/works?filter=abstract.search:{keyword}&select={','.join(self.fields)}&limit=1")
-        if req.status_code == 200:
-            if req.json()["total"]>0:
-                return OpenAlexToolInfo(req.json()["data"][0])
-            else:
-                return None
-        else:
+    @staticmethod
+    def ShortId(openalex_id:str) -> str:
+        return openalex_id.rsplit('/', 1)[-1] if openalex_id else openalex_id
+
+    @staticmethod
+    def ShortDoi(doi:str) -> str:
+        if not doi:
             return None
-    def GetPapersWithListPaperId(self, paper_id_list:list)->dict:
-        paperDataPair = dict()
-        paperIds = list()
+        doi = doi.strip().lower()
+        for prefix in ('https://doi.org/', 'http://doi.org/', 'doi:'):
+            if doi.startswith(prefix):
+                doi = doi[len(prefix):]
+        return doi
+
+    @staticmethod
+    def Filter(paperId:str):
+        """Translate an identifier into an OpenAlex (filter, value) pair, or None when it has no OpenAlex form."""
+        identifier = paperId.strip()
+        prefix, _, value = identifier.partition(':')
+        if value and prefix.upper() == 'ARXIV':
+            identifier = value
+        arxiv_valid = re.match(r"\d{4}\.\d{4,5}", identifier)
+        if arxiv_valid:
+            return 'doi', f"{OpenAlexTool.ARXIV_DOI_PREFIX}{arxiv_valid.group()}"
+        if (value and prefix.upper() == 'DOI') or identifier.startswith('10.') or 'doi.org/' in identifier:
+            return 'doi', OpenAlexTool.ShortDoi(identifier)
+        openalex_valid = re.fullmatch(r"(?:https://openalex\.org/)?(W\d+)", identifier, re.IGNORECASE)
+        if openalex_valid:
+            return 'ids.openalex', openalex_valid.group(1).upper()
+        return None
+
+    def Works(self, filter_value:str, select:str, max_pages:int=None):
+        """Yield every work matching `filter_value`, following `next_cursor` until the last page."""
+        cursor, pages = '*', 0
+        while cursor and (max_pages is None or pages < max_pages):
+            req = self.client.Get('/works', params={'filter': filter_value, 'select': select, 'per-page': OpenAlexTool.PER_PAGE, 'cursor': cursor})
+            if req.status_code != 200:
+                raise RuntimeError(f"HTTP {req.status_code}: {req.text[:200]}")
+            data = req.json()
+            pages += 1
+            yield from data['results']
+            cursor = data['meta'].get('next_cursor') if data['results'] else None
+
+    def CitingWorks(self, work_ids:list) -> dict:
+        """Return {work id: [{'paperId': citing work id}]} from one cursor-paginated `cites:` query."""
+        citations = {work_id: [] for work_id in work_ids}
+        for start in range(0, len(work_ids), self.batch_size):
+            chunk = work_ids[start:start + self.batch_size]
+            for work in self.Works(f"cites:{'|'.join(chunk)}", 'id,referenced_works', OpenAlexTool.MAX_CITATION_PAGES):
+                citing_id = self.ShortId(work['id'])
+                for reference in work.get('referenced_works') or []:
+                    reference = self.ShortId(reference)
+                    if reference in citations:
+                        citations[reference].append({'paperId': citing_id})
+        return citations
+
+    def Normalize(self, work:dict) -> dict:
+        """Map an OpenAlex work onto the Semantic Scholar field names PaperProcessor expects."""
+        paper_id = self.ShortId(work['id'])
+        ids = work.get('ids') or {}
+        doi = self.ShortDoi(work.get('doi') or ids.get('doi'))
+        external_ids = {'OpenAlex': paper_id}
+        if doi:
+            external_ids['DOI'] = doi
+            if doi.startswith(OpenAlexTool.ARXIV_DOI_PREFIX):
+                external_ids['ArXiv'] = doi[len(OpenAlexTool.ARXIV_DOI_PREFIX):]
+        if ids.get('mag'):
+            external_ids['MAG'] = str(ids['mag'])
+        if ids.get('pmid'):
+            external_ids['PubMed'] = self.ShortId(ids['pmid'])
+        topic = work.get('primary_topic') or {}
+        paperInformation = {
+            'paperId': paper_id,
+            'title': work.get('title') or work.get('display_name'),
+            'authors': [{'name': authorship['author']['display_name']} for authorship in work.get('authorships') or []],
+            'publicationDate': work.get('publication_date'),
+            'citationCount': work.get('cited_by_count', 0),
+            'url': work['id'],
+            'fieldsOfStudy': [topic['field']['display_name']] if topic.get('field') else [],
+            'externalIds': external_ids,
+        }
+        if 'references' in self.fields:
+            paperInformation['references'] = [{'paperId': self.ShortId(reference)} for reference in work.get('referenced_works') or []]
+        return paperInformation
+
+    def GetPaperBatch(self, paper_id_list:list):
+        paperDataPair, failed = dict(), dict()
+        wanted, values = dict(), {'doi': [], 'ids.openalex': []}
         for paperId in paper_id_list:
-            arxiv_valid = re.match("\d{4}\.\d{5}", paperId)
-            if arxiv_valid:
-                paperIds.append(f'ARXIV:{arxiv_valid.group()}')
-            else:
-                paperIds.append(paperId)
-        req = requests.post(
-            'https://api.semanticscholar.org/graph/v1/paper/batch',
-            params = {'fields': ','.join(self.fields)},
-            json = {"ids": paperIds}
-            )
-        for i, paperInformation in enumerate(req.json()):
-            if paperInformation:
-                paperInformation['identifyId'] = paper_id_list[i]
-                paperDataPair[paper_id_list[i]] = OpenAlexToolInfo(paperInformation)
-        return paperDataPair
+            work_filter = self.Filter(paperId)
+            if work_filter is None:
+                failed[paperId] = "Unsupported identifier for OpenAlex"
+                continue
+            wanted.setdefault(work_filter, []).append(paperId)
+            values[work_filter[0]].append(work_filter[1])
+        try:
+            works = [work for key, key_values in values.items() if key_values for work in self.Works(f"{key}:{'|'.join(dict.fromkeys(key_values))}", self.Select())]
+            citations = self.CitingWorks([self.ShortId(work['id']) for work in works]) if 'citations' in self.fields and works else dict()
+        except Exception as e:
+            return paperDataPair, {paperId: str(e) for paperId in paper_id_list}
+        resolved = list()
+        for work in works:
+            paperInformation = self.Normalize(work)
+            if 'citations' in self.fields:
+                paperInformation['citations'] = citations.get(paperInformation['paperId'], [])
+            doi = paperInformation['externalIds'].get('DOI')
+            for paperId in wanted.get(('doi', doi), []) + wanted.get(('ids.openalex', paperInformation['paperId']), []):
+                if paperId not in paperDataPair:
+                    resolved.append((paperInformation, [paperId]))
+                    paperDataPair[paperId] = self.Parse(dict(paperInformation, identifyId=paperId))
+        self.cache.PutMany(resolved)
+        for paperId in paper_id_list:
+            if paperId not in paperDataPair and paperId not in failed:
+                failed[paperId] = MetadataProvider.NOT_FOUND
+        return paperDataPair, failed
+
+    def GetPaperFromArXiv(self, arXiv_id:str)->OpenAlexToolInfo:
+        return self.GetPaperFromPaperId(f"ARXIV:{arXiv_id}")
+
+    def GetPaperFromDoi(self, doi:str)->OpenAlexToolInfo:
+        return self.GetPaperFromPaperId(f"DOI:{doi}")
+
+    def GetPaperFromPaperId(self, paperId:str)->OpenAlexToolInfo:
+        cached = self.cache.Get(paperId, self.fields)
+        if cached:
+            return OpenAlexToolInfo(cached)
+        if self.Filter(paperId) is None:
+            return None
+        return self.GetPaperBatch([paperId])[0].get(paperId)
 
+    def SearchPaperWithKeyword(self, keyword:str)->OpenAlexToolInfo:
+        search_key = self.cache.SearchKey(keyword)
+        cached = self.cache.Get(search_key, self.fields)
+        if cached:
+            return OpenAlexToolInfo(cached)
+        req = self.client.Get('/works', params={'search': keyword, 'select': self.Select(), 'per-page': 1})
+        if req.status_code != 200 or not req.json()['results']:
+            return None
+        paperInformation = self.Normalize(req.json()['results'][0])
+        if 'citations' in self.fields:
+            paperInformation['citations'] = self.CitingWorks([paperInformation['paperId']])[paperInformation['paperId']]
+        self.cache.Put(paperInformation, [search_key])
+        return OpenAlexToolInfo(paperInformation)
 
-class SemanticScholarTool:
+class SemanticScholarTool(MetadataProvider):
     """
     Due to an official announcement from the Semantic Scholar API:
 
@@ -76,51 +208,71 @@ class SemanticScholarTool:
     - API:  https://api.openalex.org/works
     - Docs: https://docs.openalex.org/api
     """
-    def __init__(self, fields:list=['title','authors','publicationDate','externalIds','citationCount','url','fieldsOfStudy','citations','references']):
-        self.fields = fields
+    name = 'semantic_scholar'
+    info_class = SemanticScholarInfo
 
     def GetPaperFromArXiv(self, arXiv_id:str)->SemanticScholarInfo:
-        req = requests.get(f"https://api.semanticscholar.org/graph/v1/paper/arXiv:{arXiv_id.split('v')[0]}?&fields={','.join(self.fields)}")
+        cached = self.cache.Get(f"ARXIV:{arXiv_id}", self.fields)
+        if cached:
+            return SemanticScholarInfo(cached)
+        req = self.client.Get(f"/paper/arXiv:{arXiv_id.split('v')[0]}", params={'fields': ','.join(self.fields)})
         if req.status_code == 200:
+            self.cache.Put(req.json(), [f"ARXIV:{arXiv_id}"])
             return SemanticScholarInfo(req.json())
         else:
-            raise None
-        
-    def GetPapersWithListPaperId(self, paper_id_list:list)->dict:
-        paperDataPair = dict()
+            return None
+
+    def GetPaperBatch(self, paper_id_list:list):
+        paperDataPair, failed = dict(), dict()
         paperIds = list()
         for paperId in paper_id_list:
-            arxiv_valid = re.match("\d{4}\.\d{5}", paperId)
+            arxiv_valid = re.match(r"\d{4}\.\d{4,5}", paperId)
             if arxiv_valid:
                 paperIds.append(f'ARXIV:{arxiv_valid.group()}')
             else:
                 paperIds.append(paperId)
-        req = requests.post(
-            'https://api.semanticscholar.org/graph/v1/paper/batch',
-            params = {'fields': ','.join(self.fields)},
-            json = {"ids": paperIds}
-            )
-        print(req.json())
+        try:
+            req = self.client.Post(
+                '/paper/batch',
+                params = {'fields': ','.join(self.fields)},
+                json = {"ids": paperIds}
+                )
+        except Exception as e:
+            return paperDataPair, {paperId: str(e) for paperId in paper_id_list}
+        if req.status_code != 200:
+            return paperDataPair, {paperId: f"HTTP {req.status_code}: {req.text[:200]}" for paperId in paper_id_list}
+        self.cache.PutMany([(paperInformation, [paper_id_list[i]]) for i, paperInformation in enumerate(req.json()) if paperInformation])
         for i, paperInformation in enumerate(req.json()):
             if paperInformation:
                 paperInformation['identifyId'] = paper_id_list[i]
                 paperDataPair[paper_id_list[i]] = SemanticScholarInfo(paperInformation)
-        return paperDataPair
+            else:
+                failed[paper_id_list[i]] = "Not found"
+        return paperDataPair, failed
 
     def GetPaperFromPaperId(self, paperId:str)->SemanticScholarInfo:
-        req = requests.get(f"https://api.semanticscholar.org/graph/v1/paper/{paperId}?&fields={','.join(self.fields)}")
+        cached = self.cache.Get(paperId, self.fields)
+        if cached:
+            return SemanticScholarInfo(cached)
+        req = self.client.Get(f"/paper/{paperId}", params={'fields': ','.join(self.fields)})
         if req.status_code == 200:
+            self.cache.Put(req.json(), [paperId])
             return SemanticScholarInfo(req.json())
         else:
             return None
 
     def SearchPaperWithKeyword(self, keyword:str)->SemanticScholarInfo:
-        req = requests.get(f"https://api.semanticscholar.org/graph/v1/paper/search?query={keyword}&fields={','.join(self.fields)}&limit=1")
+        search_key = self.cache.SearchKey(keyword)
+        cached = self.cache.Get(search_key, self.fields)
+        if cached:
+            return SemanticScholarInfo(cached)
+        req = self.client.Get('/paper/search', params={'query': keyword, 'fields': ','.join(self.fields), 'limit': 1})
         if req.status_code == 200:
             if req.json()["total"]>0:
+                self.cache.Put(req.json()["data"][0], [search_key])
                 return SemanticScholarInfo(req.json()["data"][0])
             else:
-                raise None
+                return None
         else:
             return None
         
@@ -128,48 +280,41 @@ class SemanticScholarTool:
       
 
 class PaperProcessor:
+    UPSERT_PAPER_SQL = """
+        INSERT INTO paper_information('paperId','url','title','citationCount','fieldsOfStudy','publicationDate','authors','paperPath', 'location', 'identifyId')
+        VALUES (:paperId,:url,:title,:citationCount,:fieldsOfStudy,:publicationDate,:authors,:paperPath, :location, :identifyId)
+        ON CONFLICT(paperId) DO UPDATE SET paperPath=excluded.paperPath, location=excluded.location, citationCount=excluded.citationCount;
+        """
+    INSERT_LINK_SQL = """
+        INSERT OR IGNORE INTO paper_link (source_id, citation_id)
+        VALUES (:source_id, :citation_id)
+        """
+
     def __init__(self, paperData:SemanticScholarInfo):
-        self.paperData = paperData.get_data()
+        self.paperData = paperData.to_dict()
         self.PaperInfo = paperData
         self.CreateOrIgnorePaperTable()
         
     def WritePaperInfo(self, target_path:str , paperData=None):
-
-        def attachCurrentDate():
-            return f"<span style='font-size:11;float:right;'>Information Update:{datetime.datetime.now().strftime('%b %d, %Y')}</span>"
         if paperData is None:
             paperData = self.paperData
-        paper_id = paperData['paperId']
-        title = paperData['title']
-        url = paperData['url']
-        publication_date = paperData['publicationDate']
-        external_id = paperData['externalIds']
-        citationCount = paperData['citationCount']
-        fields_of_study = paperData['fieldsOfStudy']
-        author = paperData['authors']
-        paper_summary = f"""## Information 
-- Title: {title}
-- Author: {author}
-- Publication Date: {publication_date}
-- Citation: {citationCount}
-- Url: {url}
-- Paper ID:{paper_id}
-"""
-        paper_relationship = self.CreateLinkString()
-        with open(target_path, 'w', encoding='utf8') as fp:
+        paper_summary = PaperNoteRenderer.RenderSummary(paperData)
+        paper_relationship = self.CreateLinkString(paperData['paperId'])
+        with Metrics.Span('fs_operation', operation='write_note'), open(target_path, 'w', encoding='utf8') as fp:
             fp.write(
                 paper_summary
             )
             fp.write(paper_relationship)
-            fp.write(attachCurrentDate())
+            fp.write(PaperNoteRenderer.AttachCurrentDate())
 
     def GeneratePaperNote(self, paperId, target_dir):
         note_path = os.path.join(target_dir, f"{paperId}-note.md")
         if not os.path.exists(note_path):
-            with open(note_path, 'w') as fp:
+            with Metrics.Span('fs_operation', operation='write_note'), open(note_path, 'w') as fp:
                 fp.write(f"![[{paperId}-intro]]")
             
-    def CreateOrIgnorePaperTable(self):
+    @staticmethod
+    def CreateOrIgnorePaperTable():
         sql = """
 CREATE TABLE IF NOT EXISTS paper_information
 (
@@ -200,31 +345,30 @@ CREATE INDEX IF NOT EXISTS paper_source_query ON paper_link(source_id);
 CREATE INDEX IF NOT EXISTS paper_citation_query ON paper_link(citation_id);
 CREATE UNIQUE INDEX IF NOT EXISTS paper_link_pair ON paper_link(source_id, citation_id);
 """
-        return SqliteHelper('paper_db').ExecuteUpdate(sql)
+        SqliteHelper('paper_db').EnsureSchema('paper_information', sql)
+        CitationGraphIndex.CreateOrIgnoreVersionTable('paper_db')
+        LocalSearchIndex.CreateOrIgnoreSearchTable('paper_db')
 
         
     def GeneratePaperSetting(self, target_dir:str):
-        data = dict()
-        data.update(self.paperData)
-        data.pop('citations')
-        data.pop('references')
-        paper_id = self.getPaperId()
-        data['paperPath'] = os.path.join(target_dir, f"{paper_id}.pdf")
-        data['mdPath'] = os.path.join(target_dir, f"{paper_id}-intro.md")
-        data['location'] = target_dir
-        data['identifyId'] = paper_id
-        with open(os.path.join(target_dir, 'config.json'), 'w') as fp:
+        data = self.GetPaperRow(target_dir)
+        with Metrics.Span('fs_operation', operation='write_config'), open(os.path.join(target_dir, 'config.json'), 'w') as fp:
             json.dump(data, fp, indent=4)
         
         
     def getPaperId(self):
-        if 'ArXiv' in self.paperData['externalIds']:
-            paper_id = self.paperData['externalIds']['ArXiv']
+        return PaperProcessor.FileId(self.paperData)
+
+    @staticmethod
+    def FileId(paperData:dict) -> str:
+        """The name of the paper's PDF and notes: its ArXiv id when it has one."""
+        if 'ArXiv' in paperData['externalIds']:
+            paper_id = paperData['externalIds']['ArXiv']
         else:
-            paper_id = self.paperData['paperId']
+            paper_id = paperData['paperId']
         return paper_id
     
-    def UpdatePaperInfo(self, target_dir:str):
+    def GetPaperRow(self, target_dir:str) -> dict:
         data = dict()
         data.update(self.paperData)
         paper_id = self.getPaperId()
@@ -232,151 +376,152 @@ CREATE UNIQUE INDEX IF NOT EXISTS paper_link_pair ON paper_link(source_id, citat
         data['mdPath'] = os.path.join(target_dir, f"{paper_id}-intro.md")
         data['location'] = target_dir
         data['identifyId'] = paper_id
-        sql = f"""
-        INSERT OR IGNORE INTO paper_information('paperId','url','title','citationCount','fieldsOfStudy','publicationDate','authors','paperPath', 'location', 'identifyId')
-        VALUES (:paperId,:url,:title,:citationCount,:fieldsOfStudy,:publicationDate,:authors,:paperPath, :location, :identifyId);
-        """
-        SqliteHelper('paper_db').ExecuteUpdate(sql, data)
-        sql = f"""
-        UPDATE paper_information SET paperPath=:paperPath, location=:location, citationCount=:citationCount WHERE paperId=:paperId;
-        """
-        SqliteHelper('paper_db').ExecuteUpdate(sql, data)
+        return data
 
-    def UpdatePaperLink(self):
-        sql = """
-        SELECT paperId FROM paper_information;
-        """
+    def UpdatePaperInfo(self, target_dir:str):
+        SqliteHelper('paper_db').ExecuteUpdate(PaperProcessor.UPSERT_PAPER_SQL, self.GetPaperRow(target_dir))
+
+    def GetPaperLinks(self, db_paper_id, batch_paper_ids:set=frozenset()):
+        return PaperProcessor.PaperLinks(self.PaperInfo, db_paper_id, batch_paper_ids)
+
+    @staticmethod
+    def PaperLinks(paper_info:SemanticScholarInfo, db_paper_id, batch_paper_ids:set=frozenset()):
+        """The paper_link rows between `paper_info` and the papers of the library or the batch, and the ids whose notes they change."""
         paper_link_list = []
-        db_paper_id = [paper_id for paper_arr in SqliteHelper('paper_db').ExecuteSelect(sql) for paper_id in paper_arr]
-        paper_id = self.paperData['paperId']
-        cite_paper_ids = [ item['paperId'] for item in self.paperData['citations']]
+        paper_id = paper_info.paperId
+        cite_paper_ids = paper_info.citation_ids
         paper_ids_need_to_rewrite = []
         for cite_paper_id in cite_paper_ids:
-            if cite_paper_id in db_paper_id:
+            if cite_paper_id in db_paper_id or cite_paper_id in batch_paper_ids:
                 paper_link  = dict()
                 paper_link['source_id'] = paper_id
                 paper_link['citation_id'] = cite_paper_id
                 paper_ids_need_to_rewrite.append(cite_paper_id)
                 paper_link_list.append(paper_link)
-        refer_paper_ids = [ item['paperId'] for item in self.paperData['references']]
+        refer_paper_ids = paper_info.reference_ids
         for refer_paper_id in refer_paper_ids:
-            if refer_paper_id in db_paper_id:
+            if refer_paper_id in db_paper_id or refer_paper_id in batch_paper_ids:
                 paper_link = dict()
                 paper_link['source_id'] = refer_paper_id
                 paper_link['citation_id'] = paper_id
                 paper_ids_need_to_rewrite.append(refer_paper_id)
                 paper_link_list.append(paper_link)
-        sql = f"""
-        INSERT OR IGNORE INTO paper_link (source_id, citation_id)
-        VALUES (:source_id, :citation_id)
-        """
+        return paper_link_list, paper_ids_need_to_rewrite
+
+    @Metrics.Timed('stage', stage='update_paper_link')
+    def UpdatePaperLink(self, renderer:PaperNoteRenderer=None):
+        citation_graph = CitationGraphIndex.ForService('paper_db')
+        paper_link_list, paper_ids_need_to_rewrite = self.GetPaperLinks(citation_graph)
         if len(paper_link_list) >0:
-            SqliteHelper('paper_db').ExecuteUpdate(sql, paper_link_list)
-        self.RewritePaperInformation(paper_ids_need_to_rewrite)
-    
-    def RewritePaperInformation(self, paper_ids):
-        if len(paper_ids)>0:
-            sql = f"""SELECT paperId, location FROM paper_information WHERE paperId IN ('{"','".join(paper_ids)}')"""
-            paper_locs = {paper_info["paperId"]:paper_info['location'] for paper_info in SqliteHelper('paper_db').ExecuteSelect(sql)}
-            for paper_id in paper_ids:
-                if os.path.exists(os.path.join(paper_locs[paper_id], 'config.json')):
-                    with open(os.path.join(paper_locs[paper_id], 'config.json'), 'r') as fp:
-                        paper_data = json.load(fp)
-                        self.WritePaperInfo(os.path.join(paper_data['location'], f"{paper_data['identifyId']}-intro.md"), paperData=paper_data)
-
-    def CreateLinkString(self):
-        def createPaperInternalLink(paper_infos:list[dict]):
-            return_string = ""
-            for paper_info in paper_infos:
-                paper_file_name:str = paper_info['identifyId']
-                return_string += f"[[{paper_file_name}-intro|{paper_info['title']}]] <br>"
-            return return_string
-
-        def createPaperLinkString(source_info, citation_info):
-            return_string = f"{citation_info['paperId']}-->{source_info['paperId']}"
-            return return_string 
-        paper_id = self.paperData['paperId']
-        reference_ids = self.GetReferences(paper_id)
-        citation_ids = self.GetCitations(paper_id)
-        current_paper_info = self.GetPapersInformation([paper_id])[0]
-        reference_infos = self.GetPapersInformation((reference_ids))
-        reference_link = [[ reference_info, current_paper_info] for reference_info in reference_infos]
-        citation_infos = self.GetPapersInformation(citation_ids)
-        citation_link = [[ current_paper_info, citation_info] for citation_info in citation_infos]
-        paper_link = reference_link + citation_link
-        paper_infos = reference_infos + citation_infos
-        paper_infos.append(current_paper_info)
-        newline_sign = '\n'
-        if len(reference_ids)+len(citation_ids)>0:
-            mermaid_string = f"""## Relationship
-```mermaid
-graph TD;
-{newline_sign.join([f"{paper_info['paperId']}[{paper_info['title']}]" for paper_info in paper_infos])}
-\n
-{newline_sign.join([f"{createPaperLinkString(link[0], link[1])}" for link in paper_link])}
-```
-{createPaperInternalLink(paper_infos=paper_infos)}
-"""
-        else:
-            mermaid_string = ""
-        return mermaid_string
-    
-    def GetPapersInformation(self, paper_ids:list):
-        sql = f"""
-            SELECT * FROM paper_information WHERE paperId IN ('{"','".join(paper_ids)}')
+            SqliteHelper('paper_db').ExecuteUpdate(PaperProcessor.INSERT_LINK_SQL, paper_link_list)
+            citation_graph.Sync()
+        self.RewritePaperInformation(paper_ids_need_to_rewrite, renderer)
+
+    @staticmethod
+    @Metrics.Timed('stage', stage='bulk_ingest')
+    def BulkIngest(processors:list, target_dirs:list, renderer:PaperNoteRenderer=None):
+        """
+        Upsert the papers of `processors` (stored in the matching `target_dirs`) and
+        their links in a single transaction, then mark the batch and the library
+        papers it links to dirty. The notes are rendered once by `renderer.Flush()`,
+        immediately when no renderer is passed in.
         """
-        result = SqliteHelper('paper_db').ExecuteDictSelect(sql)
-        return result
+        if not processors:
+            return
+        paper_rows = [processor.GetPaperRow(target_dir) for processor, target_dir in zip(processors, target_dirs)]
+        batch_paper_ids = {paper_row['paperId'] for paper_row in paper_rows}
+        citation_graph = CitationGraphIndex.ForService('paper_db')
+        paper_link_list = []
+        paper_ids_need_to_rewrite = set(batch_paper_ids)
+        for processor in processors:
+            paper_links, rewrite_ids = processor.GetPaperLinks(citation_graph, batch_paper_ids)
+            paper_link_list.extend(paper_links)
+            paper_ids_need_to_rewrite.update(rewrite_ids)
+        SqliteHelper('paper_db').ExecuteTransaction([
+            (PaperProcessor.UPSERT_PAPER_SQL, paper_rows),
+            (PaperProcessor.INSERT_LINK_SQL, paper_link_list)
+        ])
+        citation_graph.Sync()
+        PaperProcessor.RewritePaperInformation(paper_ids_need_to_rewrite, renderer)
+
+    @staticmethod
+    def RewritePaperInformation(paper_ids, renderer:PaperNoteRenderer=None):
+        if renderer is not None:
+            renderer.MarkDirty(paper_ids)
+        elif len(paper_ids)>0:
+            renderer = PaperNoteRenderer('paper_db')
+            renderer.MarkDirty(paper_ids)
+            renderer.Flush()
+
+    @Metrics.Timed('stage', stage='create_link_string')
+    def CreateLinkString(self, paper_id=None, store:PaperRowStore=None):
+        if paper_id is None:
+            paper_id = self.paperData['paperId']
+        store = store if store is not None else PaperRowStore('paper_db')
+        reference_ids = sorted(self.GetReferences(paper_id))
+        citation_ids = sorted(self.GetCitations(paper_id))
+        store.Load([paper_id] + reference_ids + citation_ids)
+        current_paper_info = store.Get(paper_id)
+        reference_infos = self.GetPapersInformation(reference_ids, store)
+        citation_infos = self.GetPapersInformation(citation_ids, store)
+        return PaperNoteRenderer.RenderRelationship(current_paper_info, reference_infos, citation_infos)
+    
+    def GetPapersInformation(self, paper_ids:list, store:PaperRowStore=None):
+        store = store if store is not None else PaperRowStore('paper_db')
+        return store.List(paper_ids)
 
     def GetReferences(self, paperId):
-        sql = f"""
-            SELECT source_id FROM paper_link WHERE citation_id = '{paperId}'
-        """
-        result = SqliteHelper('paper_db').ExecuteSelect(sql)
+        sql = "SELECT source_id FROM paper_link WHERE citation_id = :paperId"
+        result = SqliteHelper('paper_db').ExecuteSelect(sql, {'paperId': paperId})
         return [sub_result[0] for sub_result in result]
         
     def GetCitations(self, paperId):
-        sql = f"""
-            SELECT citation_id FROM paper_link WHERE source_id = '{paperId}'
-        """
-        result = SqliteHelper('paper_db').ExecuteSelect(sql)
+        sql = "SELECT citation_id FROM paper_link WHERE source_id = :paperId"
+        result = SqliteHelper('paper_db').ExecuteSelect(sql, {'paperId': paperId})
         return [sub_result[0] for sub_result in result]
     
-    def GeneratePaperFolderByData(self, pdf_file_data, target_folder):
+    def GeneratePaperFolderByData(self, pdf_file_data, target_folder, renderer:PaperNoteRenderer=None):
         paper_id = self.getPaperId()
         paper_path = os.path.join(target_folder, f"{paper_id}.pdf")
-        with open(paper_path, 'wb') as fp:
+        with Metrics.Span('fs_operation', operation='write_pdf'), open(paper_path, 'wb') as fp:
             fp.write(pdf_file_data)
-        md_path = os.path.join(os.path.join(target_folder, f"{paper_id}-intro.md"))
         self.GeneratePaperSetting(target_folder)
-        self.UpdatePaperInfo(target_folder)
-        self.WritePaperInfo(md_path)
         self.GeneratePaperNote(paper_id, target_folder)
-        self.UpdatePaperLink()
+        self.RegisterPaper(target_folder, renderer)
 
-    def CreateNewPaperFolder(self, pdf_file_path, target_folder):
+    @Metrics.Timed('stage', stage='stage_paper_folder')
+    def StagePaperFolder(self, pdf_file_path, target_folder):
         paper_id = self.getPaperId()
         paperPath = os.path.join(target_folder, f"{paper_id}.pdf")
         if not os.path.exists(paperPath):
-            os.rename(pdf_file_path, paperPath)
-        mdPath = os.path.join(os.path.join(target_folder, f"{paper_id}-intro.md"))
+            with Metrics.Span('fs_operation', operation='rename'):
+                os.rename(pdf_file_path, paperPath)
         self.GeneratePaperSetting(target_folder)
-        self.UpdatePaperInfo(target_folder)
-        self.WritePaperInfo(mdPath)
         self.GeneratePaperNote(paper_id, target_folder)
-        self.UpdatePaperLink()
+
+    def CreateNewPaperFolder(self, pdf_file_path, target_folder, renderer:PaperNoteRenderer=None):
+        self.StagePaperFolder(pdf_file_path, target_folder)
+        self.RegisterPaper(target_folder, renderer)
+        PdfContentIndex('paper_db').Register([(self.paperData['paperId'], os.path.join(target_folder, f"{self.getPaperId()}.pdf"))])
+
+    @Metrics.Timed('stage', stage='register_paper')
+    def RegisterPaper(self, target_folder, renderer:PaperNoteRenderer=None):
+        flush = renderer is None
+        if flush:
+            renderer = PaperNoteRenderer('paper_db')
+        self.UpdatePaperInfo(target_folder)
+        renderer.MarkDirty([self.paperData['paperId']])
+        self.UpdatePaperLink(renderer)
+        if flush:
+            renderer.Flush()
 
 class PaperDataChecker:
-    def __init__(self):
-        pass
-    def checkPaperInDb(self):
-        sql = "SELECT paperId, paperPath FROM paper_information;"
-        paper_infos = SqliteHelper('paper_db').ExecuteDictSelect(sql)
-        paper_not_exist = [paper_info for paper_info in paper_infos if not os.path.exists(paper_info['paperPath'])]
-        sql = "DELETE FROM paper_information WHERE paperId = :paperId"
-        affect_rows = SqliteHelper('paper_db').ExecuteUpdate(sql, paper_not_exist)
-        print(f"Delete {affect_rows} rows which paper path is invalid.")
-        sql = "DELETE FROM paepr_link WHERE source_id = :paperId"
-        SqliteHelper('paper_db').ExecuteUpdate(sql, paper_not_exist)
-        sql = "DELETE FROM paper_link WHERE citation_id = :paperId"
-        SqliteHelper('paper_db').ExecuteUpdate(sql, paper_not_exist)
+    def __init__(self, library_dirs:list=None, workers:int=16):
+        self.library_dirs = library_dirs
+        self.workers = workers
+    def checkPaperInDb(self, dry_run:bool=False):
+        if not dry_run:
+            PaperProcessor.CreateOrIgnorePaperTable()
+        report = LibraryIntegrityScanner('paper_db', self.library_dirs, self.workers).Scan(dry_run)
+        print(f"{'Would delete' if dry_run else 'Delete'} {len(report['removed'])} rows which paper path is invalid.")
+        return report
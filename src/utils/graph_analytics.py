@@ -0,0 +1,311 @@
+import threading, itertools
+from src.utils.sqliteconnector import SqliteHelper
+from src.utils.citation_graph import CitationGraphIndex
+
+class CitationGraphAnalytics:
+    """
+    Materialized PageRank, degree and similarity scores of the citation graph.
+
+    The graph held by CitationGraphIndex is turned into a CSR matrix A with
+    A[i, j] = 1 when paper i cites paper j. PageRank is computed by power
+    iteration warm started from the stored scores, co-citation is A^T A and
+    bibliographic coupling is A A^T, both cosine normalized (citers and
+    references with more than HUB_DEGREE links are left out of the products).
+    The top `top_k` similar library papers of every library paper are kept in
+    paper_similarity.
+
+    `Refresh` compares the link/paper fingerprint with the one stored by the
+    last run. When links or papers were only added, similarity rows are
+    recomputed for the papers whose co-citation or coupling neighbourhood
+    touches the new rows; deletions, seen through the delete counter of
+    CitationGraphIndex, trigger a full recompute.
+
+    `Central` and `Similar` never wait for a recompute: they serve the tables
+    stored by the last run and, when the graph moved on since, start `Refresh`
+    on a background thread.
+
+    numpy and scipy are only imported when a recompute is needed.
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS paper_metrics
+(
+paperId VARCHAR(128) PRIMARY KEY,
+pagerank REAL NOT NULL,
+inDegree INT NOT NULL,
+outDegree INT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS paper_metrics_pagerank ON paper_metrics(pagerank DESC);
+
+CREATE TABLE IF NOT EXISTS paper_similarity
+(
+paperId VARCHAR(128) NOT NULL,
+similarId VARCHAR(128) NOT NULL,
+coCitation INT NOT NULL,
+coupling INT NOT NULL,
+score REAL NOT NULL,
+PRIMARY KEY (paperId, similarId)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS paper_similarity_score ON paper_similarity(paperId, score DESC);
+
+CREATE TABLE IF NOT EXISTS graph_analytics_state
+(
+name VARCHAR(32) PRIMARY KEY,
+value INT NOT NULL
+);
+"""
+    STATE_KEYS = ['lastPaperRowid', 'paperCount', 'lastLinkRowid', 'linkCount', 'deleteVersion']
+    DAMPING = 0.85
+    TOLERANCE = 1e-10
+    MAX_ITERATIONS = 100
+    CHUNK_COST = 4000000
+    HUB_DEGREE = 1000
+    analytics = {}
+    _lock = threading.Lock()
+
+    def __init__(self, service:str='paper_db', top_k:int=20):
+        self.service = service
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self.refresh_thread = None
+        self.stored_fingerprint = None
+        SqliteHelper(service).EnsureSchema('graph_analytics', CitationGraphAnalytics.SCHEMA)
+
+    @classmethod
+    def ForService(cls, service:str='paper_db'):
+        with cls._lock:
+            if service not in cls.analytics:
+                cls.analytics[service] = cls(service)
+        return cls.analytics[service]
+
+    def LoadState(self) -> dict:
+        sql = "SELECT name, value FROM graph_analytics_state"
+        return dict(SqliteHelper(self.service).ExecuteSelect(sql))
+
+    @staticmethod
+    def Fingerprint(citation_graph:CitationGraphIndex) -> dict:
+        with citation_graph._lock:
+            return {
+                'lastPaperRowid': citation_graph.last_paper_rowid,
+                'paperCount': citation_graph.paper_count,
+                'lastLinkRowid': citation_graph.last_link_rowid,
+                'linkCount': citation_graph.link_count,
+                'deleteVersion': citation_graph.delete_version
+            }
+
+    @staticmethod
+    def BuildMatrix(citation_graph:CitationGraphIndex):
+        import numpy as np
+        from scipy import sparse
+        with citation_graph._lock:
+            paper_ids = list(citation_graph.paper_ids)
+            in_library = np.frombuffer(bytes(citation_graph.in_library), dtype=np.uint8).astype(bool)
+            lengths = np.fromiter((len(references) for references in citation_graph.references), dtype=np.int64, count=len(paper_ids))
+            indices = np.fromiter(itertools.chain.from_iterable(citation_graph.references), dtype=np.int64, count=int(lengths.sum()))
+            fingerprint = CitationGraphAnalytics.Fingerprint(citation_graph)
+        node_count = len(paper_ids)
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(node_count, node_count))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0
+        return paper_ids, in_library, matrix, fingerprint
+
+    def PageRank(self, matrix, paper_ids:list):
+        import numpy as np
+        node_count = matrix.shape[0]
+        sql = "SELECT paperId, pagerank FROM paper_metrics"
+        previous = dict(SqliteHelper(self.service).ExecuteSelect(sql))
+        rank = np.fromiter((previous.get(paper_id, 1.0 / node_count) for paper_id in paper_ids), dtype=np.float64, count=node_count)
+        rank /= rank.sum()
+        out_degree = np.diff(matrix.indptr)
+        dangling = out_degree == 0
+        inverse_out_degree = np.divide(1.0, out_degree, out=np.zeros(node_count), where=~dangling)
+        transposed = matrix.T.tocsr()
+        for _ in range(CitationGraphAnalytics.MAX_ITERATIONS):
+            next_rank = CitationGraphAnalytics.DAMPING * (transposed @ (rank * inverse_out_degree))
+            next_rank += (CitationGraphAnalytics.DAMPING * rank[dangling].sum() + 1.0 - CitationGraphAnalytics.DAMPING) / node_count
+            error = np.abs(next_rank - rank).sum()
+            rank = next_rank
+            if error < node_count * CitationGraphAnalytics.TOLERANCE:
+                break
+        return rank
+
+    @staticmethod
+    def AffectedNodes(matrix, in_library, seeds):
+        """Library nodes whose co-citation or coupling rows can change when `seeds` gain links."""
+        import numpy as np
+        seed_vector = np.zeros(matrix.shape[0])
+        seed_vector[list(seeds)] = 1.0
+        citers = matrix @ seed_vector
+        references = matrix.T @ seed_vector
+        partners = matrix.T @ citers + matrix @ references + seed_vector
+        return np.flatnonzero((partners > 0) & in_library)
+
+    def Similarity(self, matrix, paper_ids:list, in_library, nodes) -> list:
+        import numpy as np
+        from scipy import sparse
+        in_degree = np.asarray(matrix.getnnz(axis=0), dtype=np.float64)
+        out_degree = np.asarray(matrix.getnnz(axis=1), dtype=np.float64)
+        inverse_in = np.divide(1.0, np.sqrt(in_degree), out=np.zeros_like(in_degree), where=in_degree > 0)
+        inverse_out = np.divide(1.0, np.sqrt(out_degree), out=np.zeros_like(out_degree), where=out_degree > 0)
+        # surveys citing thousands of papers and references cited by thousands of papers
+        # carry little signal and would make every row dense, so they are left out
+        citing = (sparse.diags((out_degree <= CitationGraphAnalytics.HUB_DEGREE).astype(np.float64)) @ matrix).tocsr()
+        cited = (matrix @ sparse.diags((in_degree <= CitationGraphAnalytics.HUB_DEGREE).astype(np.float64))).tocsr()
+        citing.eliminate_zeros()
+        cited.eliminate_zeros()
+        citing_transposed = citing.T.tocsr()
+        cited_transposed = cited.T.tocsr()
+        # bound the intermediate products: a row costs the neighbours of its neighbours
+        row_cost = (citing_transposed @ np.diff(citing.indptr) + cited @ np.diff(cited_transposed.indptr))[nodes] + 1
+        chunk_ids = np.floor_divide(np.cumsum(row_cost), CitationGraphAnalytics.CHUNK_COST)
+        boundaries = np.flatnonzero(np.diff(chunk_ids)) + 1
+        rows = []
+        for chunk in np.split(np.asarray(nodes), boundaries):
+            if len(chunk) == 0:
+                continue
+            co_citation = (citing_transposed[chunk] @ citing).tocsr()
+            coupling = (cited[chunk] @ cited_transposed).tocsr()
+            co_citation.sort_indices()
+            coupling.sort_indices()
+            score = 0.5 * (sparse.diags(inverse_in[chunk]) @ co_citation @ sparse.diags(inverse_in)
+                           + sparse.diags(inverse_out[chunk]) @ coupling @ sparse.diags(inverse_out))
+            score = score.tocsr()
+            score.eliminate_zeros()
+            for local, node in enumerate(chunk):
+                columns = score.indices[score.indptr[local]:score.indptr[local + 1]]
+                values = score.data[score.indptr[local]:score.indptr[local + 1]]
+                keep = (columns != node) & in_library[columns]
+                columns, values = columns[keep], values[keep]
+                if len(columns) > self.top_k:
+                    top = np.argpartition(-values, self.top_k)[:self.top_k]
+                    columns, values = columns[top], values[top]
+                co_counts = self.RowValues(co_citation, local, columns)
+                coupling_counts = self.RowValues(coupling, local, columns)
+                for column, value, co_count, coupling_count in zip(columns, values, co_counts, coupling_counts):
+                    rows.append({
+                        'paperId': paper_ids[node],
+                        'similarId': paper_ids[column],
+                        'coCitation': int(co_count),
+                        'coupling': int(coupling_count),
+                        'score': float(value)
+                    })
+        return rows
+
+    @staticmethod
+    def RowValues(matrix, row:int, columns):
+        import numpy as np
+        row_columns = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+        row_values = matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]]
+        if len(row_columns) == 0:
+            return np.zeros(len(columns))
+        positions = np.minimum(np.searchsorted(row_columns, columns), len(row_columns) - 1)
+        return np.where(row_columns[positions] == columns, row_values[positions], 0)
+
+    def Refresh(self, force:bool=False) -> bool:
+        """Recompute the materialized tables when paper_link changed; return whether anything ran."""
+        with self._lock:
+            citation_graph = CitationGraphIndex.ForService(self.service)
+            state = self.LoadState()
+            self.stored_fingerprint = [state.get(key) for key in CitationGraphAnalytics.STATE_KEYS]
+            fingerprint = self.Fingerprint(citation_graph)
+            if not force and self.stored_fingerprint == [fingerprint[key] for key in CitationGraphAnalytics.STATE_KEYS]:
+                return False
+            paper_ids, in_library, matrix, fingerprint = self.BuildMatrix(citation_graph)
+            seeds = None if force else self.ChangedSeeds(state, fingerprint, citation_graph)
+            statements = []
+            if paper_ids:
+                import numpy as np
+                rank = self.PageRank(matrix, paper_ids)
+                in_degree = matrix.getnnz(axis=0)
+                out_degree = matrix.getnnz(axis=1)
+                library_nodes = np.flatnonzero(in_library)
+                metrics = [{'paperId': paper_ids[node], 'pagerank': float(rank[node]), 'inDegree': int(in_degree[node]), 'outDegree': int(out_degree[node])} for node in library_nodes]
+                statements.append(("DELETE FROM paper_metrics", {}))
+                statements.append(("INSERT INTO paper_metrics (paperId, pagerank, inDegree, outDegree) VALUES (:paperId, :pagerank, :inDegree, :outDegree)", metrics))
+                if seeds is None:
+                    nodes = library_nodes
+                    statements.append(("DELETE FROM paper_similarity", {}))
+                else:
+                    nodes = self.AffectedNodes(matrix, in_library, seeds) if seeds else np.array([], dtype=np.int64)
+                    statements.append(("DELETE FROM paper_similarity WHERE paperId = :paperId", [{'paperId': paper_ids[node]} for node in nodes]))
+                statements.append(("""
+                INSERT INTO paper_similarity (paperId, similarId, coCitation, coupling, score)
+                VALUES (:paperId, :similarId, :coCitation, :coupling, :score)
+                """, self.Similarity(matrix, paper_ids, in_library, nodes)))
+            else:
+                statements.append(("DELETE FROM paper_metrics", {}))
+                statements.append(("DELETE FROM paper_similarity", {}))
+            statements.append(("""
+            INSERT INTO graph_analytics_state (name, value) VALUES (:name, :value)
+            ON CONFLICT(name) DO UPDATE SET value=excluded.value;
+            """, [{'name': name, 'value': fingerprint[name]} for name in CitationGraphAnalytics.STATE_KEYS]))
+            SqliteHelper(self.service).ExecuteTransaction(statements)
+            self.stored_fingerprint = [fingerprint[key] for key in CitationGraphAnalytics.STATE_KEYS]
+            return True
+
+    def Stale(self) -> bool:
+        fingerprint = self.Fingerprint(CitationGraphIndex.ForService(self.service))
+        if self.stored_fingerprint is None:
+            state = self.LoadState()
+            self.stored_fingerprint = [state.get(key) for key in CitationGraphAnalytics.STATE_KEYS]
+        return self.stored_fingerprint != [fingerprint[key] for key in CitationGraphAnalytics.STATE_KEYS]
+
+    def RefreshInBackground(self) -> bool:
+        """Start `Refresh` on a daemon thread when the graph changed and none is running; return whether one started."""
+        if not self.Stale():
+            return False
+        with self._thread_lock:
+            if self.refresh_thread is not None and self.refresh_thread.is_alive():
+                return False
+            self.refresh_thread = threading.Thread(target=self.RefreshQuietly, name=f"graph-analytics-{self.service}", daemon=True)
+            self.refresh_thread.start()
+        return True
+
+    def RefreshQuietly(self):
+        try:
+            self.Refresh()
+        except Exception as e:
+            print(f"Failed to refresh the graph analytics of {self.service}: {e}")
+
+    def ChangedSeeds(self, state:dict, fingerprint:dict, citation_graph:CitationGraphIndex):
+        """Nodes touched by rows added since the last run, or None when a full recompute is needed."""
+        if any(key not in state for key in CitationGraphAnalytics.STATE_KEYS):
+            return None
+        if fingerprint['deleteVersion'] != state['deleteVersion']:
+            return None
+        sql = "SELECT paperId FROM paper_information WHERE id > :lastRowid AND id <= :maxRowid"
+        new_papers = SqliteHelper(self.service).ExecuteSelect(sql, {'lastRowid': state['lastPaperRowid'], 'maxRowid': fingerprint['lastPaperRowid']})
+        sql = "SELECT source_id, citation_id FROM paper_link WHERE id > :lastRowid AND id <= :maxRowid"
+        new_links = SqliteHelper(self.service).ExecuteSelect(sql, {'lastRowid': state['lastLinkRowid'], 'maxRowid': fingerprint['lastLinkRowid']})
+        if len(new_papers) != fingerprint['paperCount'] - state['paperCount'] or len(new_links) != fingerprint['linkCount'] - state['linkCount']:
+            return None
+        paper_ids = {paper_id for (paper_id,) in new_papers}
+        for source_id, citation_id in new_links:
+            paper_ids.update((source_id, citation_id))
+        return {citation_graph.node_ids[paper_id] for paper_id in paper_ids if paper_id in citation_graph.node_ids}
+
+    def Central(self, limit:int=20, offset:int=0) -> list:
+        self.RefreshInBackground()
+        sql = """
+        SELECT paper_metrics.paperId, paper_metrics.pagerank, paper_metrics.inDegree, paper_metrics.outDegree,
+        paper_information.identifyId, paper_information.title, paper_information.publicationDate, paper_information.citationCount
+        FROM paper_metrics JOIN paper_information ON paper_information.paperId = paper_metrics.paperId
+        ORDER BY paper_metrics.pagerank DESC
+        LIMIT :limit OFFSET :offset
+        """
+        return SqliteHelper(self.service).ExecuteDictSelect(sql, {'limit': limit, 'offset': offset})
+
+    def Similar(self, paper_id:str, limit:int=20) -> list:
+        self.RefreshInBackground()
+        sql = """
+        SELECT paper_similarity.similarId AS paperId, paper_similarity.score, paper_similarity.coCitation, paper_similarity.coupling,
+        paper_information.identifyId, paper_information.title, paper_information.publicationDate, paper_information.citationCount
+        FROM paper_similarity JOIN paper_information ON paper_information.paperId = paper_similarity.similarId
+        WHERE paper_similarity.paperId = :paperId
+        ORDER BY paper_similarity.score DESC
+        LIMIT :limit
+        """
+        return SqliteHelper(self.service).ExecuteDictSelect(sql, {'paperId': paper_id, 'limit': limit})
@@ -0,0 +1,123 @@
+import os, json, time, random, threading
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.metrics import Metrics
+BASEFOLDER = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+class TokenBucket:
+    def __init__(self, rate:float, capacity:float=None):
+        self.rate = rate
+        self.capacity = capacity if capacity else max(1, rate or 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def Acquire(self, tokens:float=1):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class MetadataHttpClient:
+    """
+    Shared HTTP client for the metadata providers.
+
+    One client exists per provider and keeps a pooled keep-alive session, a token
+    bucket sized to the provider's published rate limit and a thread pool used to
+    fan requests out. 429 and 5xx responses are retried with exponential backoff,
+    honouring Retry-After when the provider sends it.
+
+    The base url of every provider can be overridden through the environment
+    variable named in `base_url_env`, which is how the client is pointed at a
+    local stub server.
+    """
+    clients = {}
+    _lock = threading.Lock()
+    config_path = os.path.join(BASEFOLDER, "src", "config", "provider_list.json")
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, provider:str, base_url:str=None, **overrides):
+        with open(self.config_path) as provider_config_file:
+            config = json.load(provider_config_file)[provider]
+        config.update(overrides)
+        self.provider = provider
+        self.base_url = (base_url or os.environ.get(config.get('base_url_env', ''), None) or config['base_url']).rstrip('/')
+        self.timeout = config.get('timeout', 30)
+        self.max_retries = config.get('max_retries', 5)
+        self.backoff = config.get('backoff', 1.0)
+        self.max_workers = config.get('max_workers', 4)
+        self.batch_size = config.get('batch_size', 100)
+        self.bucket = TokenBucket(config.get('rate'), config.get('burst'))
+        # requests is only imported once a provider client is built, not when the module loads
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.get('pool_size', 16), pool_maxsize=config.get('pool_size', 16))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        api_key = os.environ.get(config.get('api_key_env', ''), None)
+        if api_key:
+            self.session.headers[config['api_key_header']] = api_key
+        mailto = os.environ.get(config.get('mailto_env', ''), None)
+        if mailto:
+            self.session.params = {'mailto': mailto}
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{provider}-http")
+
+    @classmethod
+    def ForProvider(cls, provider:str):
+        with cls._lock:
+            if provider not in cls.clients:
+                cls.clients[provider] = cls(provider)
+            return cls.clients[provider]
+
+    def Url(self, path:str) -> str:
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def RetryDelay(self, attempt:int, response=None) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def Request(self, method:str, path:str, **kwargs) -> 'requests.Response':
+        from requests import ConnectionError, Timeout
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.Url(path)
+        for attempt in range(self.max_retries + 1):
+            with Metrics.Span('provider_rate_limit_wait', provider=self.provider):
+                self.bucket.Acquire()
+            try:
+                with Metrics.Span('provider_request', provider=self.provider, method=method):
+                    response = self.session.request(method, url, **kwargs)
+            except (ConnectionError, Timeout):
+                if attempt == self.max_retries:
+                    raise
+                Metrics.Count('provider_retries_total', provider=self.provider)
+                time.sleep(self.RetryDelay(attempt))
+                continue
+            Metrics.Count('provider_responses_total', provider=self.provider, status=response.status_code)
+            if response.status_code not in MetadataHttpClient.RETRY_STATUS or attempt == self.max_retries:
+                return response
+            Metrics.Count('provider_retries_total', provider=self.provider)
+            time.sleep(self.RetryDelay(attempt, response))
+        return response
+
+    def Get(self, path:str, params:dict=None, **kwargs) -> 'requests.Response':
+        return self.Request('GET', path, params=params, **kwargs)
+
+    def Post(self, path:str, params:dict=None, json:dict=None, **kwargs) -> 'requests.Response':
+        return self.Request('POST', path, params=params, json=json, **kwargs)
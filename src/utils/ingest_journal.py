@@ -0,0 +1,89 @@
+import hashlib, datetime
+from src.utils.sqliteconnector import SqliteHelper
+
+class IngestJournal:
+    """
+    Write-ahead journal of the files handled by one ingest job.
+
+    Every file is recorded with the last stage it completed (see STAGES). A job
+    is identified by a key derived from its arguments, so running the same
+    import again after a crash finds the entries of the interrupted run and
+    resumes each file from its recorded stage. The entries are cleared once the
+    job has completed. The table is only created by the first write, so a dry
+    run reading the journal of a fresh library leaves the database alone.
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_journal
+(
+id INTEGER PRIMARY KEY AUTOINCREMENT,
+jobKey VARCHAR(64) NOT NULL,
+sourcePath TEXT NOT NULL,
+stage VARCHAR(16) NOT NULL,
+paperId VARCHAR(128),
+folder TEXT,
+targetPath TEXT,
+updateTime TEXT NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ingest_journal_entry ON ingest_journal(jobKey, sourcePath);
+"""
+    # the paper row upsert and its links are committed in one transaction, so
+    # 'linked' also marks the row as written.
+    STAGES = ['extracted', 'fetched', 'moved', 'linked', 'rendered']
+
+    def __init__(self, job_key:str, service:str='paper_db'):
+        self.job_key = job_key
+        self.service = service
+
+    def CreateOrIgnoreJournalTable(self):
+        return SqliteHelper(self.service).EnsureSchema('ingest_journal', IngestJournal.SCHEMA)
+
+    @staticmethod
+    def JobKey(*args) -> str:
+        return hashlib.sha1('\0'.join(str(arg) for arg in args).encode('utf8')).hexdigest()
+
+    @staticmethod
+    def Reached(stage:str, target_stage:str) -> bool:
+        return stage in IngestJournal.STAGES and IngestJournal.STAGES.index(stage) >= IngestJournal.STAGES.index(target_stage)
+
+    def Load(self) -> dict:
+        if 'ingest_journal' not in SqliteHelper(self.service).Tables():
+            return dict()
+        sql = "SELECT sourcePath, stage, paperId, folder, targetPath FROM ingest_journal WHERE jobKey = :jobKey"
+        return {row['sourcePath']: row for row in SqliteHelper(self.service).ExecuteDictSelect(sql, {'jobKey': self.job_key})}
+
+    def Record(self, stage:str, entries:list):
+        """Record (sourcePath, paperId, folder, targetPath) tuples as having completed `stage`."""
+        if not entries:
+            return 0
+        update_time = datetime.datetime.now().isoformat(timespec='seconds')
+        rows = [{
+            'jobKey': self.job_key,
+            'sourcePath': source_path,
+            'stage': stage,
+            'paperId': paper_id,
+            'folder': folder,
+            'targetPath': target_path,
+            'updateTime': update_time
+        } for source_path, paper_id, folder, target_path in entries]
+        self.CreateOrIgnoreJournalTable()
+        sql = """
+        INSERT INTO ingest_journal (jobKey, sourcePath, stage, paperId, folder, targetPath, updateTime)
+        VALUES (:jobKey, :sourcePath, :stage, :paperId, :folder, :targetPath, :updateTime)
+        ON CONFLICT(jobKey, sourcePath) DO UPDATE SET stage=excluded.stage,
+        paperId=COALESCE(excluded.paperId, paperId), folder=COALESCE(excluded.folder, folder),
+        targetPath=COALESCE(excluded.targetPath, targetPath), updateTime=excluded.updateTime;
+        """
+        return SqliteHelper(self.service).ExecuteUpdate(sql, rows)
+
+    def Forget(self, source_paths:list):
+        if not source_paths:
+            return 0
+        self.CreateOrIgnoreJournalTable()
+        sql = "DELETE FROM ingest_journal WHERE jobKey = :jobKey AND sourcePath = :sourcePath"
+        return SqliteHelper(self.service).ExecuteUpdate(sql, [{'jobKey': self.job_key, 'sourcePath': source_path} for source_path in source_paths])
+
+    def Clear(self):
+        self.CreateOrIgnoreJournalTable()
+        sql = "DELETE FROM ingest_journal WHERE jobKey = :jobKey"
+        return SqliteHelper(self.service).ExecuteUpdate(sql, {'jobKey': self.job_key})
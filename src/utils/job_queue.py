@@ -0,0 +1,161 @@
+import os, json, uuid, datetime
+from src.utils.sqliteconnector import SqliteHelper
+
+class JobQueue:
+    """
+    SQLite backed queue of the background jobs run by JobWorkerPool.
+
+    A job goes queued -> running -> succeeded | failed | cancelled. Workers
+    claim the oldest queued job with one conditional UPDATE tagged with a claim
+    token, so a job is never handed to two workers. Cancelling a queued job is
+    immediate; a running job only gets `cancelRequested` set, which its worker
+    picks up on the next heartbeat and stops at the next safe point. A running
+    job whose heartbeat is older than `heartbeat_timeout` (or whose worker PID
+    is gone) is lost and queued again by `Recover`, which the idle workers run
+    periodically; the register and update jobs resume from their ingest journal.
+    PAPER_JOB_HEARTBEAT_TIMEOUT overrides the timeout.
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs
+(
+jobId VARCHAR(32) PRIMARY KEY,
+kind VARCHAR(32) NOT NULL,
+params TEXT NOT NULL,
+status VARCHAR(16) NOT NULL,
+progress TEXT,
+result TEXT,
+error TEXT,
+cancelRequested INT NOT NULL DEFAULT 0,
+attempts INT NOT NULL DEFAULT 0,
+claimToken VARCHAR(32),
+workerPid INT,
+createTime TEXT NOT NULL,
+startTime TEXT,
+heartbeatTime TEXT,
+finishTime TEXT
+);
+
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, createTime);
+"""
+    FINISHED = ('succeeded', 'failed', 'cancelled')
+    MAX_ATTEMPTS = 3
+    HEARTBEAT_TIMEOUT = 30.0
+    COLUMNS = "jobId, kind, params, status, progress, result, error, cancelRequested, attempts, workerPid, createTime, startTime, heartbeatTime, finishTime"
+
+    def __init__(self, service:str='job_db', heartbeat_timeout:float=None):
+        self.service = service
+        self.heartbeat_timeout = heartbeat_timeout if heartbeat_timeout is not None else float(os.environ.get('PAPER_JOB_HEARTBEAT_TIMEOUT', JobQueue.HEARTBEAT_TIMEOUT))
+        SqliteHelper(service).EnsureSchema('jobs', JobQueue.SCHEMA)
+
+    @staticmethod
+    def Now() -> str:
+        return datetime.datetime.now().isoformat(timespec='milliseconds')
+
+    @staticmethod
+    def Decode(row:dict) -> dict:
+        job = dict(row)
+        for key in ('params', 'progress', 'result'):
+            job[key] = json.loads(job[key]) if job[key] else None
+        job['cancelRequested'] = bool(job['cancelRequested'])
+        return job
+
+    def Submit(self, kind:str, params:dict) -> dict:
+        job_id = uuid.uuid4().hex
+        sql = """
+        INSERT INTO jobs (jobId, kind, params, status, createTime)
+        VALUES (:jobId, :kind, :params, 'queued', :createTime)
+        """
+        SqliteHelper(self.service).ExecuteTransaction([(sql, {'jobId': job_id, 'kind': kind, 'params': json.dumps(params), 'createTime': self.Now()})])
+        return self.Get(job_id)
+
+    def Get(self, job_id:str) -> dict:
+        rows = SqliteHelper(self.service).ExecuteDictSelect(f"SELECT {JobQueue.COLUMNS} FROM jobs WHERE jobId = :jobId", {'jobId': job_id})
+        return self.Decode(rows[0]) if rows else None
+
+    def List(self, status:str=None, limit:int=50, offset:int=0) -> list:
+        sql = f"SELECT {JobQueue.COLUMNS} FROM jobs {'WHERE status = :status' if status else ''} ORDER BY createTime DESC LIMIT :limit OFFSET :offset"
+        rows = SqliteHelper(self.service).ExecuteDictSelect(sql, {'status': status, 'limit': limit, 'offset': offset})
+        return [self.Decode(row) for row in rows]
+
+    def Cancel(self, job_id:str) -> dict:
+        """Cancel a queued job now, or ask the worker of a running job to stop. Returns the job, None when unknown."""
+        now = self.Now()
+        SqliteHelper(self.service).ExecuteTransaction([
+            ("UPDATE jobs SET status = 'cancelled', cancelRequested = 1, finishTime = :now WHERE jobId = :jobId AND status = 'queued'", {'jobId': job_id, 'now': now}),
+            ("UPDATE jobs SET cancelRequested = 1 WHERE jobId = :jobId AND status = 'running'", {'jobId': job_id}),
+        ])
+        return self.Get(job_id)
+
+    def Claim(self, worker_pid:int) -> dict:
+        """Atomically move the oldest queued job to running for `worker_pid`; None when the queue is empty."""
+        token = uuid.uuid4().hex
+        now = self.Now()
+        sql = """
+        UPDATE jobs SET status = 'running', claimToken = :token, workerPid = :pid, attempts = attempts + 1,
+        startTime = :now, heartbeatTime = :now
+        WHERE jobId = (SELECT jobId FROM jobs WHERE status = 'queued' ORDER BY createTime LIMIT 1) AND status = 'queued'
+        """
+        if not SqliteHelper(self.service).ExecuteUpdate(sql, {'token': token, 'pid': worker_pid, 'now': now}):
+            return None
+        rows = SqliteHelper(self.service).ExecuteDictSelect(f"SELECT {JobQueue.COLUMNS} FROM jobs WHERE claimToken = :token", {'token': token})
+        return self.Decode(rows[0]) if rows else None
+
+    def Heartbeat(self, job_id:str, progress:dict) -> bool:
+        """Store the progress of a running job; returns True once its cancellation was requested."""
+        sql = "UPDATE jobs SET progress = :progress, heartbeatTime = :now WHERE jobId = :jobId AND status = 'running'"
+        SqliteHelper(self.service).ExecuteUpdate(sql, {'jobId': job_id, 'progress': json.dumps(progress), 'now': self.Now()})
+        rows = SqliteHelper(self.service).ExecuteSelect("SELECT cancelRequested FROM jobs WHERE jobId = :jobId", {'jobId': job_id})
+        return bool(rows and rows[0][0])
+
+    def Finish(self, job_id:str, status:str, progress:dict=None, result:dict=None, error:str=None):
+        sql = """
+        UPDATE jobs SET status = :status, progress = COALESCE(:progress, progress), result = :result, error = :error, finishTime = :now
+        WHERE jobId = :jobId
+        """
+        SqliteHelper(self.service).ExecuteUpdate(sql, {
+            'jobId': job_id,
+            'status': status,
+            'progress': json.dumps(progress) if progress is not None else None,
+            'result': json.dumps(result, default=str) if result is not None else None,
+            'error': error,
+            'now': self.Now()
+        })
+
+    @staticmethod
+    def WorkerAlive(pid:int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, TypeError):
+            return pid is not None
+        return True
+
+    def Lost(self, row:dict, now:datetime.datetime) -> bool:
+        """
+        The heartbeat decides: a PID can be reused by another process, so a live
+        PID does not keep a silent job running. A dead PID only lets a job with a
+        recent heartbeat go without waiting for the timeout.
+        """
+        if not row['heartbeatTime']:
+            return True
+        if (now - datetime.datetime.fromisoformat(row['heartbeatTime'])).total_seconds() > self.heartbeat_timeout:
+            return True
+        return not self.WorkerAlive(row['workerPid'])
+
+    def Recover(self) -> int:
+        """Queue again the running jobs that are lost; fail them after MAX_ATTEMPTS."""
+        rows = SqliteHelper(self.service).ExecuteDictSelect("SELECT jobId, workerPid, attempts, cancelRequested, heartbeatTime FROM jobs WHERE status = 'running'")
+        lost = [row for row in rows if self.Lost(row, datetime.datetime.now())]
+        now = self.Now()
+        requeue = [{'jobId': row['jobId'], 'heartbeatTime': row['heartbeatTime']} for row in lost if row['attempts'] < JobQueue.MAX_ATTEMPTS and not row['cancelRequested']]
+        cancelled = [{'jobId': row['jobId'], 'heartbeatTime': row['heartbeatTime'], 'now': now} for row in lost if row['cancelRequested']]
+        failed = [{'jobId': row['jobId'], 'heartbeatTime': row['heartbeatTime'], 'now': now} for row in lost if row['attempts'] >= JobQueue.MAX_ATTEMPTS and not row['cancelRequested']]
+        # a job that sent a heartbeat since it was read is not lost after all
+        still_lost = "jobId = :jobId AND status = 'running' AND heartbeatTime IS :heartbeatTime"
+        SqliteHelper(self.service).ExecuteTransaction([
+            (f"UPDATE jobs SET status = 'queued', claimToken = NULL, workerPid = NULL WHERE {still_lost}", requeue),
+            (f"UPDATE jobs SET status = 'cancelled', finishTime = :now WHERE {still_lost}", cancelled),
+            (f"UPDATE jobs SET status = 'failed', error = 'Worker process lost', finishTime = :now WHERE {still_lost}", failed),
+        ])
+        return len(requeue)
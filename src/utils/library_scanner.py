@@ -0,0 +1,212 @@
+import os, json, time
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.sqliteconnector import SqliteHelper
+from src.utils.metrics import Metrics
+from src.utils.citation_graph import CitationGraphIndex
+from src.utils.content_index import PdfContentIndex
+from src.utils.note_renderer import PaperNoteRenderer
+
+class LibraryIntegrityScanner:
+    """
+    Consistency check between the paper folders on disk and paper_db.
+
+    Every paper folder is listed with one os.scandir call (in parallel) and
+    compared with the (paperPath, size, mtime) snapshot stored by the previous
+    scan; only folders whose PDF or config.json changed have their config read
+    again. Papers whose PDF disappeared are removed, papers whose folder was
+    moved are relocated, and the paper_link rows with an end that is not (or
+    no longer) in the library are dropped, all in one transaction. config.json files pointing
+    at another location are rewritten. Afterwards the papers missing from the
+    PdfContentIndex are hashed, so duplicate detection covers the whole library.
+    A dry run creates no table; the ones missing are read as empty.
+    """
+    # links are only written between library papers, so a link goes once either end is not
+    # in paper_information: removed by this scan, or already missing (left by earlier checkers)
+    ORPHAN_LINK_FILTER = """
+    WHERE source_id IN (SELECT value FROM json_each(:removed))
+    OR citation_id IN (SELECT value FROM json_each(:removed))
+    OR source_id NOT IN (SELECT paperId FROM paper_information)
+    OR citation_id NOT IN (SELECT paperId FROM paper_information)
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS library_snapshot
+(
+folder TEXT PRIMARY KEY,
+paperId VARCHAR(128),
+paperPath TEXT,
+size INT,
+mtimeNs INT,
+configMtimeNs INT
+);
+"""
+
+    def __init__(self, service:str='paper_db', library_dirs:list=None, workers:int=16):
+        self.service = service
+        self.library_dirs = library_dirs
+        self.workers = workers
+        self.content_index = PdfContentIndex(service, create_schema=False)
+
+    def CreateOrIgnoreTables(self):
+        SqliteHelper(self.service).EnsureSchema('library_snapshot', LibraryIntegrityScanner.SCHEMA)
+        self.content_index.CreateOrIgnoreHashTable()
+
+    def LibraryDirs(self, rows:dict) -> set:
+        if self.library_dirs:
+            return {os.path.abspath(library_dir) for library_dir in self.library_dirs}
+        return {os.path.dirname(os.path.abspath(row['location'])) for row in rows.values() if row['location']}
+
+    @staticmethod
+    def ListFolders(library_dir:str) -> list:
+        try:
+            return [entry.path for entry in os.scandir(library_dir) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    @staticmethod
+    def ListFolder(folder:str):
+        """Return (folder, {pdf name: (size, mtime_ns)}, config mtime_ns or None)."""
+        pdfs, config_mtime = dict(), None
+        try:
+            for entry in os.scandir(folder):
+                if entry.name.endswith('.pdf'):
+                    stat = entry.stat()
+                    pdfs[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                elif entry.name == 'config.json':
+                    config_mtime = entry.stat().st_mtime_ns
+        except OSError:
+            pass
+        return folder, pdfs, config_mtime
+
+    @staticmethod
+    def Unchanged(snapshot:dict, pdfs:dict, config_mtime) -> bool:
+        if snapshot is None or snapshot['configMtimeNs'] != config_mtime:
+            return False
+        if not snapshot['paperPath']:
+            return True
+        return pdfs.get(os.path.basename(snapshot['paperPath'])) == (snapshot['size'], snapshot['mtimeNs'])
+
+    @staticmethod
+    def Verify(folder:str, pdfs:dict, rewrite:bool=True) -> dict:
+        """Read the config of a changed folder; rewrite it when it points elsewhere."""
+        config_path = os.path.join(folder, 'config.json')
+        try:
+            with open(config_path, 'r') as fp:
+                config = json.load(fp)
+            paper_id, identify_id = config['paperId'], config['identifyId']
+        except (OSError, ValueError, KeyError, TypeError):
+            return {'paperId': None, 'paperPath': None, 'stale': False}
+        file_name = f"{identify_id}.pdf"
+        paper_path = os.path.join(folder, file_name) if file_name in pdfs else None
+        stale = False
+        if paper_path and (os.path.abspath(config.get('location') or '') != folder or os.path.abspath(config.get('paperPath') or '') != paper_path):
+            stale = True
+            if not rewrite:
+                return {'paperId': paper_id, 'paperPath': paper_path, 'stale': stale}
+            config['location'] = folder
+            config['paperPath'] = paper_path
+            config['mdPath'] = os.path.join(folder, f"{identify_id}-intro.md")
+            with Metrics.Span('fs_operation', operation='write_config'), open(config_path, 'w') as fp:
+                json.dump(config, fp, indent=4)
+        return {'paperId': paper_id, 'paperPath': paper_path, 'stale': stale}
+
+    def CountOrphanLinks(self, removed_ids:set) -> int:
+        """Links the scan would drop once `removed_ids` are deleted."""
+        sql = "SELECT COUNT(*) FROM paper_link" + LibraryIntegrityScanner.ORPHAN_LINK_FILTER
+        return SqliteHelper(self.service).ExecuteSelect(sql, {'removed': json.dumps(sorted(removed_ids))})[0][0]
+
+    @Metrics.Timed('stage', stage='library_scan')
+    def Scan(self, dry_run:bool=False) -> dict:
+        """With `dry_run` the report is computed but no config, row or snapshot is written."""
+        start = time.monotonic()
+        if not dry_run:
+            self.CreateOrIgnoreTables()
+        tables = SqliteHelper(self.service).Tables()
+        rows, snapshots = dict(), dict()
+        if 'paper_information' in tables:
+            sql = "SELECT paperId, paperPath, location FROM paper_information"
+            rows = {row['paperId']: row for row in SqliteHelper(self.service).ExecuteDictSelect(sql)}
+        if 'library_snapshot' in tables:
+            sql = "SELECT folder, paperId, paperPath, size, mtimeNs, configMtimeNs FROM library_snapshot"
+            snapshots = {row['folder']: row for row in SqliteHelper(self.service).ExecuteDictSelect(sql)}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='library-scan') as executor:
+            folders = [folder for folder_list in executor.map(self.ListFolders, sorted(self.LibraryDirs(rows))) for folder in folder_list]
+            listings = list(executor.map(self.ListFolder, folders))
+            changed = [(folder, pdfs, config_mtime) for folder, pdfs, config_mtime in listings if not self.Unchanged(snapshots.get(folder), pdfs, config_mtime)]
+            verified = list(executor.map(lambda listing: self.Verify(listing[0], listing[1], not dry_run), changed))
+
+        present, snapshot_rows, stale_configs = dict(), [], 0
+        for folder, pdfs, config_mtime in listings:
+            snapshot = snapshots.get(folder)
+            if snapshot is not None and self.Unchanged(snapshot, pdfs, config_mtime) and snapshot['paperPath']:
+                present.setdefault(snapshot['paperId'], snapshot['paperPath'])
+        for (folder, pdfs, config_mtime), verification in zip(changed, verified):
+            if verification['stale']:
+                stale_configs += 1
+                if not dry_run:
+                    config_mtime = self.ListFolder(folder)[2]
+            paper_path = verification['paperPath']
+            if paper_path:
+                present.setdefault(verification['paperId'], paper_path)
+            size, mtime_ns = pdfs.get(os.path.basename(paper_path), (None, None)) if paper_path else (None, None)
+            snapshot_rows.append({'folder': folder, 'paperId': verification['paperId'], 'paperPath': paper_path, 'size': size, 'mtimeNs': mtime_ns, 'configMtimeNs': config_mtime})
+
+        scanned_folders = {folder for folder, _, _ in listings}
+        removed = [{'paperId': paper_id} for paper_id, row in rows.items() if paper_id not in present and not os.path.exists(row['paperPath'])]
+        relocated = [{'paperId': paper_id, 'paperPath': paper_path, 'location': os.path.dirname(paper_path)}
+                     for paper_id, paper_path in present.items() if paper_id in rows and os.path.abspath(rows[paper_id]['paperPath']) != paper_path]
+        vanished = [{'folder': folder} for folder in snapshots if folder not in scanned_folders]
+        neighbours = set()
+        if removed:
+            citation_graph = CitationGraphIndex.ForService(self.service)
+            for row in removed:
+                neighbours.update(citation_graph.GetReferences(row['paperId']))
+                neighbours.update(citation_graph.GetCitations(row['paperId']))
+
+        if dry_run:
+            unhashed = self.content_index.Unhashed() if 'paper_file_hash' in tables else [(paper_id, row['paperPath']) for paper_id, row in rows.items()]
+            return {
+                'folders': len(listings),
+                'changed': len(changed),
+                'removed': [row['paperId'] for row in removed],
+                'relocated': [row['paperId'] for row in relocated],
+                'staleConfigs': stale_configs,
+                'orphanLinks': self.CountOrphanLinks({row['paperId'] for row in removed}) if 'paper_link' in tables else 0,
+                'notes': len(neighbours.difference(row['paperId'] for row in removed)),
+                'hashed': sum(1 for _, paper_path in unhashed if os.path.isfile(paper_path)),
+                'elapsed': round(time.monotonic() - start, 3)
+            }
+        counts = SqliteHelper(self.service).ExecuteTransaction([
+            ("DELETE FROM paper_information WHERE paperId = :paperId", removed),
+            ("DELETE FROM paper_file_hash WHERE paperId = :paperId", removed),
+            ("UPDATE paper_information SET paperPath = :paperPath, location = :location WHERE paperId = :paperId", relocated),
+            ("UPDATE paper_file_hash SET paperPath = :paperPath WHERE paperId = :paperId", relocated),
+            ("DELETE FROM paper_link" + LibraryIntegrityScanner.ORPHAN_LINK_FILTER, {'removed': json.dumps(sorted(row['paperId'] for row in removed))}),
+            ("DELETE FROM library_snapshot WHERE folder = :folder", vanished),
+            ("""
+            INSERT INTO library_snapshot (folder, paperId, paperPath, size, mtimeNs, configMtimeNs)
+            VALUES (:folder, :paperId, :paperPath, :size, :mtimeNs, :configMtimeNs)
+            ON CONFLICT(folder) DO UPDATE SET paperId=excluded.paperId, paperPath=excluded.paperPath,
+            size=excluded.size, mtimeNs=excluded.mtimeNs, configMtimeNs=excluded.configMtimeNs;
+            """, snapshot_rows)
+        ])
+        if removed or relocated or counts[4]:
+            CitationGraphIndex.ForService(self.service).Reload()
+        if neighbours:
+            renderer = PaperNoteRenderer(self.service)
+            renderer.MarkDirty(neighbours.difference(row['paperId'] for row in removed))
+            renderer.Flush()
+        try:
+            hashed = self.content_index.Backfill()
+        except Exception as e:
+            print(f"Failed to hash library papers: {e}")
+            hashed = 0
+        return {
+            'folders': len(listings),
+            'changed': len(changed),
+            'removed': [row['paperId'] for row in removed],
+            'relocated': [row['paperId'] for row in relocated],
+            'staleConfigs': stale_configs,
+            'orphanLinks': counts[4],
+            'hashed': hashed,
+            'elapsed': round(time.monotonic() - start, 3)
+        }
@@ -0,0 +1,84 @@
+import re
+from src.utils.sqliteconnector import SqliteHelper
+
+class LocalSearchIndex:
+    """
+    FTS5 index over the papers of the library.
+
+    paper_search shares its rowid with paper_information and is kept in sync by
+    triggers, so every insert, title/author update or delete done through
+    PaperProcessor is reflected without extra calls. The `body` column is left
+    empty by the triggers and can be filled with abstract or PDF text through
+    `SetDocumentText`.
+    """
+    SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS paper_search USING fts5
+(
+title,
+authors,
+fieldsOfStudy,
+body,
+tokenize = 'unicode61 remove_diacritics 2',
+prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS paper_search_insert AFTER INSERT ON paper_information BEGIN
+    INSERT INTO paper_search(rowid, title, authors, fieldsOfStudy, body) VALUES (new.id, new.title, new.authors, new.fieldsOfStudy, '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS paper_search_update AFTER UPDATE OF title, authors, fieldsOfStudy ON paper_information BEGIN
+    UPDATE paper_search SET title=new.title, authors=new.authors, fieldsOfStudy=new.fieldsOfStudy WHERE rowid=new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS paper_search_delete AFTER DELETE ON paper_information BEGIN
+    DELETE FROM paper_search WHERE rowid=old.id;
+END;
+
+INSERT INTO paper_search(rowid, title, authors, fieldsOfStudy, body)
+SELECT id, title, authors, fieldsOfStudy, '' FROM paper_information WHERE id NOT IN (SELECT rowid FROM paper_search);
+"""
+    COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+    COLUMNS = ['paperId', 'identifyId', 'title', 'authors', 'fieldsOfStudy', 'publicationDate', 'citationCount', 'url', 'location']
+
+    def __init__(self, service:str='paper_db'):
+        self.service = service
+
+    @staticmethod
+    def CreateOrIgnoreSearchTable(service:str='paper_db'):
+        return SqliteHelper(service).EnsureSchema('paper_search', LocalSearchIndex.SCHEMA)
+
+    @staticmethod
+    def BuildMatchQuery(query:str, prefix:bool=True) -> str:
+        terms = re.findall(r"\w+", query)
+        return ' '.join(f'"{term}"*' if prefix else f'"{term}"' for term in terms)
+
+    def Search(self, query:str, limit:int=20, offset:int=0, prefix:bool=True) -> dict:
+        match_query = self.BuildMatchQuery(query, prefix)
+        if not match_query:
+            return {'total': 0, 'results': []}
+        sql = "SELECT COUNT(*) FROM paper_search WHERE paper_search MATCH :query"
+        total = SqliteHelper(self.service).ExecuteSelect(sql, {'query': match_query})[0][0]
+        sql = f"""
+        SELECT {','.join('paper_information.' + column for column in LocalSearchIndex.COLUMNS)},
+        bm25(paper_search, {','.join(str(weight) for weight in LocalSearchIndex.COLUMN_WEIGHTS)}) AS score
+        FROM paper_search JOIN paper_information ON paper_information.id = paper_search.rowid
+        WHERE paper_search MATCH :query
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+        """
+        results = SqliteHelper(self.service).ExecuteDictSelect(sql, {'query': match_query, 'limit': limit, 'offset': offset})
+        return {'total': total, 'results': results}
+
+    def FindByTitle(self, title:str):
+        normalized_title = ' '.join(re.findall(r"\w+", title.lower()))
+        for result in self.Search(title, limit=5, prefix=False)['results']:
+            if ' '.join(re.findall(r"\w+", result['title'].lower())) == normalized_title:
+                return result
+        return None
+
+    def SetDocumentText(self, paper_id:str, text:str):
+        sql = """
+        UPDATE paper_search SET body=:text
+        WHERE rowid=(SELECT id FROM paper_information WHERE paperId=:paperId)
+        """
+        return SqliteHelper(self.service).ExecuteUpdate(sql, {'paperId': paper_id, 'text': text})
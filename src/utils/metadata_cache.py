@@ -0,0 +1,235 @@
+import json, re, time, threading, contextvars, contextlib
+from src.utils.sqliteconnector import SqliteHelper
+
+DAY = 24 * 60 * 60
+
+class MetadataCache:
+    """
+    SQLite backed cache for normalized metadata responses.
+
+    Records are stored once per provider paper id and can be reached through any
+    of their aliases (ArXiv id, DOI, provider paper id or the identifier used in
+    the request). Every field keeps its own fetch time, so volatile fields such as
+    citationCount expire quickly while titles and authors stay valid for months.
+    The least recently used records are evicted once `max_entries` is reached.
+    Inside `ReadOnly()` (dry runs) lookups still read the cache but write nothing.
+    """
+    FIELD_TTL = {
+        'citationCount': 1 * DAY,
+        'citations': 1 * DAY,
+        'references': 30 * DAY,
+        'url': 30 * DAY,
+        'fieldsOfStudy': 30 * DAY,
+        'title': 180 * DAY,
+        'authors': 180 * DAY,
+        'publicationDate': 180 * DAY,
+        'externalIds': 180 * DAY,
+    }
+    DEFAULT_TTL = 7 * DAY
+    # a context variable, so it reaches the provider threads through Metrics.Bind
+    read_only = contextvars.ContextVar('papercollector_cache_read_only', default=False)
+    CHUNK_SIZE = 500
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata_cache
+(
+cache_key VARCHAR(256) PRIMARY KEY,
+provider VARCHAR(32) NOT NULL,
+payload TEXT NOT NULL,
+field_fetched TEXT NOT NULL,
+accessed_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS metadata_cache_lru ON metadata_cache(accessed_at);
+
+CREATE TABLE IF NOT EXISTS metadata_cache_alias
+(
+alias VARCHAR(256) PRIMARY KEY,
+cache_key VARCHAR(256) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS metadata_cache_alias_key ON metadata_cache_alias(cache_key);
+"""
+
+    def __init__(self, provider:str, service:str='cache_db', max_entries:int=100000, field_ttl:dict=None):
+        self.provider = provider
+        self.service = service
+        self.max_entries = max_entries
+        self.field_ttl = dict(MetadataCache.FIELD_TTL)
+        if field_ttl:
+            self.field_ttl.update(field_ttl)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.CreateOrIgnoreCacheTable()
+
+    def CreateOrIgnoreCacheTable(self):
+        return SqliteHelper(self.service).EnsureSchema('metadata_cache', MetadataCache.SCHEMA)
+
+    @classmethod
+    @contextlib.contextmanager
+    def ReadOnly(cls):
+        token = cls.read_only.set(True)
+        try:
+            yield
+        finally:
+            cls.read_only.reset(token)
+
+    @staticmethod
+    def CanonicalId(identifier:str) -> str:
+        identifier = identifier.strip()
+        prefix, _, value = identifier.partition(':')
+        if value and prefix.upper() == 'ARXIV':
+            return f"ARXIV:{value.split('v')[0]}"
+        if value and prefix.upper() == 'DOI':
+            return f"DOI:{value.lower()}"
+        if value and prefix.upper() == 'SEARCH':
+            return f"SEARCH:{' '.join(value.lower().split())}"
+        arxiv_valid = re.fullmatch(r"(\d{4}\.\d{4,5})(v\d+)?", identifier)
+        if arxiv_valid:
+            return f"ARXIV:{arxiv_valid.group(1)}"
+        if identifier.startswith('10.'):
+            return f"DOI:{identifier.lower()}"
+        return identifier
+
+    @staticmethod
+    def SearchKey(keyword:str) -> str:
+        return f"SEARCH:{keyword}"
+
+    def Aliases(self, payload:dict, identifiers=()) -> set:
+        aliases = {self.CanonicalId(identifier) for identifier in identifiers if identifier}
+        external_ids = payload.get('externalIds') or {}
+        if external_ids.get('ArXiv'):
+            aliases.add(self.CanonicalId(f"ARXIV:{external_ids['ArXiv']}"))
+        if external_ids.get('DOI'):
+            aliases.add(self.CanonicalId(f"DOI:{external_ids['DOI']}"))
+        if payload.get('paperId'):
+            aliases.add(payload['paperId'])
+        return aliases
+
+    def IsFresh(self, field_fetched:dict, fields, now:float) -> bool:
+        for field in fields:
+            if field not in field_fetched:
+                return False
+            if now - field_fetched[field] > self.field_ttl.get(field, MetadataCache.DEFAULT_TTL):
+                return False
+        return True
+
+    def Get(self, identifier:str, fields:list):
+        return self.GetMany([identifier], fields).get(identifier)
+
+    def GetMany(self, identifiers:list, fields:list) -> dict:
+        now = time.time()
+        aliases = {identifier: f"{self.provider}|{self.CanonicalId(identifier)}" for identifier in identifiers}
+        alias_list = list(set(aliases.values()))
+        records = dict()
+        for start in range(0, len(alias_list), MetadataCache.CHUNK_SIZE):
+            chunk = alias_list[start:start + MetadataCache.CHUNK_SIZE]
+            params = {f"a{i}": alias for i, alias in enumerate(chunk)}
+            sql = f"""
+            SELECT metadata_cache_alias.alias, metadata_cache.cache_key, metadata_cache.payload, metadata_cache.field_fetched
+            FROM metadata_cache_alias JOIN metadata_cache ON metadata_cache_alias.cache_key = metadata_cache.cache_key
+            WHERE metadata_cache_alias.alias IN ({','.join(':' + name for name in params)})
+            """
+            for row in SqliteHelper(self.service).ExecuteDictSelect(sql, params):
+                records[row['alias']] = row
+        result = dict()
+        touched = set()
+        for identifier, alias in aliases.items():
+            row = records.get(alias)
+            if row and self.IsFresh(json.loads(row['field_fetched']), fields, now):
+                result[identifier] = json.loads(row['payload'])
+                touched.add(row['cache_key'])
+        with self._lock:
+            self.hits += len(result)
+            self.misses += len(identifiers) - len(result)
+        if touched and not MetadataCache.read_only.get():
+            sql = "UPDATE metadata_cache SET accessed_at=:accessed_at WHERE cache_key=:cache_key"
+            SqliteHelper(self.service).ExecuteUpdate(sql, [{'cache_key': key, 'accessed_at': now} for key in touched])
+        return result
+
+    def Put(self, payload:dict, identifiers=()):
+        self.PutMany([(payload, identifiers)])
+
+    def PutMany(self, items:list):
+        if MetadataCache.read_only.get():
+            return
+        now = time.time()
+        entries = dict()
+        alias_rows = []
+        for payload, identifiers in items:
+            if not payload:
+                continue
+            data = {key: value for key, value in payload.items() if key != 'identifyId'}
+            paper_id = data.get('paperId') or data.get('id') or self.CanonicalId(identifiers[0])
+            cache_key = f"{self.provider}:{paper_id}"
+            entries[cache_key] = data
+            for alias in self.Aliases(data, identifiers):
+                alias_rows.append({'alias': f"{self.provider}|{alias}", 'cache_key': cache_key})
+        if not entries:
+            return
+        existing = dict()
+        keys = list(entries)
+        for start in range(0, len(keys), MetadataCache.CHUNK_SIZE):
+            chunk = keys[start:start + MetadataCache.CHUNK_SIZE]
+            params = {f"k{i}": key for i, key in enumerate(chunk)}
+            sql = f"SELECT cache_key, payload, field_fetched FROM metadata_cache WHERE cache_key IN ({','.join(':' + name for name in params)})"
+            for row in SqliteHelper(self.service).ExecuteDictSelect(sql, params):
+                existing[row['cache_key']] = row
+        rows = []
+        for cache_key, data in entries.items():
+            payload, field_fetched = dict(), dict()
+            if cache_key in existing:
+                payload = json.loads(existing[cache_key]['payload'])
+                field_fetched = json.loads(existing[cache_key]['field_fetched'])
+            payload.update(data)
+            field_fetched.update({field: now for field in data})
+            rows.append({
+                'cache_key': cache_key,
+                'provider': self.provider,
+                'payload': json.dumps(payload),
+                'field_fetched': json.dumps(field_fetched),
+                'accessed_at': now
+                })
+        sql = """
+        INSERT OR REPLACE INTO metadata_cache (cache_key, provider, payload, field_fetched, accessed_at)
+        VALUES (:cache_key, :provider, :payload, :field_fetched, :accessed_at)
+        """
+        SqliteHelper(self.service).ExecuteUpdate(sql, rows)
+        sql = """
+        INSERT OR REPLACE INTO metadata_cache_alias (alias, cache_key)
+        VALUES (:alias, :cache_key)
+        """
+        SqliteHelper(self.service).ExecuteUpdate(sql, alias_rows)
+        self.Evict()
+
+    def Evict(self):
+        sql = "SELECT COUNT(*) FROM metadata_cache"
+        count = SqliteHelper(self.service).ExecuteSelect(sql)[0][0]
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return 0
+        sql = """
+        DELETE FROM metadata_cache WHERE cache_key IN
+        (SELECT cache_key FROM metadata_cache ORDER BY accessed_at LIMIT :overflow)
+        """
+        SqliteHelper(self.service).ExecuteUpdate(sql, {'overflow': overflow})
+        sql = "DELETE FROM metadata_cache_alias WHERE cache_key NOT IN (SELECT cache_key FROM metadata_cache)"
+        SqliteHelper(self.service).ExecuteUpdate(sql)
+        with self._lock:
+            self.evictions += overflow
+        return overflow
+
+    def Stats(self) -> dict:
+        sql = "SELECT COUNT(*) FROM metadata_cache WHERE provider=:provider"
+        entries = SqliteHelper(self.service).ExecuteSelect(sql, {'provider': self.provider})[0][0]
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'provider': self.provider,
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': self.hits / total if total else 0.0
+            }
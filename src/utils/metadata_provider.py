@@ -0,0 +1,284 @@
+import os, json, queue, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from src.utils.http_client import MetadataHttpClient, TokenBucket, BASEFOLDER
+from src.utils.metadata_cache import MetadataCache
+from src.utils.metrics import Metrics
+from src.component.paper_info import PaperRecord
+
+class MetadataProvider:
+    """
+    Common interface of the paper metadata backends.
+
+    A provider resolves identifiers (ArXiv ids, DOIs or its own paper ids) into
+    PaperRecord objects whose payload follows the Semantic Scholar schema, so the
+    ingest pipeline and PaperProcessor never see provider specific fields.
+    Subclasses set `name` (the key in provider_list.json) and implement
+    `GetPaperBatch`; caching, chunking and the concurrent fan-out are shared.
+    """
+    name = None
+    info_class = PaperRecord
+    NOT_FOUND = "Not found"
+    FIELDS = ['title','authors','publicationDate','externalIds','citationCount','url','fieldsOfStudy','citations','references']
+    config_path = os.path.join(BASEFOLDER, "src", "config", "provider_list.json")
+    providers = {}
+    instances = {}
+    _lock = threading.RLock()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.name:
+            MetadataProvider.providers[cls.name] = cls
+
+    def __init__(self, fields:list=None, cache:MetadataCache=None, client:MetadataHttpClient=None):
+        self.fields = list(fields) if fields is not None else list(MetadataProvider.FIELDS)
+        self.cache = cache if cache is not None else MetadataCache(self.name)
+        self.client = client if client is not None else MetadataHttpClient.ForProvider(self.name)
+        self.batch_size = self.client.batch_size
+        self.executor = self.client.executor
+
+    @classmethod
+    def LoadConfig(cls) -> dict:
+        with open(cls.config_path) as provider_config_file:
+            return json.load(provider_config_file)
+
+    @classmethod
+    def DefaultName(cls) -> str:
+        config = cls.LoadConfig()
+        return os.environ.get(config.get('default_provider_env', ''), None) or config.get('default_provider', 'semantic_scholar')
+
+    @classmethod
+    def ForName(cls, name:str=None) -> 'MetadataProvider':
+        """Return the shared provider registered as `name`, or the configured default provider."""
+        name = name or cls.DefaultName()
+        with cls._lock:
+            if name not in cls.instances:
+                if name not in cls.providers:
+                    raise ValueError(f"Unknown metadata provider: {name}")
+                cls.instances[name] = cls.providers[name]()
+            return cls.instances[name]
+
+    def SetRate(self, rate:float, burst:float=None):
+        """Replace the token bucket of the provider's client, e.g. to leave room for other jobs sharing an API key."""
+        self.client.bucket = TokenBucket(rate, burst)
+
+    def Parse(self, payload:dict) -> PaperRecord:
+        return self.info_class(payload)
+
+    def CachedPapers(self, paper_id_list:list) -> dict:
+        paperDataPair = dict()
+        for paperId, paperInformation in self.cache.GetMany(paper_id_list, self.fields).items():
+            paperInformation['identifyId'] = paperId
+            paperDataPair[paperId] = self.Parse(paperInformation)
+        return paperDataPair
+
+    def GetPapersWithListPaperId(self, paper_id_list:list, failures:dict=None) -> dict:
+        """
+        Resolve `paper_id_list` through the cache and the provider's batch lookup.
+
+        Missing ids are split into provider sized chunks which are resolved concurrently
+        on the provider's thread pool. The returned dict follows the input order; ids that
+        could not be resolved are written to `failures` together with the reason.
+        """
+        paperDataPair = dict()
+        for found, failed in self.IterPapersWithListPaperId(paper_id_list):
+            paperDataPair.update(found)
+            if failures is not None:
+                failures.update(failed)
+        return {paperId: paperDataPair[paperId] for paperId in paper_id_list if paperId in paperDataPair}
+
+    def IterPapersWithListPaperId(self, paper_id_list:list):
+        """Yield (found, failed) pairs, first for the cache hits and then per chunk as soon as it resolves."""
+        paperDataPair = self.CachedPapers(paper_id_list)
+        if paperDataPair:
+            yield paperDataPair, dict()
+        missing_ids = [paperId for paperId in dict.fromkeys(paper_id_list) if paperId not in paperDataPair]
+        chunks = [missing_ids[start:start + self.batch_size] for start in range(0, len(missing_ids), self.batch_size)]
+        futures = [self.executor.submit(Metrics.Bind(self.GetPaperBatch), chunk) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def GetPaperBatch(self, paper_id_list:list):
+        """Return ({paperId: PaperRecord}, {paperId: reason}) for one chunk of uncached ids."""
+        raise NotImplementedError
+
+    def GetPaperFromPaperId(self, paperId:str) -> PaperRecord:
+        raise NotImplementedError
+
+    def GetPaperFromArXiv(self, arXiv_id:str) -> PaperRecord:
+        raise NotImplementedError
+
+    def SearchPaperWithKeyword(self, keyword:str) -> PaperRecord:
+        raise NotImplementedError
+
+
+class HedgedProvider(MetadataProvider):
+    """
+    Provider that falls back to a second backend.
+
+    Every chunk goes to the primary provider first. When it has not answered
+    after `hedge_after` seconds (typically because it is backing off on 429s)
+    the same chunk is sent to the secondary provider. Whichever answers first is
+    yielded at once; the other answer is only awaited for the ids still missing,
+    and for at most `answer_deadline` seconds. Ids the primary failed on for any
+    reason other than "Not found" are retried on the secondary as well.
+
+    Two different backends name papers differently (Semantic Scholar hashes,
+    OpenAlex W... ids), and citations/references are stored by those ids, so
+    lookups with link fields stay on the primary unless both are the same
+    backend. Provider exceptions are counted in `provider_errors_total`.
+    """
+    name = 'hedged'
+    LINK_FIELDS = ('citations', 'references')
+
+    def __init__(self, primary:MetadataProvider=None, secondary:MetadataProvider=None, hedge_after:float=None, max_workers:int=None, answer_deadline:float=None):
+        config = self.LoadConfig().get(HedgedProvider.name, {})
+        self.primary = primary if primary is not None else MetadataProvider.ForName(config.get('primary', 'semantic_scholar'))
+        self.secondary = secondary if secondary is not None else MetadataProvider.ForName(config.get('secondary', 'openalex'))
+        # the hedged provider has no endpoint of its own; lookups go through the primary's cache and client
+        super().__init__(self.primary.fields, self.primary.cache, self.primary.client)
+        self.hedge_after = hedge_after if hedge_after is not None else config.get('hedge_after', 3.0)
+        self.answer_deadline = answer_deadline if answer_deadline is not None else config.get('answer_deadline', 10.0)
+        max_workers = max_workers or config.get('max_workers', 4)
+        self.batch_size = self.primary.batch_size
+        # chunks wait on the primary's executor, so they cannot run on it
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedged-batch')
+        self.fallback_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedged-fallback')
+        self.hedged = 0
+        self.fallbacks = 0
+
+    def SetRate(self, rate:float, burst:float=None):
+        self.primary.SetRate(rate, burst)
+        self.secondary.SetRate(rate, burst)
+
+    def Hedges(self) -> bool:
+        """Whether the secondary may answer for the primary without mixing paper id namespaces."""
+        return self.primary.name == self.secondary.name or not any(field in self.fields for field in HedgedProvider.LINK_FIELDS)
+
+    @staticmethod
+    def CountError(provider:MetadataProvider):
+        Metrics.Count('provider_errors_total', provider=provider.name)
+
+    def CachedPapers(self, paper_id_list:list) -> dict:
+        paperDataPair = self.primary.CachedPapers(paper_id_list)
+        missing_ids = [paperId for paperId in paper_id_list if paperId not in paperDataPair]
+        if missing_ids and self.Hedges():
+            paperDataPair.update(self.secondary.CachedPapers(missing_ids))
+        return paperDataPair
+
+    def SecondaryBatch(self, paper_id_list:list):
+        failed = dict()
+        found = self.secondary.GetPapersWithListPaperId(paper_id_list, failed)
+        return found, {paperId: failed.get(paperId, MetadataProvider.NOT_FOUND) for paperId in paper_id_list if paperId not in found}
+
+    @staticmethod
+    def Merge(found:dict, failed:dict, other_found:dict):
+        for paperId in list(failed):
+            if paperId in other_found:
+                found[paperId] = other_found[paperId]
+                del failed[paperId]
+        return found, failed
+
+    def IterPapersWithListPaperId(self, paper_id_list:list):
+        """Like the base implementation, but a chunk can yield several times as its two answers arrive."""
+        paperDataPair = self.CachedPapers(paper_id_list)
+        if paperDataPair:
+            yield paperDataPair, dict()
+        missing_ids = [paperId for paperId in dict.fromkeys(paper_id_list) if paperId not in paperDataPair]
+        chunks = [missing_ids[start:start + self.batch_size] for start in range(0, len(missing_ids), self.batch_size)]
+        answers = queue.Queue()
+        futures = [self.executor.submit(Metrics.Bind(self.PublishPaperBatch), chunk, answers) for chunk in chunks]
+        try:
+            pending = len(futures)
+            while pending:
+                answer = answers.get()
+                if answer is None:
+                    pending -= 1
+                elif isinstance(answer, Exception):
+                    raise answer
+                else:
+                    yield answer
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def PublishPaperBatch(self, paper_id_list:list, answers:queue.Queue):
+        try:
+            for answer in self.IterPaperBatch(paper_id_list):
+                answers.put(answer)
+        except Exception as e:
+            answers.put(e)
+        finally:
+            answers.put(None)
+
+    def GetPaperBatch(self, paper_id_list:list):
+        found, failed = dict(), dict()
+        for chunk_found, chunk_failed in self.IterPaperBatch(paper_id_list):
+            found.update(chunk_found)
+            failed.update(chunk_failed)
+        return found, failed
+
+    def IterPaperBatch(self, paper_id_list:list):
+        """Yield the (found, failed) answers of one chunk; an id is only reported failed in the last one."""
+        if not self.Hedges():
+            yield self.primary.GetPaperBatch(paper_id_list)
+            return
+        primary = self.primary.client.executor.submit(Metrics.Bind(self.primary.GetPaperBatch), paper_id_list)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            found, failed = primary.result()
+            retry = [paperId for paperId, reason in failed.items() if reason != MetadataProvider.NOT_FOUND]
+            if retry:
+                self.fallbacks += 1
+                found, failed = self.Merge(found, failed, self.SecondaryBatch(retry)[0])
+            yield found, failed
+            return
+        self.hedged += 1
+        secondary = self.fallback_executor.submit(Metrics.Bind(self.SecondaryBatch), paper_id_list)
+        done, _ = wait([primary, secondary], return_when=FIRST_COMPLETED)
+        providers = {primary: self.primary, secondary: self.secondary}
+        first, other = (primary, secondary) if primary in done else (secondary, primary)
+        try:
+            found, failed = first.result()
+        except Exception as e:
+            # the other answer is all there is left
+            self.CountError(providers[first])
+            found, failed = dict(), {paperId: str(e) for paperId in paper_id_list}
+        if not failed:
+            yield found, failed
+            return
+        if found:
+            yield found, dict()
+        done, _ = wait([other], timeout=self.answer_deadline)
+        if not done:
+            yield dict(), failed
+            return
+        try:
+            other_found = other.result()[0]
+        except Exception:
+            self.CountError(providers[other])
+            other_found = dict()
+        yield self.Merge(dict(), failed, other_found)
+
+    def GetPaperFromPaperId(self, paperId:str) -> PaperRecord:
+        return self.First('GetPaperFromPaperId', paperId)
+
+    def GetPaperFromArXiv(self, arXiv_id:str) -> PaperRecord:
+        return self.First('GetPaperFromArXiv', arXiv_id)
+
+    def SearchPaperWithKeyword(self, keyword:str) -> PaperRecord:
+        return self.First('SearchPaperWithKeyword', keyword)
+
+    def First(self, method:str, *args):
+        for provider in ((self.primary, self.secondary) if self.Hedges() else (self.primary,)):
+            try:
+                paper_info = getattr(provider, method)(*args)
+            except Exception:
+                self.CountError(provider)
+                continue
+            if paper_info is not None:
+                return paper_info
+        return None
@@ -0,0 +1,215 @@
+import os, json, time, bisect, functools, threading, contextvars
+BASEFOLDER = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets:int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Span:
+    """Times one block into the `<name>_seconds` histogram and counts `<name>_errors_total` on exceptions."""
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name:str, labels:dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        Metrics.Observe(f"{self.name}_seconds", end - self.start, **self.labels)
+        if exc_type is not None:
+            Metrics.Count(f"{self.name}_errors_total", **self.labels)
+        trace = Metrics.trace.get()
+        if trace is not None and len(trace['spans']) >= trace['maxSpans']:
+            trace['droppedSpans'] += 1
+        elif trace is not None:
+            trace['spans'].append({
+                'name': self.name,
+                'labels': self.labels,
+                'start': round((self.start - trace['start']) * 1000, 3),
+                'durationMs': round((end - self.start) * 1000, 3),
+                'thread': threading.current_thread().name,
+                'error': exc_type.__name__ if exc_type is not None else None
+            })
+        return False
+
+
+class NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class Metrics:
+    """
+    Process wide counters and latency histograms in the Prometheus text format.
+
+    `Metrics.Span(name, **labels)` wraps the hot paths (provider requests,
+    SqliteHelper statements, filesystem operations and ingest stages); labels
+    must stay low-cardinality (provider, operation, stage), never paper ids or
+    SQL text. When a trace is active in the current context every span is also
+    appended to it, which is how a single request is dumped with its spans.
+    Setting PAPER_METRICS=0 turns every span into a no-op.
+    """
+    PREFIX = 'papercollector_'
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    DESCRIPTIONS = {
+        'provider_request_seconds': "Metadata provider HTTP requests, one observation per attempt.",
+        'provider_rate_limit_wait_seconds': "Time spent waiting for the provider token bucket.",
+        'provider_responses_total': "Metadata provider HTTP responses by status code.",
+        'provider_retries_total': "Metadata provider requests retried after a 429, 5xx or connection error.",
+        'provider_errors_total': "Metadata provider lookups that raised, by provider.",
+        'sqlite_execute_seconds': "SqliteHelper statements by service and operation.",
+        'fs_operation_seconds': "Filesystem operations on the library.",
+        'stage_seconds': "Ingest pipeline, PaperProcessor and library maintenance stages.",
+        'http_request_seconds': "API requests by route and status.",
+        'ingest_files_total': "Files handled by the ingest pipeline by final status.",
+    }
+    enabled = os.environ.get('PAPER_METRICS', '1') != '0'
+    trace_dir = os.environ.get('PAPER_TRACE_DIR', os.path.join(BASEFOLDER, 'traces'))
+    counters = {}
+    histograms = {}
+    trace = contextvars.ContextVar('papercollector_trace', default=None)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def Key(name:str, labels:dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    @classmethod
+    def Span(cls, name:str, **labels):
+        return Span(name, labels) if cls.enabled else NoSpan()
+
+    @classmethod
+    def Timed(cls, name:str, **labels):
+        """Decorator form of Span."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with cls.Span(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def Count(cls, name:str, value:float=1, **labels):
+        if not cls.enabled:
+            return
+        key = cls.Key(name, labels)
+        with cls._lock:
+            cls.counters[key] = cls.counters.get(key, 0) + value
+
+    @classmethod
+    def Observe(cls, name:str, seconds:float, **labels):
+        if not cls.enabled:
+            return
+        key = cls.Key(name, labels)
+        index = bisect.bisect_left(cls.BUCKETS, seconds)
+        with cls._lock:
+            histogram = cls.histograms.get(key)
+            if histogram is None:
+                histogram = cls.histograms[key] = Histogram(len(cls.BUCKETS) + 1)
+            histogram.counts[index] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    @classmethod
+    def Reset(cls):
+        with cls._lock:
+            cls.counters.clear()
+            cls.histograms.clear()
+
+    @staticmethod
+    def Labels(labels:tuple, extra:str=None) -> str:
+        parts = ['{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    @classmethod
+    def Render(cls) -> str:
+        """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with cls._lock:
+            counters = sorted(cls.counters.items())
+            histograms = sorted((key, (list(histogram.counts), histogram.sum, histogram.count)) for key, histogram in cls.histograms.items())
+        lines, described = [], set()
+        def header(name:str, kind:str):
+            if name in described:
+                return
+            described.add(name)
+            if name in cls.DESCRIPTIONS:
+                lines.append(f"# HELP {cls.PREFIX}{name} {cls.DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {cls.PREFIX}{name} {kind}")
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{cls.PREFIX}{name}{cls.Labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(cls.BUCKETS + ('+Inf',), counts):
+                cumulative += bucket_count
+                bucket_label = 'le="%s"' % bound
+                lines.append(f"{cls.PREFIX}{name}_bucket{cls.Labels(labels, bucket_label)} {cumulative}")
+            lines.append(f"{cls.PREFIX}{name}_sum{cls.Labels(labels)} {total}")
+            lines.append(f"{cls.PREFIX}{name}_count{cls.Labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def StartTrace(cls, name:str, max_spans:int=10000):
+        """Collect the spans of the current context, including work it hands to Bind-wrapped callables; spans past `max_spans` are only counted."""
+        return cls.trace.set({'name': name, 'start': time.perf_counter(), 'started': time.time(), 'spans': [], 'maxSpans': max_spans, 'droppedSpans': 0})
+
+    @classmethod
+    def StopTrace(cls, token) -> dict:
+        trace = cls.trace.get()
+        cls.trace.reset(token)
+        trace['durationMs'] = round((time.perf_counter() - trace.pop('start')) * 1000, 3)
+        trace.pop('maxSpans')
+        return trace
+
+    @classmethod
+    def DumpTrace(cls, trace:dict, trace_id:str, keep:int=None) -> str:
+        """Write the trace to trace_dir; with `keep`, only the `keep` most recent trace files are retained."""
+        os.makedirs(cls.trace_dir, exist_ok=True)
+        path = os.path.join(cls.trace_dir, f"{trace_id}.json")
+        with open(path, 'w') as fp:
+            json.dump(trace, fp, indent=2)
+        if keep is not None:
+            cls.PruneTraces(keep)
+        return path
+
+    @classmethod
+    def PruneTraces(cls, keep:int):
+        traces = []
+        for entry in os.scandir(cls.trace_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    traces.append((entry.stat().st_mtime_ns, entry.path))
+                except OSError:
+                    continue
+        traces.sort(reverse=True)
+        for _, path in traces[keep:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def Bind(func):
+        """Wrap `func` to run in a copy of the caller's context, so spans in a pool thread reach the caller's trace."""
+        context = contextvars.copy_context()
+        def bound(*args, **kwargs):
+            return context.run(func, *args, **kwargs)
+        return bound
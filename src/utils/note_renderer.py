@@ -0,0 +1,117 @@
+import os, datetime, hashlib
+from src.utils.metrics import Metrics
+from src.utils.citation_graph import CitationGraphIndex
+from src.utils.paper_rows import PaperRowStore
+
+class PaperNoteRenderer:
+    """
+    Deferred renderer for the `{identifyId}-intro.md` notes.
+
+    Ingest steps only mark the papers whose note changed as dirty. `Flush` loads
+    the rows of the dirty papers and all their neighbours in one pass, renders
+    every dirty note once and skips the write when the rendered content hashes
+    the same as the note on disk (ignoring the update date stamp).
+    """
+    STAMP_PREFIX = "<span style='font-size:11;float:right;'>Information Update:"
+
+    def __init__(self, service:str='paper_db'):
+        self.service = service
+        self.dirty = set()
+        self.written = 0
+        self.skipped = 0
+
+    def MarkDirty(self, paper_ids):
+        self.dirty.update(paper_ids)
+
+    @staticmethod
+    def AttachCurrentDate() -> str:
+        return f"{PaperNoteRenderer.STAMP_PREFIX}{datetime.datetime.now().strftime('%b %d, %Y')}</span>"
+
+    @staticmethod
+    def RenderSummary(paperData:dict) -> str:
+        return f"""## Information 
+- Title: {paperData['title']}
+- Author: {paperData['authors']}
+- Publication Date: {paperData['publicationDate']}
+- Citation: {paperData['citationCount']}
+- Url: {paperData['url']}
+- Paper ID:{paperData['paperId']}
+"""
+
+    @staticmethod
+    def RenderRelationship(current_paper_info:dict, reference_infos:list, citation_infos:list) -> str:
+        def createPaperInternalLink(paper_infos:list[dict]):
+            return_string = ""
+            for paper_info in paper_infos:
+                paper_file_name:str = paper_info['identifyId']
+                return_string += f"[[{paper_file_name}-intro|{paper_info['title']}]] <br>"
+            return return_string
+
+        def createPaperLinkString(source_info, citation_info):
+            return_string = f"{citation_info['paperId']}-->{source_info['paperId']}"
+            return return_string
+        if len(reference_infos)+len(citation_infos) == 0:
+            return ""
+        reference_link = [[ reference_info, current_paper_info] for reference_info in reference_infos]
+        citation_link = [[ current_paper_info, citation_info] for citation_info in citation_infos]
+        paper_link = reference_link + citation_link
+        paper_infos = reference_infos + citation_infos
+        paper_infos.append(current_paper_info)
+        newline_sign = '\n'
+        return f"""## Relationship
+```mermaid
+graph TD;
+{newline_sign.join([f"{paper_info['paperId']}[{paper_info['title']}]" for paper_info in paper_infos])}
+\n
+{newline_sign.join([f"{createPaperLinkString(link[0], link[1])}" for link in paper_link])}
+```
+{createPaperInternalLink(paper_infos=paper_infos)}
+"""
+
+    def LoadRows(self, paper_ids, store:PaperRowStore=None) -> dict:
+        store = store if store is not None else PaperRowStore(self.service)
+        return store.Load(paper_ids)
+
+    @Metrics.Timed('stage', stage='render_notes')
+    def Flush(self) -> int:
+        paper_ids, self.dirty = self.dirty, set()
+        if not paper_ids:
+            return 0
+        citation_graph = CitationGraphIndex.ForService(self.service)
+        neighbours = {paper_id: (sorted(citation_graph.GetReferences(paper_id)), sorted(citation_graph.GetCitations(paper_id))) for paper_id in paper_ids}
+        needed_ids = set(paper_ids)
+        for reference_ids, citation_ids in neighbours.values():
+            needed_ids.update(reference_ids)
+            needed_ids.update(citation_ids)
+        rows = self.LoadRows(needed_ids)
+        written = 0
+        for paper_id in paper_ids:
+            if paper_id not in rows:
+                continue
+            paper_row = rows[paper_id]
+            reference_ids, citation_ids = neighbours[paper_id]
+            content = self.RenderSummary(paper_row) + self.RenderRelationship(
+                paper_row,
+                [rows[reference_id] for reference_id in reference_ids if reference_id in rows],
+                [rows[citation_id] for citation_id in citation_ids if citation_id in rows]
+                )
+            target_path = os.path.join(paper_row['location'], f"{paper_row['identifyId']}-intro.md")
+            if self.WriteIfChanged(target_path, content):
+                written += 1
+        return written
+
+    def WriteIfChanged(self, target_path:str, content:str) -> bool:
+        if not os.path.isdir(os.path.dirname(target_path)):
+            return False
+        content_hash = hashlib.sha1(content.encode('utf8')).digest()
+        if os.path.exists(target_path):
+            with Metrics.Span('fs_operation', operation='read_note'), open(target_path, 'r', encoding='utf8') as fp:
+                current_content = fp.read().split(PaperNoteRenderer.STAMP_PREFIX, 1)[0]
+            if hashlib.sha1(current_content.encode('utf8')).digest() == content_hash:
+                self.skipped += 1
+                return False
+        with Metrics.Span('fs_operation', operation='write_note'), open(target_path, 'w', encoding='utf8') as fp:
+            fp.write(content)
+            fp.write(self.AttachCurrentDate())
+        self.written += 1
+        return True
@@ -0,0 +1,48 @@
+from src.utils.sqliteconnector import SqliteHelper
+
+class PaperRowStore:
+    """
+    Identity map of paper_information rows for one ingest, render or request pass.
+
+    Rows are loaded with bound `IN` lists of at most MAX_VARIABLES ids per
+    statement, selecting only `columns`, and every paper id (found or not) is
+    queried at most once for the lifetime of the store.
+    """
+    COLUMNS = ['paperId', 'identifyId', 'title', 'authors', 'publicationDate', 'citationCount', 'url', 'location']
+    MAX_VARIABLES = 900
+
+    def __init__(self, service:str='paper_db', columns:list=None):
+        self.service = service
+        self.columns = list(columns) if columns else PaperRowStore.COLUMNS
+        if 'paperId' not in self.columns:
+            self.columns.insert(0, 'paperId')
+        self.rows = dict()
+        self.missing = set()
+
+    def Load(self, paper_ids) -> dict:
+        """Return {paperId: row} for the ids that exist, querying only the unseen ones."""
+        paper_ids = list(dict.fromkeys(paper_ids))
+        unseen = [paper_id for paper_id in paper_ids if paper_id not in self.rows and paper_id not in self.missing]
+        for start in range(0, len(unseen), PaperRowStore.MAX_VARIABLES):
+            chunk = unseen[start:start + PaperRowStore.MAX_VARIABLES]
+            params = {f"p{i}": paper_id for i, paper_id in enumerate(chunk)}
+            sql = f"SELECT {','.join(self.columns)} FROM paper_information WHERE paperId IN ({','.join(':' + name for name in params)})"
+            for row in SqliteHelper(self.service).ExecuteDictSelect(sql, params):
+                self.rows[row['paperId']] = row
+            self.missing.update(paper_id for paper_id in chunk if paper_id not in self.rows)
+        return {paper_id: self.rows[paper_id] for paper_id in paper_ids if paper_id in self.rows}
+
+    def List(self, paper_ids) -> list:
+        return list(self.Load(paper_ids).values())
+
+    def Get(self, paper_id:str):
+        return self.Load([paper_id]).get(paper_id)
+
+    def Invalidate(self, paper_ids=None):
+        if paper_ids is None:
+            self.rows.clear()
+            self.missing.clear()
+            return
+        for paper_id in paper_ids:
+            self.rows.pop(paper_id, None)
+            self.missing.discard(paper_id)
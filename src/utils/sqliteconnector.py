@@ -1,22 +1,70 @@
-import os, json
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import os, json, threading
+from src.utils.metrics import Metrics
 BASEFOLDER = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
 class SqliteConnector:
+    """
+    Keeps one engine per service with a bounded QueuePool: every SqliteHelper
+    checks a connection out when it is created and hands it back once its
+    Execute* call finished, so threads share `pool_size` open sqlite3
+    connections instead of opening the database file again, and bursts beyond
+    it get up to `max_overflow` extra connections that are closed on return.
+    The pragmas below are applied once when a connection is created and can be
+    overridden per service with a "pragmas" entry in db_list.json.
+
+    Relative database paths resolve against the data folder (PAPER_DATA_FOLDER,
+    else the "data_folder" entry of db_list.json, else the repository root), so
+    the server, the CLI and the job workers share one set of databases whatever
+    directory they are started from.
+    """
     engine = {}
     session = {}
+    schema = set()
+    _lock = threading.Lock()
     config_path = os.path.join(BASEFOLDER, "src", "config", "db_list.json")
+    PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'cache_size': -65536,
+        'temp_store': 'MEMORY'
+    }
     def __init__(self, service:str):
         if service not in SqliteConnector.engine:
-            with open(self.config_path) as default_config_file:
-                config = json.load(default_config_file)
-            sqlite_uri = self.__compose_uri(config['sqlite3'][service])
-            engine = create_engine(sqlite_uri)
-            SqliteConnector.engine[service] = engine
-            SqliteConnector.session[service] = sessionmaker(bind=engine)
+            with SqliteConnector._lock:
+                if service not in SqliteConnector.engine:
+                    self.__create_engine(service)
         connection = SqliteConnector.engine[service].connect()
         self.session = SqliteConnector.session[service](bind=connection)
+
+    def __create_engine(self, service:str):
+        from sqlalchemy import create_engine, event
+        from sqlalchemy.orm import sessionmaker
+        from sqlalchemy.pool import QueuePool
+        with open(self.config_path) as default_config_file:
+            config = json.load(default_config_file)
+        service_config = config['sqlite3'][service]
+        sqlite_uri = self.__compose_uri(service_config, self.DataFolder(config))
+        engine = create_engine(
+            sqlite_uri,
+            poolclass=QueuePool,
+            pool_size=service_config.get('pool_size', 8),
+            max_overflow=service_config.get('max_overflow', 56),
+            pool_timeout=service_config.get('pool_timeout', 30),
+            connect_args={'check_same_thread': False, 'timeout': service_config.get('busy_timeout', 30)}
+            )
+        pragmas = dict(SqliteConnector.PRAGMAS)
+        pragmas.update(service_config.get('pragmas', {}))
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragma(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+            cursor.close()
+
+        SqliteConnector.engine[service] = engine
+        SqliteConnector.session[service] = sessionmaker(bind=engine)
     
     def get_session(self):
         return self.session
@@ -34,35 +82,91 @@ class SqliteConnector:
     def execute_raw_sql(self, *entites, **kwargs):
         return self.session.execute(*entites, **kwargs)
     
-    def __compose_uri(self, config):
-        path = config["path"]
+    @staticmethod
+    def DataFolder(config:dict) -> str:
+        folder = os.environ.get('PAPER_DATA_FOLDER') or config.get('data_folder') or '.'
+        return os.path.abspath(os.path.join(BASEFOLDER, folder))
+
+    def __compose_uri(self, config, data_folder:str):
+        path = os.path.join(data_folder, config["path"])
         return f"sqlite:///{path}"
     
 class SqliteHelper:
     def __init__(self, CONN_INFO):
+        self.service = CONN_INFO
         self.sql_connector = SqliteConnector(CONN_INFO)
 
+    def ExecuteScript(self, sql:str):
+        try:
+            raw_connection = self.sql_connector.get_session().connection().connection
+            with Metrics.Span('sqlite_execute', service=self.service, operation='script'):
+                raw_connection.executescript(sql)
+        finally:
+            self.sql_connector.session_close()
+
+    def EnsureSchema(self, name:str, sql:str):
+        """Run the DDL script `sql` once per process and service."""
+        key = (self.service, name)
+        if key in SqliteConnector.schema:
+            self.sql_connector.session_close()
+            return
+        with SqliteConnector._lock:
+            if key not in SqliteConnector.schema:
+                self.ExecuteScript(sql)
+                SqliteConnector.schema.add(key)
+            else:
+                self.sql_connector.session_close()
+
+    def Tables(self) -> set:
+        """Names of the existing tables; dry runs check them instead of creating the schema."""
+        return {name for name, in self.ExecuteSelect("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
     def ExecuteUpdate(self, *entities, **kwargs):
             count = 0
             try:   
-                result = self.sql_connector.execute_raw_sql(*entities, **kwargs)
+                with Metrics.Span('sqlite_execute', service=self.service, operation='update'):
+                    result = self.sql_connector.execute_raw_sql(*entities, **kwargs)
+                    self.sql_connector.get_session().commit()
                 count = result.rowcount
             except Exception as e:
                 print(e)
                 self.sql_connector.get_session().rollback()
-            else:    
-                self.sql_connector.get_session().commit()
             finally:         
                 self.sql_connector.session_close()
             return count
             
+    def ExecuteTransaction(self, statements:list):
+            """Execute (sql, params) pairs in one transaction. A list of params is run with executemany."""
+            counts = []
+            try:
+                with Metrics.Span('sqlite_execute', service=self.service, operation='transaction'):
+                    for sql, params in statements:
+                        if isinstance(params, list) and len(params) == 0:
+                            counts.append(0)
+                            continue
+                        result = self.sql_connector.execute_raw_sql(sql, params)
+                        counts.append(result.rowcount)
+                    self.sql_connector.get_session().commit()
+            except Exception:
+                self.sql_connector.get_session().rollback()
+                raise
+            finally:
+                self.sql_connector.session_close()
+            return counts
+
     def ExecuteDictSelect(self, *entities, **kwargs):
-            results = self.sql_connector.execute_raw_sql(*entities, **kwargs)
-            data = [dict(result) for result in results] 
-            self.sql_connector.session_close()
+            try:
+                with Metrics.Span('sqlite_execute', service=self.service, operation='select'):
+                    results = self.sql_connector.execute_raw_sql(*entities, **kwargs)
+                    data = [dict(result) for result in results]
+            finally:
+                self.sql_connector.session_close()
             return data     
     def ExecuteSelect(self, *entities, **kwargs):
-        result = self.sql_connector.execute_raw_sql(*entities, **kwargs)
-        data = result.fetchall()       
-        self.sql_connector.session_close()
+        try:
+            with Metrics.Span('sqlite_execute', service=self.service, operation='select'):
+                result = self.sql_connector.execute_raw_sql(*entities, **kwargs)
+                data = result.fetchall()
+        finally:
+            self.sql_connector.session_close()
         return data     
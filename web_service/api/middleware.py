@@ -0,0 +1,65 @@
+import time
+import uuid
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from src.utils.metrics import Metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request into http_request_seconds{route, method, status}.
+
+    When settings.REQUEST_TRACING is on, a request sent with `X-Trace: 1` also
+    records every span it causes (SQLite, provider calls, filesystem operations,
+    stages); the trace is dumped as JSON into Metrics.trace_dir and the response
+    carries `X-Trace-Id` plus a `Server-Timing` summary per span name. Traces are
+    capped at REQUEST_TRACE_MAX_SPANS spans and only the REQUEST_TRACE_KEEP most
+    recent files are kept.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        self.tracing = getattr(settings, 'REQUEST_TRACING', False)
+        self.trace_keep = getattr(settings, 'REQUEST_TRACE_KEEP', 100)
+        self.trace_max_spans = getattr(settings, 'REQUEST_TRACE_MAX_SPANS', 2000)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.AsyncCall(request)
+        token, start = self.Start(request)
+        response = self.get_response(request)
+        return self.Finish(request, response, token, start)
+
+    async def AsyncCall(self, request):
+        token, start = self.Start(request)
+        response = await self.get_response(request)
+        return self.Finish(request, response, token, start)
+
+    def Start(self, request):
+        token = None
+        if self.tracing and request.headers.get('X-Trace', '').lower() in ('1', 'true', 'yes'):
+            token = Metrics.StartTrace(f"{request.method} {request.path}", self.trace_max_spans)
+        return token, time.perf_counter()
+
+    def Finish(self, request, response, token, start):
+        route = getattr(request.resolver_match, 'route', None) or 'unmatched'
+        Metrics.Observe('http_request_seconds', time.perf_counter() - start, route=route, method=request.method, status=response.status_code)
+        if token is not None:
+            trace = Metrics.StopTrace(token)
+            trace.update({'route': route, 'status': response.status_code})
+            trace_id = uuid.uuid4().hex
+            try:
+                Metrics.DumpTrace(trace, trace_id, self.trace_keep)
+            except OSError as e:
+                print(f"Failed to dump request trace: {e}")
+            totals = dict()
+            for span in trace['spans']:
+                totals[span['name']] = totals.get(span['name'], 0) + span['durationMs']
+            response['X-Trace-Id'] = trace_id
+            response['Server-Timing'] = ', '.join([f"{name};dur={round(total, 3)}" for name, total in sorted(totals.items())] + [f"total;dur={trace['durationMs']}"])
+        return response
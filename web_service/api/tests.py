@@ -1,3 +1,1209 @@
-from django.test import TestCase
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import tempfile
+import threading
+import subprocess
+from unittest import mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from django.test import SimpleTestCase, TestCase
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Create your tests here.
+
+class ImportBudgetTests(SimpleTestCase):
+    """
+    Cron driven ingests and worker restarts pay the import cost on every start,
+    so the entry modules must not pull in Django, SQLAlchemy, requests or numpy
+    until something actually uses them. Every check runs in a fresh interpreter.
+    """
+    HEAVY_MODULES = ('django', 'sqlalchemy', 'requests', 'numpy', 'scipy')
+    ENTRY_MODULES = ('main', 'src.cli', 'src.component.folder_watcher', 'src.component.paper_register', 'src.component.search_engine')
+    # cumulative seconds per entry module, several times what a cold import takes today
+    IMPORT_BUDGET = 0.3
+
+    def RunPython(self, *args:str) -> subprocess.CompletedProcess:
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        return subprocess.run([sys.executable, *args], cwd=REPO_DIR, env=env, capture_output=True, text=True, timeout=60, check=True)
+
+    def LoadedHeavyModules(self, code:str) -> list:
+        check = f"{code}\nimport sys, json\nprint(json.dumps([name for name in {self.HEAVY_MODULES!r} if name in sys.modules]))"
+        return json.loads(self.RunPython('-c', check).stdout.strip().splitlines()[-1])
+
+    def test_entry_modules_defer_heavy_imports(self):
+        for module in self.ENTRY_MODULES:
+            with self.subTest(module=module):
+                self.assertEqual(self.LoadedHeavyModules(f"import {module}"), [])
+
+    def test_engines_build_no_provider(self):
+        code = "\n".join([
+            "from src.component.paper_register import PaperRegister",
+            "from src.component.search_engine import SearchEngine, AsyncSearchEngine",
+            "from src.utils.metadata_provider import MetadataProvider",
+            "PaperRegister(); SearchEngine(); AsyncSearchEngine()",
+            "assert not MetadataProvider.instances, MetadataProvider.instances",
+        ])
+        self.assertEqual(self.LoadedHeavyModules(code), [])
+
+    def test_import_time_budget(self):
+        for module in self.ENTRY_MODULES:
+            with self.subTest(module=module):
+                stderr = self.RunPython('-X', 'importtime', '-c', f"import {module}").stderr
+                cumulative = {line.split('|')[2].strip(): int(line.split('|')[1]) for line in stderr.splitlines() if line.startswith('import time:') and line.count('|') == 2 and line.split('|')[1].strip().isdigit()}
+                self.assertLess(cumulative[module] / 1e6, self.IMPORT_BUDGET, f"importing {module} took {cumulative[module] / 1e3:.1f} ms")
+
+
+class TemporaryDataFolder:
+    """Points every SQLite service at a fresh data folder for the duration of a test."""
+    def setUp(self):
+        super().setUp()
+        self.data_folder = tempfile.mkdtemp(prefix='papercollector-test-')
+        self.environ = mock.patch.dict(os.environ, {'PAPER_DATA_FOLDER': self.data_folder})
+        self.environ.start()
+        self.ResetEngines()
+
+    def tearDown(self):
+        self.ResetEngines()
+        self.environ.stop()
+        shutil.rmtree(self.data_folder, ignore_errors=True)
+        super().tearDown()
+
+    @staticmethod
+    def ResetEngines():
+        from src.utils.sqliteconnector import SqliteConnector
+        with SqliteConnector._lock:
+            for service in list(SqliteConnector.engine):
+                SqliteConnector.engine.pop(service).dispose()
+                SqliteConnector.session.pop(service, None)
+            SqliteConnector.schema.clear()
+
+
+class CommandLineTests(TemporaryDataFolder, SimpleTestCase):
+    """Runs the papercollector script in a fresh interpreter against the temporary data folder."""
+    def RunCommand(self, *args:str):
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'papercollector'), *args], cwd=self.data_folder, env=env, capture_output=True, text=True, timeout=120)
+        # stdout is reserved for the JSON events, whatever the library prints goes to stderr
+        return result.returncode, [json.loads(line) for line in result.stdout.splitlines()]
+
+    def test_check_dry_run_reports_json_lines_and_leaves_the_library_alone(self):
+        from src.utils.dao import PaperProcessor
+        from src.utils.sqliteconnector import SqliteHelper
+        library = os.path.join(self.data_folder, 'library')
+        os.makedirs(library)
+        PaperProcessor.CreateOrIgnorePaperTable()
+        SqliteHelper('paper_db').ExecuteTransaction([(CitationGraphIndexTests.PAPER_SQL, [{'paperId': 'gone'}])])
+        returncode, events = self.RunCommand('check', '--dry-run', library)
+        self.assertEqual(returncode, 0)
+        self.assertEqual([event['event'] for event in events], ['start', 'summary'])
+        self.assertEqual({event['command'] for event in events}, {'check'})
+        self.assertTrue(events[0]['dryRun'])
+        self.assertEqual(events[-1]['report']['removed'], ['gone'])
+        self.assertEqual(SqliteHelper('paper_db').ExecuteSelect("SELECT paperId FROM paper_information"), [('gone',)])
+
+    def test_usage_errors_exit_without_events(self):
+        returncode, events = self.RunCommand('check', '--no-such-option')
+        self.assertEqual((returncode, events), (2, []))
+
+
+class DryRunTests(TemporaryDataFolder, SimpleTestCase):
+    """Dry runs against a fresh data folder create no table and write no cache entry."""
+    def Provider(self):
+        from types import SimpleNamespace
+        from concurrent.futures import ThreadPoolExecutor
+        from src.utils.metadata_provider import MetadataProvider
+        from src.utils.metadata_cache import MetadataCache
+        from src.component.paper_info import SemanticScholarInfo
+
+        class StubProvider(MetadataProvider):
+            info_class = SemanticScholarInfo
+
+            def GetPaperBatch(self, paper_id_list:list):
+                payloads = {paperId: {
+                    'paperId': f"S2-{paperId}", 'externalIds': {'ArXiv': paperId}, 'url': '', 'title': f"Paper {paperId}",
+                    'citationCount': 0, 'fieldsOfStudy': [], 'publicationDate': '2021-01-01', 'authors': [],
+                    'citations': [], 'references': [{'paperId': 'S2-2101.00002', 'title': "Paper 2101.00002"}] if paperId == '2101.00001' else []
+                } for paperId in paper_id_list}
+                # cached the way the real providers cache their answers
+                self.cache.PutMany([(payload, [paperId]) for paperId, payload in payloads.items()])
+                return {paperId: self.Parse(dict(payload, identifyId=paperId)) for paperId, payload in payloads.items()}, dict()
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        return StubProvider(cache=MetadataCache('stub'), client=SimpleNamespace(batch_size=10, executor=executor))
+
+    def test_ingest_plan_creates_no_table_and_caches_nothing(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        from src.utils.ingest_journal import IngestJournal
+        from src.component.ingest_pipeline import IngestPipeline
+        provider = self.Provider()
+        source_dir, target_dir = os.path.join(self.data_folder, 'downloads'), os.path.join(self.data_folder, 'library')
+        os.makedirs(source_dir)
+        file_paths = []
+        for arxiv_id in ('2101.00001', '2101.00002'):
+            file_paths.append(os.path.join(source_dir, f"{arxiv_id}.pdf"))
+            with open(file_paths[-1], 'wb') as fp:
+                fp.write(arxiv_id.encode())
+        plan = IngestPipeline(provider, target_dir, journal=IngestJournal('dry-run')).Plan(file_paths)
+        self.assertEqual([result.status for result in plan['results']], ['planned', 'planned'])
+        self.assertEqual((len(plan['moves']), plan['rows'], plan['links']), (2, {'insert': 2, 'update': 0}, 1))
+        self.assertEqual(plan['moves'][0]['to'], os.path.join(target_dir, "20210101 Paper 2101.00001", "2101.00001.pdf"))
+        self.assertEqual(SqliteHelper('paper_db').Tables(), set())
+        self.assertEqual(sorted(os.listdir(source_dir)), ['2101.00001.pdf', '2101.00002.pdf'])
+        count_sql = "SELECT COUNT(*) FROM metadata_cache"
+        self.assertEqual(SqliteHelper('cache_db').ExecuteSelect(count_sql)[0][0], 0)
+        # outside the plan the answers are cached again
+        provider.GetPapersWithListPaperId(['2101.00001'])
+        self.assertEqual(SqliteHelper('cache_db').ExecuteSelect(count_sql)[0][0], 1)
+
+    def test_check_dry_run_creates_no_table(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        from src.utils.dao import PaperDataChecker
+        library = os.path.join(self.data_folder, 'library')
+        os.makedirs(os.path.join(library, 'some paper'))
+        report = PaperDataChecker([library]).checkPaperInDb(dry_run=True)
+        self.assertEqual((report['folders'], report['removed'], report['orphanLinks']), (1, [], 0))
+        self.assertEqual(SqliteHelper('paper_db').Tables(), set())
+
+
+class MetadataCacheTests(TemporaryDataFolder, SimpleTestCase):
+    PAPER = {
+        'paperId': 'abc123',
+        'title': 'Attention Is All You Need',
+        'citationCount': 10,
+        'externalIds': {'ArXiv': '1706.03762', 'DOI': '10.48550/arXiv.1706.03762'},
+    }
+
+    def CreateCache(self, **kwargs):
+        from src.utils.metadata_cache import MetadataCache
+        return MetadataCache('test_provider', **kwargs)
+
+    def test_cache_file_lives_in_data_folder(self):
+        self.CreateCache()
+        self.assertTrue(os.path.isfile(os.path.join(self.data_folder, 'metadata_cache.sqlite3')))
+
+    def test_alias_lookup(self):
+        cache = self.CreateCache()
+        cache.Put(self.PAPER, ('1706.03762v5',))
+        for identifier in ('1706.03762', 'ARXIV:1706.03762', 'arxiv:1706.03762v2', 'DOI:10.48550/ARXIV.1706.03762', 'abc123'):
+            with self.subTest(identifier=identifier):
+                self.assertEqual(cache.Get(identifier, ['title'])['paperId'], 'abc123')
+        self.assertIsNone(cache.Get('1706.99999', ['title']))
+        self.assertIsNone(cache.__class__('other_provider').Get('1706.03762', ['title']))
+
+    def test_per_field_ttl(self):
+        from src.utils.metadata_cache import DAY
+        cache = self.CreateCache()
+        now = time.time()
+        with mock.patch('src.utils.metadata_cache.time.time', return_value=now):
+            cache.Put(self.PAPER, ('1706.03762',))
+        with mock.patch('src.utils.metadata_cache.time.time', return_value=now + 2 * DAY):
+            self.assertIsNotNone(cache.Get('1706.03762', ['title', 'externalIds']))
+            self.assertIsNone(cache.Get('1706.03762', ['title', 'citationCount']))
+            # fields never fetched are a miss whatever their age
+            self.assertIsNone(cache.Get('1706.03762', ['references']))
+        with mock.patch('src.utils.metadata_cache.time.time', return_value=now + 2 * DAY):
+            cache.Put({'paperId': 'abc123', 'citationCount': 12}, ('1706.03762',))
+            self.assertEqual(cache.Get('1706.03762', ['title', 'citationCount'])['citationCount'], 12)
+        with mock.patch('src.utils.metadata_cache.time.time', return_value=now + 200 * DAY):
+            self.assertIsNone(cache.Get('1706.03762', ['title']))
+
+    def test_evict_least_recently_used(self):
+        cache = self.CreateCache(max_entries=2)
+        now = time.time()
+        for offset, paper_id in enumerate(('first', 'second')):
+            with mock.patch('src.utils.metadata_cache.time.time', return_value=now + offset):
+                cache.Put({'paperId': paper_id, 'title': paper_id}, (paper_id,))
+        with mock.patch('src.utils.metadata_cache.time.time', return_value=now + 2):
+            self.assertIsNotNone(cache.Get('first', ['title']))
+        with mock.patch('src.utils.metadata_cache.time.time', return_value=now + 3):
+            cache.Put({'paperId': 'third', 'title': 'third'}, ('third',))
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.Get('second', ['title']))
+        self.assertIsNotNone(cache.Get('first', ['title']))
+        self.assertIsNotNone(cache.Get('third', ['title']))
+        self.assertEqual(cache.Stats()['entries'], 2)
+
+
+class ScriptedProviderServer:
+    """Local HTTP server answering with a scripted list of (status, headers) pairs, then 200s."""
+    def __init__(self, script:list=()):
+        self.script = list(script)
+        self.requests = []
+        self._lock = threading.Lock()
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append((time.monotonic(), self.path))
+                    status, headers = server.script.pop(0) if server.script else (200, {})
+                body = json.dumps({'status': status}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def Stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MetadataHttpClientTests(SimpleTestCase):
+    def CreateClient(self, script:list=(), **overrides):
+        from src.utils.http_client import MetadataHttpClient
+        self.server = ScriptedProviderServer(script)
+        self.addCleanup(self.server.Stop)
+        overrides = {'rate': None, 'backoff': 0.001, 'max_retries': 3, **overrides}
+        return MetadataHttpClient('semantic_scholar', base_url=self.server.url, **overrides)
+
+    def test_retries_rate_limit_and_server_errors(self):
+        client = self.CreateClient([(429, {}), (503, {}), (500, {})])
+        response = client.Get('graph/v1/paper/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.CreateClient([(404, {})])
+        self.assertEqual(client.Get('graph/v1/paper/1').status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_gives_up_after_max_retries(self):
+        client = self.CreateClient([(502, {})] * 5, max_retries=2)
+        self.assertEqual(client.Get('graph/v1/paper/1').status_code, 502)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_honours_retry_after(self):
+        client = self.CreateClient([(429, {'Retry-After': '0.3'})])
+        self.assertEqual(client.Get('graph/v1/paper/1').status_code, 200)
+        (first, _), (second, _) = self.server.requests
+        self.assertGreaterEqual(second - first, 0.3)
+
+    def test_token_bucket_paces_requests(self):
+        client = self.CreateClient(rate=20, burst=1)
+        for index in range(6):
+            client.Get(f"graph/v1/paper/{index}")
+        first, last = self.server.requests[0][0], self.server.requests[-1][0]
+        # one token up front, then one every 1/20 s
+        self.assertGreaterEqual(last - first, 5 / 20 * 0.9)
+
+
+class SqliteConnectorTests(TemporaryDataFolder, SimpleTestCase):
+    def test_connections_are_returned_from_many_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from src.utils.sqliteconnector import SqliteHelper, SqliteConnector
+        SqliteHelper('cache_db').EnsureSchema('numbers', "CREATE TABLE IF NOT EXISTS numbers (value INT);")
+        SqliteHelper('cache_db').ExecuteUpdate("INSERT INTO numbers (value) VALUES (:value)", [{'value': value} for value in range(10)])
+        def work(index):
+            # a thread per call, far more threads than pooled connections
+            thread = threading.Thread(target=lambda: results.append(SqliteHelper('cache_db').ExecuteSelect("SELECT SUM(value) FROM numbers")[0][0]))
+            thread.start()
+            thread.join()
+        results = []
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            list(executor.map(work, range(200)))
+        self.assertEqual(results, [45] * 200)
+        pool = SqliteConnector.engine['cache_db'].pool
+        self.assertEqual(pool.checkedout(), 0)
+        self.assertLessEqual(pool.checkedin(), pool.size())
+
+    def test_failed_select_releases_its_connection(self):
+        from src.utils.sqliteconnector import SqliteHelper, SqliteConnector
+        with self.assertRaises(Exception):
+            SqliteHelper('cache_db').ExecuteSelect("SELECT * FROM missing_table")
+        self.assertEqual(SqliteConnector.engine['cache_db'].pool.checkedout(), 0)
+
+
+class CitationGraphIndexTests(TemporaryDataFolder, SimpleTestCase):
+    PAPER_SQL = """
+    INSERT INTO paper_information (paperId, identifyId, title, authors, publicationDate, fieldsOfStudy, url, location, paperPath)
+    VALUES (:paperId, :paperId, :paperId, '[]', '2020-01-01', '[]', '', '', '')
+    """
+    LINK_SQL = "INSERT INTO paper_link (source_id, citation_id) VALUES (:source_id, :citation_id)"
+
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        PaperProcessor.CreateOrIgnorePaperTable()
+
+    def Execute(self, sql:str, params=None):
+        from src.utils.sqliteconnector import SqliteHelper
+        SqliteHelper('paper_db').ExecuteTransaction([(sql, params or {})])
+
+    def test_sync_reads_additions_and_reloads_after_deletes(self):
+        from src.utils.citation_graph import CitationGraphIndex
+        self.Execute(self.PAPER_SQL, [{'paperId': paper_id} for paper_id in ('A', 'B', 'C')])
+        self.Execute(self.LINK_SQL, [{'source_id': 'A', 'citation_id': 'B'}, {'source_id': 'A', 'citation_id': 'C'}])
+        index = CitationGraphIndex.ForService()
+        self.assertEqual(sorted(index.GetCitations('A')), ['B', 'C'])
+        self.Execute(self.LINK_SQL, [{'source_id': 'C', 'citation_id': 'A'}])
+        self.assertEqual(CitationGraphIndex.ForService().GetCitations('C'), ['A'])
+        self.Execute("DELETE FROM paper_information WHERE paperId = 'B'")
+        self.Execute("DELETE FROM paper_link WHERE citation_id = 'B'")
+        index = CitationGraphIndex.ForService()
+        self.assertNotIn('B', index)
+        self.assertEqual(index.GetCitations('A'), ['C'])
+        self.assertEqual((index.paper_count, index.link_count), (2, 2))
+
+
+class LibraryTitleLookupTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        PaperProcessor.CreateOrIgnorePaperTable()
+
+    def test_local_hit_has_provider_shape(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        from src.component.paper_info import PaperRecord
+        from src.component.search_engine import SearchEngine
+        SqliteHelper('paper_db').ExecuteTransaction([
+            (CitationGraphIndexTests.PAPER_SQL, [{'paperId': 'abc'}, {'paperId': 'xyz'}]),
+            ("UPDATE paper_information SET title = 'Deep Residual Learning', identifyId = '1512.03385' WHERE paperId = 'abc'", {}),
+            (CitationGraphIndexTests.LINK_SQL, [{'source_id': 'abc', 'citation_id': 'xyz'}]),
+        ])
+        # the provider is never asked: building it would need the network configuration
+        with mock.patch.object(SearchEngine, 'semantic_tool', new_callable=mock.PropertyMock) as semantic_tool:
+            data = SearchEngine().GetPaperDataByTitle('deep residual learning')
+        semantic_tool.assert_not_called()
+        self.assertEqual(set(data), set(PaperRecord('remote').get_data()))
+        self.assertEqual(data['externalIds'], {'ArXiv': '1512.03385'})
+        self.assertEqual(data['citations'], [{'paperId': 'xyz', 'title': 'xyz'}])
+
+
+class PaperRecordTests(SimpleTestCase):
+    PAYLOAD = {
+        'paperId': '204e3073870fae3d05bcbc2f6a8e263d9b72e776',
+        'externalIds': {'ArXiv': '1706.03762', 'DBLP': 'journals/corr/VaswaniSPUJGKP17'},
+        'url': 'https://www.semanticscholar.org/paper/204e3073870fae3d05bcbc2f6a8e263d9b72e776',
+        'title': 'Attention is All you Need',
+        'citationCount': 100000,
+        'fieldsOfStudy': ['Computer Science'],
+        'publicationDate': '2017-06-12',
+        'authors': [{'authorId': '40348417', 'name': 'Ashish Vaswani'}, {'authorId': '1846258', 'name': 'Noam M. Shazeer'}],
+        'citations': [{'paperId': 'c1', 'title': 'Citing Paper'}, {'paperId': None, 'title': 'Unresolved Citation'}],
+        'references': [{'paperId': 'r1', 'title': 'Referenced Paper'}],
+    }
+
+    @staticmethod
+    def BaselineData(payload:dict) -> dict:
+        # what SemanticScholarInfo.get_data returned before payloads were parsed into slots
+        data = dict(payload)
+        data['authors'] = ','.join(author['name'] for author in data['authors'])
+        data['fieldsOfStudy'] = ','.join(data['fieldsOfStudy']) if data['fieldsOfStudy'] else ""
+        # links Semantic Scholar could not resolve to a paper are the one intended difference
+        data['citations'] = [item for item in data['citations'] if item['paperId']]
+        return data
+
+    def test_get_data_keeps_the_semantic_scholar_shape(self):
+        from src.component.paper_info import SemanticScholarInfo
+        self.assertEqual(SemanticScholarInfo(self.PAYLOAD).get_data(), self.BaselineData(self.PAYLOAD))
+
+    def test_links_without_titles_still_carry_the_key(self):
+        from src.component.paper_info import PaperRecord
+        data = PaperRecord('abc', citation_ids=('c1',)).get_data()
+        self.assertEqual((data['citations'], data['references']), ([{'paperId': 'c1', 'title': None}], []))
+
+
+class LocalSearchIndexTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        PaperProcessor.CreateOrIgnorePaperTable()
+
+    def Execute(self, sql:str, params=None):
+        from src.utils.sqliteconnector import SqliteHelper
+        SqliteHelper('paper_db').ExecuteTransaction([(sql, params or {})])
+
+    def Found(self, query:str) -> list:
+        from src.utils.local_search import LocalSearchIndex
+        return [row['paperId'] for row in LocalSearchIndex('paper_db').Search(query)['results']]
+
+    def test_triggers_keep_the_index_in_sync(self):
+        self.Execute(CitationGraphIndexTests.PAPER_SQL, [{'paperId': 'A'}])
+        self.Execute("UPDATE paper_information SET title = 'Graph Attention Networks' WHERE paperId = 'A'")
+        self.assertEqual(self.Found('graph attention'), ['A'])
+        self.Execute("UPDATE paper_information SET title = 'Residual Networks' WHERE paperId = 'A'")
+        self.assertEqual(self.Found('graph attention'), [])
+        self.assertEqual(self.Found('residual'), ['A'])
+        self.Execute("DELETE FROM paper_information WHERE paperId = 'A'")
+        self.assertEqual(self.Found('residual'), [])
+
+    def test_title_hits_rank_first(self):
+        self.Execute(CitationGraphIndexTests.PAPER_SQL, [{'paperId': paper_id} for paper_id in ('by-author', 'by-title', 'by-field')])
+        self.Execute("UPDATE paper_information SET title = 'Unrelated Study', authors = 'Transformer Smith' WHERE paperId = 'by-author'")
+        self.Execute("UPDATE paper_information SET title = 'Transformer Models' WHERE paperId = 'by-title'")
+        self.Execute("UPDATE paper_information SET title = 'Another Study', fieldsOfStudy = 'Transformer' WHERE paperId = 'by-field'")
+        self.assertEqual(self.Found('transformer'), ['by-title', 'by-author', 'by-field'])
+
+
+class AsyncSearchEngineTests(SimpleTestCase):
+    class SlowSearchEngine:
+        def __init__(self):
+            self.calls = []
+            self._lock = threading.Lock()
+        def GetPaperData(self, paper_id):
+            with self._lock:
+                self.calls.append(paper_id)
+            time.sleep(0.2)
+            return {'paperId': paper_id}
+        def SearchWithPaperIds(self, paper_ids):
+            with self._lock:
+                self.calls.append(tuple(paper_ids))
+            time.sleep(0.2)
+            return {'success': {paper_id: {'paperId': paper_id} for paper_id in paper_ids}, 'failed': {}}
+        def IterSearchWithPaperIds(self, paper_ids):
+            for paper_id in paper_ids:
+                yield 'success', paper_id, {'paperId': paper_id}
+            yield 'failed', {}, None
+
+    def RunInLoops(self, count:int, coroutine_function):
+        """Run `coroutine_function()` in `count` threads, each with its own event loop like WSGI requests."""
+        results = [None] * count
+        def run(index):
+            results[index] = asyncio.run(coroutine_function())
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalesces_lookups_across_event_loops(self):
+        from src.component.search_engine import AsyncSearchEngine
+        slow = self.SlowSearchEngine()
+        engine = AsyncSearchEngine(slow, max_concurrency=4)
+        results = self.RunInLoops(8, lambda: engine.SearchWithPaperId('/tmp/1706.03762.pdf'))
+        self.assertEqual(slow.calls, ['ArXiv:1706.03762'])
+        self.assertEqual(results, [{'1706.03762': {'paperId': 'ArXiv:1706.03762'}}] * 8)
+        self.assertEqual(engine.inflight, {})
+
+    def test_coalesces_paper_id_batches_across_event_loops(self):
+        from src.component.search_engine import AsyncSearchEngine
+        slow = self.SlowSearchEngine()
+        engine = AsyncSearchEngine(slow, max_concurrency=4)
+        results = self.RunInLoops(6, lambda: engine.SearchWithPaperIds(['a', 'b']))
+        self.assertEqual(slow.calls, [('a', 'b')])
+        self.assertEqual(results[0]['success'], {'a': {'paperId': 'a'}, 'b': {'paperId': 'b'}})
+        self.assertEqual(engine.inflight, {})
+
+    def test_wsgi_stream_is_not_buffered(self):
+        from django.test import Client
+        from api import views
+        with mock.patch.object(views.search_engine, 'search_engine', self.SlowSearchEngine()):
+            response = Client().post('/api/paper/search/paperIds', json.dumps({'paperIds': ['a', 'b'], 'stream': True}), content_type='application/json')
+            self.assertTrue(response.streaming)
+            self.assertFalse(response.is_async)
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line.get('paperId') for line in lines], ['a', 'b', None])
+        self.assertEqual(lines[-1]['success'], 2)
+
+
+class IngestPipelineTests(TemporaryDataFolder, SimpleTestCase):
+    class StubProvider:
+        def GetPapersWithListPaperId(self, identify_ids, failures):
+            from src.component.paper_info import SemanticScholarInfo
+            return {identify_id: SemanticScholarInfo({
+                'paperId': f"s2-{identify_id}", 'title': f"Paper {identify_id}", 'publicationDate': '2021-01-01', 'citationCount': 0, 'url': '',
+                'externalIds': {'ArXiv': identify_id}, 'authors': [], 'citations': [], 'references': []
+            }) for identify_id in identify_ids}
+
+    def setUp(self):
+        super().setUp()
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        self.source_dir = os.path.join(self.data_folder, 'inbox')
+        os.makedirs(self.source_dir)
+        self.file_paths = []
+        for index in range(30):
+            file_path = os.path.join(self.source_dir, f"2101.{index:05d}.pdf")
+            with open(file_path, 'wb') as fp:
+                fp.write(os.urandom(64))
+            self.file_paths.append(file_path)
+
+    def RunPipeline(self, pipeline):
+        """Run the pipeline in a thread so a hang fails the test instead of blocking it."""
+        outcome = dict()
+        def run():
+            try:
+                outcome['results'] = pipeline.Run(self.file_paths)
+            except Exception as e:
+                outcome['error'] = e
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(60)
+        self.assertFalse(thread.is_alive(), "the ingest pipeline hung")
+        return outcome
+
+    def test_failing_progress_callback_does_not_stop_the_ingest(self):
+        from src.component.ingest_pipeline import IngestPipeline
+        def progress(result):
+            raise RuntimeError("progress consumer went away")
+        pipeline = IngestPipeline(self.StubProvider(), os.path.join(self.data_folder, 'library'), batch_size=2, queue_size=1, progress=progress)
+        with mock.patch('sys.stdout'):
+            outcome = self.RunPipeline(pipeline)
+        self.assertEqual({result.status for result in outcome['results']}, {'success'})
+
+    def test_crashed_stage_fails_the_run(self):
+        from src.component.ingest_pipeline import IngestPipeline
+        pipeline = IngestPipeline(self.StubProvider(), os.path.join(self.data_folder, 'library'), batch_size=2, queue_size=1)
+        with mock.patch.object(pipeline, 'WriteBatches', side_effect=RuntimeError("disk full")), mock.patch('sys.stdout'):
+            outcome = self.RunPipeline(pipeline)
+        self.assertEqual(str(outcome['error']), "disk full")
+
+
+class LibraryIntegrityScannerTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        PaperProcessor.CreateOrIgnorePaperTable()
+        self.library_dir = os.path.join(self.data_folder, 'library')
+
+    def AddPaper(self, paper_id:str) -> str:
+        """Write the folder of `paper_id` and register it as the previous versions did, without a content hash."""
+        from src.utils.sqliteconnector import SqliteHelper
+        folder = os.path.join(self.library_dir, paper_id)
+        paper_path = os.path.join(folder, f"{paper_id}.pdf")
+        os.makedirs(folder)
+        with open(paper_path, 'wb') as fp:
+            fp.write(os.urandom(64))
+        with open(os.path.join(folder, 'config.json'), 'w') as fp:
+            json.dump({'paperId': paper_id, 'identifyId': paper_id, 'location': folder, 'paperPath': paper_path}, fp)
+        SqliteHelper('paper_db').ExecuteTransaction([
+            (CitationGraphIndexTests.PAPER_SQL, [{'paperId': paper_id}]),
+            ("UPDATE paper_information SET location = :location, paperPath = :paperPath WHERE paperId = :paperId", {'paperId': paper_id, 'location': folder, 'paperPath': paper_path}),
+        ])
+        return paper_path
+
+    def Scan(self, dry_run:bool=False) -> dict:
+        from src.utils.library_scanner import LibraryIntegrityScanner
+        with mock.patch('sys.stdout'):
+            return LibraryIntegrityScanner(library_dirs=[self.library_dir]).Scan(dry_run)
+
+    def test_scan_hashes_existing_library(self):
+        from src.utils.content_index import PdfContentIndex
+        paper_path = self.AddPaper('A')
+        self.AddPaper('B')
+        copy_path = os.path.join(self.data_folder, 'copy.pdf')
+        shutil.copyfile(paper_path, copy_path)
+        self.assertEqual(PdfContentIndex().FindDuplicates([copy_path]), {})
+        self.assertEqual(self.Scan(dry_run=True)['hashed'], 2)
+        self.assertEqual(self.Scan()['hashed'], 2)
+        self.assertEqual(PdfContentIndex().FindDuplicates([copy_path])[copy_path]['paperId'], 'A')
+        self.assertEqual(self.Scan()['hashed'], 0)
+
+    def test_removed_paper_leaves_the_content_index(self):
+        from src.utils.content_index import PdfContentIndex
+        paper_path = self.AddPaper('A')
+        copy_path = os.path.join(self.data_folder, 'copy.pdf')
+        shutil.copyfile(paper_path, copy_path)
+        self.Scan()
+        os.remove(paper_path)
+        self.assertEqual(self.Scan()['removed'], ['A'])
+        self.assertEqual(PdfContentIndex().FindDuplicates([copy_path]), {})
+
+    def test_links_of_removed_papers_are_dropped(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        paper_path = self.AddPaper('A')
+        self.AddPaper('B')
+        self.AddPaper('C')
+        SqliteHelper('paper_db').ExecuteTransaction([(CitationGraphIndexTests.LINK_SQL, [
+            {'source_id': 'A', 'citation_id': 'B'}, {'source_id': 'B', 'citation_id': 'A'},
+            {'source_id': 'C', 'citation_id': 'A'}, {'source_id': 'B', 'citation_id': 'C'},
+        ])])
+        os.remove(paper_path)
+        self.assertEqual(self.Scan(dry_run=True)['orphanLinks'], 3)
+        self.assertEqual(self.Scan()['orphanLinks'], 3)
+        links = SqliteHelper('paper_db').ExecuteSelect("SELECT source_id, citation_id FROM paper_link")
+        self.assertEqual([tuple(link) for link in links], [('B', 'C')])
+
+    def test_orphan_links_already_in_the_database_are_dropped(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        self.AddPaper('A')
+        self.AddPaper('B')
+        # left behind by the old checker, which never deleted the source_id side
+        SqliteHelper('paper_db').ExecuteTransaction([(CitationGraphIndexTests.LINK_SQL, [
+            {'source_id': 'A', 'citation_id': 'B'}, {'source_id': 'gone', 'citation_id': 'A'}, {'source_id': 'B', 'citation_id': 'gone'},
+        ])])
+        self.assertEqual(self.Scan(dry_run=True)['orphanLinks'], 2)
+        self.assertEqual(self.Scan()['orphanLinks'], 2)
+        links = SqliteHelper('paper_db').ExecuteSelect("SELECT source_id, citation_id FROM paper_link")
+        self.assertEqual([tuple(link) for link in links], [('A', 'B')])
+
+
+class CitationGraphAnalyticsTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.citation_graph import CitationGraphIndex
+        from src.utils.graph_analytics import CitationGraphAnalytics
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        self.addCleanup(CitationGraphAnalytics.analytics.clear)
+        CitationGraphIndex.indexes.clear()
+        CitationGraphAnalytics.analytics.clear()
+        PaperProcessor.CreateOrIgnorePaperTable()
+        from src.utils.sqliteconnector import SqliteHelper
+        SqliteHelper('paper_db').ExecuteTransaction([
+            (CitationGraphIndexTests.PAPER_SQL, [{'paperId': paper_id} for paper_id in ('A', 'B', 'C')]),
+            # A and B both cite C
+            (CitationGraphIndexTests.LINK_SQL, [{'source_id': 'C', 'citation_id': 'A'}, {'source_id': 'C', 'citation_id': 'B'}]),
+        ])
+
+    def test_reads_serve_the_last_snapshot_while_refreshing(self):
+        from src.utils.graph_analytics import CitationGraphAnalytics
+        analytics = CitationGraphAnalytics.ForService()
+        release = threading.Event()
+        refresh = analytics.Refresh
+        def slow_refresh(force=False):
+            release.wait(10)
+            return refresh(force)
+        with mock.patch.object(analytics, 'Refresh', side_effect=slow_refresh):
+            started = time.monotonic()
+            self.assertEqual(analytics.Central(), [])
+            self.assertEqual(analytics.Similar('A'), [])
+            self.assertLess(time.monotonic() - started, 5)
+            release.set()
+            analytics.refresh_thread.join(30)
+        self.assertEqual(analytics.Central()[0]['paperId'], 'C')
+        self.assertEqual([row['paperId'] for row in analytics.Similar('A')], ['B'])
+        self.assertFalse(analytics.RefreshInBackground())
+
+    def test_delete_forces_full_recompute(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        from src.utils.graph_analytics import CitationGraphAnalytics
+        analytics = CitationGraphAnalytics.ForService()
+        self.assertTrue(analytics.Refresh())
+        SqliteHelper('paper_db').ExecuteTransaction([
+            ("DELETE FROM paper_link WHERE citation_id = 'B'", {}),
+            (CitationGraphIndexTests.LINK_SQL, [{'source_id': 'A', 'citation_id': 'B'}]),
+        ])
+        # the link count is unchanged, only the delete counter tells the tables are outdated
+        self.assertTrue(analytics.RefreshInBackground())
+        analytics.refresh_thread.join(30)
+        self.assertEqual(analytics.Similar('A'), [])
+
+
+class HedgedProviderTests(SimpleTestCase):
+    class StubProvider:
+        """Answers every id with a `found` set; the primary can be held back with `release`."""
+        def __init__(self, found:set, release:threading.Event=None, name:str='stub', fields:list=None, error:Exception=None):
+            from types import SimpleNamespace
+            from concurrent.futures import ThreadPoolExecutor
+            self.found = found
+            self.release = release
+            self.name = name
+            self.error = error
+            self.fields, self.cache, self.batch_size = fields or ['title'], None, 10
+            self.client = SimpleNamespace(executor=ThreadPoolExecutor(max_workers=2), batch_size=10)
+
+        def Answer(self, paper_id_list:list):
+            from src.component.paper_info import PaperRecord
+            if self.release is not None:
+                self.release.wait(30)
+            if self.error is not None:
+                raise self.error
+            return ({paperId: PaperRecord(paperId) for paperId in paper_id_list if paperId in self.found},
+                    {paperId: "Not found" for paperId in paper_id_list if paperId not in self.found})
+
+        def GetPaperBatch(self, paper_id_list:list):
+            return self.Answer(paper_id_list)
+
+        def GetPapersWithListPaperId(self, paper_id_list:list, failures:dict=None):
+            found, failed = self.Answer(paper_id_list)
+            failures.update(failed)
+            return found
+
+        def CachedPapers(self, paper_id_list:list) -> dict:
+            return dict()
+
+    def setUp(self):
+        from src.utils.metadata_provider import HedgedProvider
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.provider = HedgedProvider(self.StubProvider({'a', 'b', 'c'}, self.release), self.StubProvider({'a'}), hedge_after=0.05, answer_deadline=0.3)
+
+    def test_secondary_hits_are_not_held_back_by_the_primary(self):
+        started = time.monotonic()
+        answers = iter(self.provider.IterPapersWithListPaperId(['a', 'b', 'c']))
+        found, failed = next(answers)
+        self.assertEqual((set(found), failed), ({'a'}, {}))
+        self.assertLess(time.monotonic() - started, 5)
+        found, failed = next(answers)
+        self.assertEqual((found, set(failed)), ({}, {'b', 'c'}))
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(self.provider.hedged, 1)
+
+    def test_late_primary_fills_the_missing_ids(self):
+        threading.Timer(0.1, self.release.set).start()
+        failures = dict()
+        found = self.provider.GetPapersWithListPaperId(['a', 'b', 'c'], failures)
+        self.assertEqual((list(found), failures), (['a', 'b', 'c'], {}))
+
+    def test_provider_errors_are_counted_and_reported_as_failures(self):
+        from src.utils.metrics import Metrics
+        from src.utils.metadata_provider import HedgedProvider
+        secondary = self.StubProvider(set(), name='secondary', error=ConnectionError("offline"))
+        provider = HedgedProvider(self.StubProvider({'a'}, self.release, name='primary'), secondary, hedge_after=0.05, answer_deadline=0.1)
+        with mock.patch.multiple(Metrics, enabled=True, counters=dict()):
+            found, failed = next(iter(provider.IterPapersWithListPaperId(['a'])))
+            self.assertEqual((found, failed), ({}, {'a': "offline"}))
+            self.assertEqual(Metrics.counters, {Metrics.Key('provider_errors_total', {'provider': 'secondary'}): 1})
+
+    def test_link_fields_are_not_hedged_across_backends(self):
+        from src.utils.metadata_provider import HedgedProvider
+        fields = ['title', 'citations', 'references']
+        primary = self.StubProvider({'a'}, name='semantic_scholar', fields=fields)
+        secondary = self.StubProvider({'a', 'b'}, name='openalex', fields=fields)
+        provider = HedgedProvider(primary, secondary, hedge_after=0.0)
+        failures = dict()
+        found = provider.GetPapersWithListPaperId(['a', 'b'], failures)
+        self.assertEqual((list(found), failures), (['a'], {'b': "Not found"}))
+        self.assertEqual(provider.hedged, 0)
+        # the same fields hedge freely between two instances of one backend
+        self.assertTrue(HedgedProvider(primary, self.StubProvider(set(), name='semantic_scholar', fields=fields)).Hedges())
+
+
+class RequestTraceTests(SimpleTestCase):
+    def setUp(self):
+        from src.utils.metrics import Metrics
+        self.trace_dir = tempfile.mkdtemp(prefix='papercollector-traces-')
+        self.addCleanup(shutil.rmtree, self.trace_dir, ignore_errors=True)
+        patcher = mock.patch.object(Metrics, 'trace_dir', self.trace_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def Get(self):
+        from django.test import Client
+        return Client().get('/metrics', HTTP_X_TRACE='1')
+
+    def test_trace_header_is_ignored_unless_tracing_is_enabled(self):
+        with self.settings(REQUEST_TRACING=False):
+            response = self.Get()
+        self.assertNotIn('X-Trace-Id', response)
+        self.assertEqual(os.listdir(self.trace_dir), [])
+
+    def test_only_recent_traces_are_kept(self):
+        with self.settings(REQUEST_TRACING=True, REQUEST_TRACE_KEEP=2):
+            trace_ids = []
+            for _ in range(4):
+                trace_ids.append(self.Get()['X-Trace-Id'])
+                time.sleep(0.01)
+        self.assertEqual(sorted(os.listdir(self.trace_dir)), sorted(f"{trace_id}.json" for trace_id in trace_ids[-2:]))
+
+    def test_spans_past_the_cap_are_only_counted(self):
+        from src.utils.metrics import Metrics
+        token = Metrics.StartTrace('capped', max_spans=2)
+        for _ in range(5):
+            with Metrics.Span('fs_operation', operation='test'):
+                pass
+        trace = Metrics.StopTrace(token)
+        self.assertEqual((len(trace['spans']), trace['droppedSpans']), (2, 3))
+
+
+class PaperUpdateTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        self.library_dir = os.path.join(self.data_folder, 'library')
+        for identify_id in ('2101.00001', '2101.00002'):
+            folder = os.path.join(self.library_dir, f"old {identify_id}")
+            os.makedirs(folder)
+            with open(os.path.join(folder, f"{identify_id}.pdf"), 'wb') as fp:
+                fp.write(os.urandom(64))
+            with open(os.path.join(folder, 'config.json'), 'w') as fp:
+                json.dump({'paperId': f"s2-{identify_id}", 'identifyId': identify_id}, fp)
+
+    def Update(self, dry_run:bool) -> tuple:
+        from src.component.paper_register import PaperRegister
+        register = PaperRegister()
+        register._semantic_tool = IngestPipelineTests.StubProvider()
+        reported = []
+        with mock.patch('sys.stdout'):
+            res = register.UpdatePaperinformationInFolder(self.library_dir, progress=lambda folder, error: reported.append((os.path.basename(folder), error)), dry_run=dry_run)
+        return res, sorted(reported)
+
+    def test_dry_run_plans_what_the_update_does(self):
+        plan, planned = self.Update(dry_run=True)
+        self.assertEqual(sorted(os.listdir(self.library_dir)), ['old 2101.00001', 'old 2101.00002'])
+        res, reported = self.Update(dry_run=False)
+        self.assertEqual(planned, reported)
+        self.assertEqual(reported, [('old 2101.00001', None), ('old 2101.00002', None)])
+        self.assertEqual(sorted(plan['success']), sorted(res['success']))
+        for move in plan['plan']['moves']:
+            self.assertTrue(os.path.isfile(move['to']))
+            self.assertFalse(os.path.exists(move['from']))
+
+
+class JobApiTests(TemporaryDataFolder, TestCase):
+    def setUp(self):
+        super().setUp()
+        from django.test import Client
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user('librarian', password='secret')
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.drop_dir = os.path.join(self.data_folder, 'drop')
+        os.makedirs(self.drop_dir)
+        patcher = mock.patch('api.views.JobWorkerPool.ForService')
+        self.start_workers = patcher.start()
+        self.addCleanup(patcher.stop)
+        allowed = self.settings(JOB_ALLOWED_DIRS=[self.drop_dir])
+        allowed.enable()
+        self.addCleanup(allowed.disable)
+
+    def Submit(self, kind:str, params:dict, client=None):
+        return (client or self.client).post('/api/jobs', json.dumps({'type': kind, 'params': params}), content_type='application/json')
+
+    def test_jobs_need_a_logged_in_user(self):
+        from django.test import Client
+        self.assertEqual(Client().get('/api/jobs').status_code, 403)
+        self.assertEqual(self.Submit('clean', {'target_dir': self.drop_dir}, Client()).status_code, 403)
+        self.assertEqual(Client().post('/api/jobs/unknown/cancel').status_code, 403)
+
+    def test_posts_need_a_csrf_token(self):
+        from django.test import Client
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self.Submit('clean', {'target_dir': self.drop_dir}, client).status_code, 403)
+
+    def test_paths_outside_the_allowed_folders_are_rejected(self):
+        outside = tempfile.mkdtemp(prefix='papercollector-outside-')
+        self.addCleanup(shutil.rmtree, outside, ignore_errors=True)
+        os.symlink(outside, os.path.join(self.drop_dir, 'link'))
+        for target_dir in (outside, os.path.join(self.drop_dir, '..'), os.path.join(self.drop_dir, 'link')):
+            with self.subTest(target_dir=target_dir):
+                self.assertEqual(self.Submit('clean', {'target_dir': target_dir, 'delete_related_folder': True}).status_code, 422)
+        self.assertEqual(self.Submit('register', {'source_dir': self.drop_dir, 'target_dir': outside}).status_code, 422)
+        self.start_workers.assert_not_called()
+
+    def test_unknown_params_are_rejected(self):
+        self.assertEqual(self.Submit('clean', {'target_dir': self.drop_dir, 'source_dir': self.drop_dir}).status_code, 422)
+
+    def test_only_a_submit_starts_the_workers(self):
+        self.assertEqual(self.client.get('/api/jobs').status_code, 200)
+        self.start_workers.assert_not_called()
+        response = self.Submit('clean', {'target_dir': self.drop_dir, 'dry_run': True})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['data']['params']['target_dir'], os.path.realpath(self.drop_dir))
+        self.start_workers.assert_called_once_with('job_db')
+
+    def test_paging_is_validated(self):
+        self.assertEqual(self.client.get('/api/jobs', {'limit': 'ten'}).status_code, 422)
+        self.assertEqual(self.client.get('/api/jobs', {'offset': ''}).status_code, 422)
+        with mock.patch('src.utils.job_queue.JobQueue.List', return_value=[]) as listing:
+            self.assertEqual(self.client.get('/api/jobs', {'limit': '100000', 'offset': '-5'}).status_code, 200)
+        listing.assert_called_once_with(None, 100, 0)
+
+
+class JobQueueTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.job_queue import JobQueue
+        self.queue = JobQueue(heartbeat_timeout=30.0)
+        self.job_id = self.queue.Submit('clean', {'target_dir': self.data_folder})['jobId']
+        # claimed by this (live) process, as if its PID had been reused by a worker that died
+        self.queue.Claim(os.getpid())
+
+    def SetHeartbeat(self, seconds_ago:float):
+        import datetime
+        from src.utils.sqliteconnector import SqliteHelper
+        heartbeat = (datetime.datetime.now() - datetime.timedelta(seconds=seconds_ago)).isoformat(timespec='milliseconds')
+        SqliteHelper('job_db').ExecuteUpdate("UPDATE jobs SET heartbeatTime = :heartbeat WHERE jobId = :jobId", {'heartbeat': heartbeat, 'jobId': self.job_id})
+
+    def test_stale_heartbeat_is_lost_even_with_a_live_pid(self):
+        self.SetHeartbeat(60)
+        self.assertEqual(self.queue.Recover(), 1)
+        self.assertEqual(self.queue.Get(self.job_id)['status'], 'queued')
+
+    def test_recent_heartbeat_keeps_the_job_running(self):
+        self.SetHeartbeat(5)
+        self.assertEqual(self.queue.Recover(), 0)
+        self.assertEqual(self.queue.Get(self.job_id)['status'], 'running')
+
+    def test_dead_pid_does_not_wait_for_the_timeout(self):
+        from src.utils.job_queue import JobQueue
+        self.SetHeartbeat(5)
+        with mock.patch.object(JobQueue, 'WorkerAlive', return_value=False):
+            self.assertEqual(self.queue.Recover(), 1)
+        self.assertEqual(self.queue.Get(self.job_id)['status'], 'queued')
+
+    def test_heartbeat_after_the_read_keeps_the_job(self):
+        from src.utils.job_queue import JobQueue
+        self.SetHeartbeat(60)
+        lost = JobQueue.Lost
+        def beat_while_recovering(queue, row, now):
+            self.queue.Heartbeat(self.job_id, {'done': 1})
+            return lost(queue, row, now)
+        with mock.patch.object(JobQueue, 'Lost', beat_while_recovering):
+            self.queue.Recover()
+        self.assertEqual(self.queue.Get(self.job_id)['status'], 'running')
+
+
+class JobWorkerTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.library = os.path.join(self.data_folder, 'library')
+        for folder in ('paper a', 'paper b'):
+            os.makedirs(os.path.join(self.library, folder))
+            with open(os.path.join(self.library, folder, f"{folder}.pdf"), 'wb') as fp:
+                fp.write(b'%PDF')
+
+    def Clean(self, cancel:bool, **params):
+        from src.component.job_worker import JobWorker, JobContext
+        context = JobContext({'jobId': 'clean', 'kind': 'clean', 'params': params})
+        if cancel:
+            context.cancel.set()
+        result = JobWorker().RunClean(context, dict(params, target_dir=self.library))
+        return result, JobWorker.FinalStatus(context, result)
+
+    def test_cancelled_clean_stops_early_and_is_reported_cancelled(self):
+        result, status = self.Clean(cancel=True)
+        self.assertEqual((result['moves'], result['pending'], status), (0, 2, 'cancelled'))
+        self.assertEqual(os.listdir(os.path.join(self.library, 'paper a')), ['paper a.pdf'])
+
+    def test_cancel_after_the_work_is_done_is_a_success(self):
+        # a dry run has nothing to stop, the cancel request comes too late to matter
+        result, status = self.Clean(cancel=True, dry_run=True)
+        self.assertEqual((result['moves'], result['pending'], status), (2, 0, 'succeeded'))
+        result, status = self.Clean(cancel=False)
+        self.assertEqual((result['moves'], result['pending'], status), (2, 0, 'succeeded'))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.library, '.temp'))), ['paper a.pdf', 'paper b.pdf'])
+
+
+class PaperBulkIngestTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+
+    def Ingest(self, citation_count:int):
+        from src.utils.dao import PaperProcessor
+        from src.component.paper_info import SemanticScholarInfo
+        processors, target_dirs = [], []
+        for paper_id, references in (('A', [{'paperId': 'B', 'title': 'Paper B'}]), ('B', [])):
+            processors.append(PaperProcessor(SemanticScholarInfo({
+                'paperId': paper_id, 'title': f"Paper {paper_id}", 'publicationDate': '2021-01-01', 'citationCount': citation_count, 'url': '',
+                'externalIds': {}, 'authors': [], 'citations': [], 'references': references
+            })))
+            target_dir = os.path.join(self.data_folder, paper_id)
+            os.makedirs(target_dir, exist_ok=True)
+            target_dirs.append(target_dir)
+        PaperProcessor.BulkIngest(processors, target_dirs)
+
+    def test_reingest_updates_the_row_without_duplicating_links(self):
+        from src.utils.sqliteconnector import SqliteHelper
+        self.Ingest(citation_count=1)
+        self.Ingest(citation_count=7)
+        rows = SqliteHelper('paper_db').ExecuteDictSelect("SELECT paperId, citationCount, location FROM paper_information ORDER BY paperId")
+        self.assertEqual([(row['paperId'], row['citationCount']) for row in rows], [('A', 7), ('B', 7)])
+        self.assertEqual(rows[0]['location'], os.path.join(self.data_folder, 'A'))
+        links = SqliteHelper('paper_db').ExecuteSelect("SELECT source_id, citation_id FROM paper_link")
+        self.assertEqual([tuple(link) for link in links], [('B', 'A')])
+
+
+class PaperNoteRendererTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        PaperProcessor.CreateOrIgnorePaperTable()
+        self.Execute(CitationGraphIndexTests.PAPER_SQL, [{'paperId': 'A'}])
+        self.Execute("UPDATE paper_information SET location = :location WHERE paperId = 'A'", {'location': self.data_folder})
+        self.note_path = os.path.join(self.data_folder, 'A-intro.md')
+
+    def Execute(self, sql:str, params=None):
+        from src.utils.sqliteconnector import SqliteHelper
+        SqliteHelper('paper_db').ExecuteTransaction([(sql, params or {})])
+
+    def Flush(self, stamp:str) -> int:
+        from src.utils.note_renderer import PaperNoteRenderer
+        renderer = PaperNoteRenderer('paper_db')
+        renderer.MarkDirty(['A'])
+        with mock.patch.object(PaperNoteRenderer, 'AttachCurrentDate', return_value=f"{PaperNoteRenderer.STAMP_PREFIX}{stamp}</span>"):
+            return renderer.Flush()
+
+    def test_note_is_rewritten_only_when_its_content_changes(self):
+        self.assertEqual(self.Flush('Jan 01, 2026'), 1)
+        os.utime(self.note_path, ns=(0, 0))
+        self.assertEqual(self.Flush('Jan 02, 2026'), 0)
+        self.assertEqual(os.stat(self.note_path).st_mtime_ns, 0)
+        self.Execute("UPDATE paper_information SET citationCount = 42 WHERE paperId = 'A'")
+        self.assertEqual(self.Flush('Jan 03, 2026'), 1)
+        self.assertNotEqual(os.stat(self.note_path).st_mtime_ns, 0)
+        with open(self.note_path, encoding='utf8') as fp:
+            note = fp.read()
+        self.assertIn('- Citation: 42', note)
+        self.assertTrue(note.endswith('Jan 03, 2026</span>'))
+
+
+class PaperFolderWatcherTests(TemporaryDataFolder, SimpleTestCase):
+    class RecordingRegister:
+        def __init__(self):
+            self.calls = []
+
+        def RegisterFiles(self, file_paths, target_dir, progress=None, batch_size=100, journal=None):
+            self.calls.append(sorted(file_paths))
+            return {'success': list(file_paths), 'failed': [], 'skipped': [], 'pending': [], 'results': []}
+
+    def test_partial_download_is_dispatched_once_after_it_settles(self):
+        from src.component.folder_watcher import PaperFolderWatcher, PollingWatcher
+        drop_dir = os.path.join(self.data_folder, 'drop')
+        os.makedirs(drop_dir)
+        register = self.RecordingRegister()
+        watcher = PaperFolderWatcher([drop_dir], register=register, settle_seconds=2.0, batch_window=0.0, use_inotify=False)
+        polling = PollingWatcher(watcher.drop_dirs)
+        file_path = os.path.join(watcher.drop_dirs[0], '2101.00001.pdf')
+        with open(file_path, 'wb') as fp:
+            fp.write(b'%PDF-partial')
+        watcher.Track(polling.Scan(), 0.0)
+        self.assertEqual(watcher.Step(1.0), [])
+        with open(file_path, 'ab') as fp:
+            fp.write(b' rest of the download')
+        watcher.Track(polling.Scan(), 1.5)
+        self.assertEqual(watcher.Step(3.0), [])
+        self.assertEqual(register.calls, [])
+        self.assertEqual(len(watcher.Step(3.5)), 1)
+        self.assertEqual(register.calls, [[file_path]])
+        watcher.Track(polling.Scan(), 10.0)
+        self.assertEqual(watcher.Step(20.0), [])
+        self.assertEqual(register.calls, [[file_path]])
+
+
+class PaperRowStoreTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.sqliteconnector import SqliteHelper
+        PaperProcessor.CreateOrIgnorePaperTable()
+        self.paper_ids = [f"p{index:04d}" for index in range(2000)]
+        SqliteHelper('paper_db').ExecuteTransaction([(CitationGraphIndexTests.PAPER_SQL, [{'paperId': paper_id} for paper_id in self.paper_ids])])
+
+    def test_large_lookups_are_chunked_and_cached(self):
+        from src.utils.paper_rows import PaperRowStore
+        from src.utils.sqliteconnector import SqliteHelper
+        store = PaperRowStore('paper_db', ['paperId', 'title'])
+        wanted = self.paper_ids + ['missing-1', 'missing-2']
+        with mock.patch.object(SqliteHelper, 'ExecuteDictSelect', autospec=True, side_effect=SqliteHelper.ExecuteDictSelect) as select:
+            rows = store.Load(wanted)
+            self.assertEqual(select.call_count, 3)
+            self.assertTrue(all(len(call.args[2]) <= PaperRowStore.MAX_VARIABLES for call in select.call_args_list))
+            self.assertEqual(list(rows), self.paper_ids)
+            again = store.Load(list(reversed(wanted)))
+            self.assertIsNone(store.Get('missing-1'))
+            self.assertEqual(select.call_count, 3)
+        self.assertIs(again['p0000'], rows['p0000'])
+        self.assertEqual(list(again), list(reversed(self.paper_ids)))
+
+
+class CitationNeighbourhoodTests(TemporaryDataFolder, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        from src.utils.dao import PaperProcessor
+        from src.utils.sqliteconnector import SqliteHelper
+        from src.utils.citation_graph import CitationGraphIndex
+        self.addCleanup(CitationGraphIndex.indexes.clear)
+        CitationGraphIndex.indexes.clear()
+        PaperProcessor.CreateOrIgnorePaperTable()
+        # B, C and the outside papers x1..x3 cite A; y cites B
+        SqliteHelper('paper_db').ExecuteTransaction([
+            (CitationGraphIndexTests.PAPER_SQL, [{'paperId': paper_id} for paper_id in ('A', 'B', 'C')]),
+            (CitationGraphIndexTests.LINK_SQL, [{'source_id': 'A', 'citation_id': citation_id} for citation_id in ('x1', 'x2', 'B', 'x3', 'C')]
+             + [{'source_id': 'B', 'citation_id': 'y'}]),
+        ])
+
+    def Neighbourhood(self, **kwargs):
+        from src.utils.citation_graph import CitationGraphIndex
+        arguments = dict(depth=1, direction='citations', max_fanout=50, max_nodes=500, library_only=False)
+        arguments.update(kwargs)
+        return CitationGraphIndex.ForService().Neighbourhood('A', **arguments)
+
+    def test_fanout_keeps_library_papers_first(self):
+        hops, edges, truncated = self.Neighbourhood(max_fanout=2)
+        self.assertEqual(hops, {'A': 0, 'B': 1, 'C': 1})
+        self.assertEqual(edges, [('A', 'B'), ('A', 'C')])
+        self.assertTrue(truncated)
+
+    def test_node_cap_truncates_the_walk(self):
+        hops, _, truncated = self.Neighbourhood(depth=2, max_nodes=4)
+        self.assertEqual(len(hops), 4)
+        self.assertTrue(truncated)
+        hops, _, truncated = self.Neighbourhood(depth=2)
+        self.assertEqual(hops['y'], 2)
+        self.assertFalse(truncated)
+
+    def test_library_only_drops_outside_papers(self):
+        hops, edges, truncated = self.Neighbourhood(depth=2, library_only=True)
+        self.assertEqual(hops, {'A': 0, 'B': 1, 'C': 1})
+        self.assertEqual(edges, [('A', 'B'), ('A', 'C')])
+        self.assertFalse(truncated)
+
+    def test_view_bounds_and_shape(self):
+        from django.test import Client
+        def post(body):
+            return Client().post('/api/paper/graph/neighbourhood', json.dumps(body), content_type='application/json')
+        self.assertEqual(post({'paperId': 'A', 'direction': 'sideways'}).status_code, 422)
+        self.assertEqual(post({'paperId': 'A', 'depth': 'two'}).status_code, 422)
+        data = post({'paperId': 'A', 'depth': 99, 'fanout': 2}).json()['data']
+        self.assertTrue(data['truncated'])
+        self.assertEqual({node['paperId']: (node['depth'], node['inLibrary']) for node in data['nodes']},
+                         {'A': (0, True), 'B': (1, True), 'C': (1, True), 'y': (2, False)})
+        self.assertEqual(post({'paperId': 'unknown'}).status_code, 204)
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        from src.utils.metrics import Metrics
+        patcher = mock.patch.multiple(Metrics, enabled=True, counters=dict(), histograms=dict())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render_places_observations_in_cumulative_buckets(self):
+        from src.utils.metrics import Metrics
+        Metrics.Observe('test_operation_seconds', 0.003, operation='read')
+        # a bucket bound is inclusive
+        Metrics.Observe('test_operation_seconds', 0.01, operation='read')
+        Metrics.Observe('test_operation_seconds', 120.0, operation='read')
+        lines = Metrics.Render().splitlines()
+        buckets = {line.split('le="')[1].split('"')[0]: int(line.rsplit(' ', 1)[1]) for line in lines if line.startswith('papercollector_test_operation_seconds_bucket')}
+        self.assertEqual(len(buckets), len(Metrics.BUCKETS) + 1)
+        self.assertEqual((buckets['0.0025'], buckets['0.005'], buckets['0.01'], buckets['60.0'], buckets['+Inf']), (0, 1, 2, 2, 3))
+        self.assertIn('papercollector_test_operation_seconds_bucket{operation="read",le="0.005"} 1', lines)
+        self.assertIn('papercollector_test_operation_seconds_sum{operation="read"} 120.013', lines)
+        self.assertIn('papercollector_test_operation_seconds_count{operation="read"} 3', lines)
+        self.assertIn('# TYPE papercollector_test_operation_seconds histogram', lines)
+
+    def test_timed_keeps_the_function_identity(self):
+        from src.utils.metrics import Metrics
+        from src.utils.content_index import PdfContentIndex
+        hash_file = PdfContentIndex.HashFile
+        self.assertEqual(hash_file.__qualname__, 'PdfContentIndex.HashFile')
+        self.assertEqual(hash_file.__module__, 'src.utils.content_index')
+        self.assertTrue(callable(hash_file.__wrapped__))
@@ -1,38 +1,61 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-
-import datetime
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 
 import os
-import sys
 import json 
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-import traceback
-from src.component.search_engine import SearchEngine
-from src.utils.dao import PaperProcessor
+from asgiref.sync import sync_to_async
+from src.component.search_engine import AsyncSearchEngine
+from src.component.job_worker import JobWorker, JobWorkerPool
+from src.utils.job_queue import JobQueue
+from src.utils.metrics import Metrics
 import env as paper_env
 
 # Create your views here.
 
-search_engine = SearchEngine()
+# cheap to build: the provider client and its cache are created on the first lookup
+search_engine = AsyncSearchEngine()
 
 @csrf_exempt
-def FindPaperByPaperIds(request):
+async def FindPaperByPaperIds(request):
     if request.method == "POST":
         data = json.loads(request.body)
         paper_ids = data.get('paperIds', None)
         if not paper_ids:
             return JsonResponse({"action":"invalid input"}, status=422)
         target_folder = paper_env.ASSET_FOLDER
-        res = search_engine.SearchWithPaperIds(paper_ids)
+        if data.get('stream', False) or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            # WSGI servers only stream sync iterators; Django buffers an async one completely
+            stream = StreamPaperIdsResult(paper_ids) if isinstance(request, ASGIRequest) else PaperIdsResultLines(paper_ids)
+            return StreamingHttpResponse(stream, content_type='application/x-ndjson')
+        res = await search_engine.SearchWithPaperIds(paper_ids)
         return JsonResponse({"action":"executed", "result":res})
     else:
         return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
 
+async def StreamPaperIdsResult(paper_ids):
+    success_count = 0
+    async for status, paper_id, paper_data in search_engine.IterSearchWithPaperIds(paper_ids):
+        if status == 'success':
+            success_count += 1
+            yield json.dumps({"paperId":paper_id, "data":paper_data}) + "\n"
+        else:
+            yield json.dumps({"action":"executed", "success":success_count, "failed":paper_id}) + "\n"
+
+def PaperIdsResultLines(paper_ids):
+    success_count = 0
+    for status, paper_id, paper_data in search_engine.IterSearchWithPaperIdsBlocking(paper_ids):
+        if status == 'success':
+            success_count += 1
+            yield json.dumps({"paperId":paper_id, "data":paper_data}) + "\n"
+        else:
+            yield json.dumps({"action":"executed", "success":success_count, "failed":paper_id}) + "\n"
+
 @csrf_exempt
-def FindPaperByDoi(request):
+async def FindPaperByDoi(request):
     if request.method == "POST":
         data = json.loads(request.body)
         doi = data.get('doi', None)
@@ -40,14 +63,14 @@ def FindPaperByDoi(request):
         if not paper_path or not doi:
             return JsonResponse({"action":"invalid input"}, status=422)
         target_folder = target_folder = paper_env.ASSET_FOLDER
-        res = search_engine.SearchWithDoi(paper_path, target_folder, doi)
+        res = await search_engine.SearchWithDoi(paper_path, doi)
         if not res:
             return JsonResponse({"action":"not found"}, status=204)
         return JsonResponse({"action":"found", "data":res}, status=200)
     
 
 @csrf_exempt
-def FindPaperByTitle(request):
+async def FindPaperByTitle(request):
     if request.method == "POST":
         data = json.loads(request.body)
         title = data.get('title', None)
@@ -55,13 +78,89 @@ def FindPaperByTitle(request):
         if not paper_path or not title:
             return JsonResponse({"action":"invalid input"}, status=422)
         target_folder = target_folder = paper_env.ASSET_FOLDER
-        res = search_engine.SearchWithTitle(paper_path, target_folder, title)
+        res = await search_engine.SearchWithTitle(paper_path, title)
         if not res:
             return JsonResponse({"action":"not found"}, status=204)
         return JsonResponse({"action":"found", "data":res}, status=200)
 
 @csrf_exempt
-def FindPaperByArxivId(request):
+async def FindPaperInLibrary(request):
+    if request.method == "POST":
+        data = json.loads(request.body)
+        query = data.get('query', None)
+        if not query:
+            return JsonResponse({"action":"invalid input"}, status=422)
+        try:
+            page = max(int(data.get('page', 1)), 1)
+            page_size = min(max(int(data.get('page_size', 20)), 1), 100)
+        except (TypeError, ValueError):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        res = await search_engine.SearchInLibrary(query, page, page_size)
+        return JsonResponse({"action":"found", "data":res}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
+
+@csrf_exempt
+async def FindCentralPapers(request):
+    if request.method == "POST":
+        data = json.loads(request.body or b"{}")
+        try:
+            limit = min(max(int(data.get('limit', 20)), 1), 100)
+            offset = max(int(data.get('offset', 0)), 0)
+        except (TypeError, ValueError):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        res = await search_engine.CentralPapers(limit, offset)
+        return JsonResponse({"action":"found", "data":res}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
+
+@csrf_exempt
+async def FindSimilarPapers(request):
+    if request.method == "POST":
+        data = json.loads(request.body)
+        paper_id = data.get('paperId', None)
+        if not paper_id:
+            return JsonResponse({"action":"invalid input"}, status=422)
+        try:
+            limit = min(max(int(data.get('limit', 20)), 1), 100)
+        except (TypeError, ValueError):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        res = await search_engine.SimilarPapers(paper_id, limit)
+        if not res:
+            return JsonResponse({"action":"not found"}, status=204)
+        return JsonResponse({"action":"found", "data":res}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
+
+@csrf_exempt
+async def FindPaperNeighbourhood(request):
+    if request.method == "POST":
+        data = json.loads(request.body)
+        paper_id = data.get('paperId', None)
+        direction = data.get('direction', 'both')
+        if not paper_id or direction not in ('references', 'citations', 'both'):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        try:
+            depth = min(max(int(data.get('depth', 1)), 1), 4)
+            fanout = min(max(int(data.get('fanout', 50)), 1), 200)
+            max_nodes = min(max(int(data.get('max_nodes', 500)), 1), 2000)
+        except (TypeError, ValueError):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        res = await search_engine.PaperNeighbourhood(paper_id, depth, direction, fanout, max_nodes, bool(data.get('library_only', False)))
+        if not res:
+            return JsonResponse({"action":"not found"}, status=204)
+        return JsonResponse({"action":"found", "data":res}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
+
+async def ExportMetrics(request):
+    if request.method == "GET":
+        return HttpResponse(Metrics.Render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
+
+@csrf_exempt
+async def FindPaperByArxivId(request):
     if request.method == "POST":
         data = json.loads(request.body)
         paper_id = data.get('paper_id', None)
@@ -69,28 +168,89 @@ def FindPaperByArxivId(request):
         if not paper_path or not paper_id:
             return JsonResponse({"action":"invalid input"}, status=422)
         target_folder = target_folder = paper_env.ASSET_FOLDER
-        res = search_engine.SearchWithPaperId(paper_path, target_folder, paper_id)
+        res = await search_engine.SearchWithPaperId(paper_path, paper_id)
         if not res:
             return JsonResponse({"action":"not found"}, status=204)
         return JsonResponse({"action":"found", "data":res}, status=200)
 
-@csrf_exempt
-def AcceptChange(paper_infos, target_dir = None):
-    res = {"action":"Shift", "data":{'success':{}, 'failed':{}}}
-    if target_dir is None:
-        target_dir = paper_env.ASSET_FOLDER
-    for paper_path in paper_infos:
-        try:
-            paper_info = paper_infos[paper_path]
-            publication_date = datetime.datetime.strptime(paper_info['publicationDate'], "%Y-%m-%d").strftime('%Y%m%d') if paper_info['publicationDate'] else "Unknown"
-            paper_title = paper_info['title'].replace("?", "").replace(":", "")
-            folder_name = os.path.join(target_dir, f"{publication_date} {paper_title}")
-            processor = PaperProcessor(paper_info)
-            os.makedirs(folder_name, exist_ok=True)
-            processor.CreateNewPaperFolder(paper_path, folder_name)
-            res['data']['failed'][paper_path] = folder_name
-        except Exception:
-            res['data']['failed'][paper_path] = traceback.format_exc()
+def JobQueueService(start_workers:bool=False):
+    # only a submitted job spawns the worker processes; reads never do, and `papercollector worker` can run them instead
+    if start_workers:
+        JobWorkerPool.ForService('job_db')
+    return JobQueue('job_db')
+
+def JobPath(path):
+    """The real path of `path` when it lies in ASSET_FOLDER or one of settings.JOB_ALLOWED_DIRS, otherwise None."""
+    if not isinstance(path, str) or not path:
+        return None
+    real_path = os.path.realpath(path)
+    for folder in [paper_env.ASSET_FOLDER, *settings.JOB_ALLOWED_DIRS]:
+        root = os.path.realpath(folder)
+        if os.path.commonpath([root, real_path]) == root:
+            return real_path
+    return None
 
+async def Authenticated(request) -> bool:
+    user = await request.auser()
+    return user.is_authenticated
+
+# jobs move and delete library folders: unlike the lookup views they need a logged in user and a CSRF token
+async def Jobs(request):
+    if not await Authenticated(request):
+        return JsonResponse({"action":"forbidden"}, status=403)
+    if request.method == "POST":
+        data = json.loads(request.body)
+        kind = data.get('type', None)
+        params = data.get('params', None) or dict()
+        if kind not in JobWorker.REQUIRED or not isinstance(params, dict) or set(params).difference(JobWorker.PARAMS[kind]):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        if kind == 'register':
+            params.setdefault('target_dir', paper_env.ASSET_FOLDER)
+        for key in JobWorker.PATH_PARAMS:
+            if key in params:
+                params[key] = JobPath(params[key])
+                if params[key] is None:
+                    return JsonResponse({"action":"invalid input"}, status=422)
+        if not os.path.isdir(params.get(JobWorker.REQUIRED[kind]) or ''):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        queue = await sync_to_async(JobQueueService, thread_sensitive=False)(start_workers=True)
+        job = await sync_to_async(queue.Submit, thread_sensitive=False)(kind, params)
+        return JsonResponse({"action":"queued", "data":job}, status=202)
+    elif request.method == "GET":
+        status = request.GET.get('status', None)
+        try:
+            limit = min(max(int(request.GET.get('limit', 50)), 1), 100)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except (TypeError, ValueError):
+            return JsonResponse({"action":"invalid input"}, status=422)
+        queue = await sync_to_async(JobQueueService, thread_sensitive=False)()
+        jobs = await sync_to_async(queue.List, thread_sensitive=False)(status, limit, offset)
+        return JsonResponse({"action":"found", "data":jobs}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
 
+async def JobStatus(request, job_id):
+    if not await Authenticated(request):
+        return JsonResponse({"action":"forbidden"}, status=403)
+    if request.method == "GET":
+        queue = await sync_to_async(JobQueueService, thread_sensitive=False)()
+        job = await sync_to_async(queue.Get, thread_sensitive=False)(job_id)
+        if not job:
+            return JsonResponse({"action":"not found"}, status=404)
+        return JsonResponse({"action":"found", "data":job}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
 
+async def CancelJob(request, job_id):
+    if not await Authenticated(request):
+        return JsonResponse({"action":"forbidden"}, status=403)
+    if request.method == "POST":
+        queue = await sync_to_async(JobQueueService, thread_sensitive=False)()
+        job = await sync_to_async(queue.Cancel, thread_sensitive=False)(job_id)
+        if not job:
+            return JsonResponse({"action":"not found"}, status=404)
+        if job['status'] == 'running':
+            return JsonResponse({"action":"cancelling", "data":job}, status=202)
+        return JsonResponse({"action":job['status'], "data":job}, status=200)
+    else:
+        return JsonResponse({"message":f"Invalid method {request.method}"}, status=502)
@@ -10,11 +10,19 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The repository root holds the `src` package and `env` shared with the CLI;
+# settings load before any app module, so the path is set up once here.
+REPO_DIR = BASE_DIR.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -27,6 +35,17 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# `X-Trace: 1` requests write a JSON file per request, so tracing is a
+# development aid: off unless DEBUG is on, and only the most recent
+# REQUEST_TRACE_KEEP traces of at most REQUEST_TRACE_MAX_SPANS spans are kept.
+REQUEST_TRACING = DEBUG
+REQUEST_TRACE_KEEP = 100
+REQUEST_TRACE_MAX_SPANS = 2000
+
+# Folders besides env.ASSET_FOLDER that jobs submitted through the API may
+# read or delete, e.g. a drop folder: PAPER_JOB_DIRS, separated like PATH.
+JOB_ALLOWED_DIRS = [folder for folder in os.environ.get('PAPER_JOB_DIRS', '').split(os.pathsep) if folder]
+
 
 # Application definition
 
@@ -42,6 +61,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -25,4 +25,12 @@ urlpatterns = [
     path("api/paper/search/doi", api.views.FindPaperByDoi),
     path("api/paper/search/title", api.views.FindPaperByTitle),
     path("api/paper/search/arxiv_id", api.views.FindPaperByArxivId),
+    path("api/paper/search/library", api.views.FindPaperInLibrary),
+    path("api/paper/graph/central", api.views.FindCentralPapers),
+    path("api/paper/graph/similar", api.views.FindSimilarPapers),
+    path("api/paper/graph/neighbourhood", api.views.FindPaperNeighbourhood),
+    path("api/jobs", api.views.Jobs),
+    path("api/jobs/<str:job_id>", api.views.JobStatus),
+    path("api/jobs/<str:job_id>/cancel", api.views.CancelJob),
+    path("metrics", api.views.ExportMetrics),
 ]